@@ -0,0 +1,115 @@
+# ai_budget.py
+# 每局 AI 預算：記錄 LLM 呼叫次數、估計 token 數與等待 AI 的時間 (含速率限制排隊)。
+# 用量接近上限時依序降級：旁白只用快取 → 發言縮短 → 投票改用規則、略過 AI 遺言 → 夜晚行動與發言不再呼叫 LLM。
+
+import os
+import time
+import bisect
+import logging
+from collections import Counter
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from prompt_templates import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每局上限 (0 = 不限制)
+GAME_AI_CALL_BUDGET = int(os.getenv('GAME_AI_CALL_BUDGET', '250'))
+GAME_AI_TOKEN_BUDGET = int(os.getenv('GAME_AI_TOKEN_BUDGET', '600000'))
+GAME_AI_TIME_BUDGET = float(os.getenv('GAME_AI_TIME_BUDGET', '1800')) # 秒 (至少有一個 AI 呼叫進行中的實際時間)
+
+# 各項 AI 功能在用量達到預算多少比例時降級
+DEGRADE_AT: Dict[str, float] = {
+    "narrative": 0.5,    # 旁白只用快取，沒有快取就只顯示系統訊息
+    "full_speech": 0.7,  # 發言縮短為 30-50 字
+    "reask": 0.7,        # 不合格的回應不再重新生成，直接刪掉有問題的句子
+    "vote": 0.85,        # 投票改用規則/信念
+    "last_words": 0.85,  # 略過 AI 遺言
+    "action": 1.0,       # 夜晚行動改用規則
+    "speech": 1.0,       # 發言改用固定台詞
+}
+DEGRADE_LABELS = {
+    "narrative": "旁白改用快取",
+    "full_speech": "縮短發言",
+    "reask": "不重新生成",
+    "vote": "規則投票",
+    "last_words": "略過遺言",
+    "action": "規則夜晚行動",
+    "speech": "固定台詞",
+}
+
+DEGRADED_SPEECH = "我這輪沒有新的資訊，先聽大家怎麼說，投票時再表態。"
+
+
+class AIBudget:
+    """
+    本局的 AI 用量。AIManager.generate_response 每次呼叫 (含失敗與重試) 都會 record 一次。
+    guild 為本局所在的伺服器，速率限制以它公平排隊。
+    時間預算以 wait_seconds 計算：各呼叫期間的聯集 (實際等待 AI 的時間)，同時進行的呼叫只算一次；
+    llm_seconds 則是各呼叫耗時的總和，只作為參考。
+    """
+    def __init__(self, calls: Optional[int] = None, tokens: Optional[int] = None, seconds: Optional[float] = None,
+                 guild: Optional[Hashable] = None):
+        self.guild = guild
+        self.call_limit = GAME_AI_CALL_BUDGET if calls is None else calls
+        self.token_limit = GAME_AI_TOKEN_BUDGET if tokens is None else tokens
+        self.time_limit = GAME_AI_TIME_BUDGET if seconds is None else seconds
+        self.calls = 0
+        self.tokens = 0
+        self.llm_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._busy: List[Tuple[float, float]] = [] # 已合併、依開始時間排序的呼叫期間 (monotonic)
+        self.started = time.monotonic()
+        self.degraded: Counter = Counter() # 功能 -> 降級次數
+
+    def record(self, prompt: str, response: str, elapsed: float, ended: Optional[float] = None):
+        """記錄一次呼叫；ended 為結束時間 (monotonic，預設為現在)"""
+        self.calls += 1
+        self.tokens += estimate_tokens(prompt) + estimate_tokens(response or "")
+        self.llm_seconds += elapsed
+        ended = time.monotonic() if ended is None else ended
+        self._add_busy(ended - elapsed, ended)
+
+    def _add_busy(self, start: float, end: float):
+        """把 [start, end] 併入呼叫期間的聯集，並更新 wait_seconds"""
+        i = bisect.bisect_left(self._busy, (start, start))
+        if i and self._busy[i - 1][1] >= start:
+            i -= 1
+        j = i
+        while j < len(self._busy) and self._busy[j][0] <= end:
+            start, end = min(start, self._busy[j][0]), max(end, self._busy[j][1])
+            self.wait_seconds -= self._busy[j][1] - self._busy[j][0]
+            j += 1
+        self._busy[i:j] = [(start, end)]
+        self.wait_seconds += end - start
+
+    @property
+    def pressure(self) -> float:
+        """用量占預算的最大比例 (0 = 未使用，>= 1 = 用完)"""
+        ratios = [used / limit for used, limit in (
+            (self.calls, self.call_limit), (self.tokens, self.token_limit), (self.wait_seconds, self.time_limit)) if limit > 0]
+        return max(ratios, default=0.0)
+
+    def degraded_for(self, feature: str) -> bool:
+        return self.pressure >= DEGRADE_AT.get(feature, 1.0)
+
+    def allow(self, feature: str) -> bool:
+        """此功能是否仍可呼叫 LLM；否則記錄一次降級"""
+        if not self.degraded_for(feature):
+            return True
+        if not self.degraded[feature]:
+            logger.info(f"AI budget at {self.pressure:.0%}: degrading {feature}")
+        self.degraded[feature] += 1
+        return False
+
+    def summary(self) -> str:
+        """遊戲結束時公佈的用量摘要"""
+        elapsed = time.monotonic() - self.started
+        parts = [f"LLM 呼叫 {self.calls}" + (f"/{self.call_limit}" if self.call_limit > 0 else "") + " 次",
+                 f"約 {self.tokens:,}" + (f"/{self.token_limit:,}" if self.token_limit > 0 else "") + " tokens",
+                 f"等待 AI {self.wait_seconds / 60:.1f}" + (f"/{self.time_limit / 60:.0f}" if self.time_limit > 0 else "") + " 分鐘",
+                 f"全局 {elapsed / 60:.1f} 分鐘"]
+        text = "📊 **本局 AI 用量**：" + "、".join(parts)
+        if self.degraded:
+            text += "\n降級：" + "、".join(f"{DEGRADE_LABELS.get(f, f)} x{n}" for f, n in self.degraded.items())
+        return text
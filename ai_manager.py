@@ -1,5 +1,6 @@
 import os
 import inspect
+import sqlite3
 import logging
 import tempfile
 from dotenv import load_dotenv
@@ -8,10 +9,18 @@ import json
 import re
 import aiohttp
 import time
-from collections import OrderedDict
-from typing import Optional, List, Dict, Any, Union, Tuple, Callable
-
-from ai_strategies import ROLE_STRATEGIES
+import random
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, List, Dict, Any, Union, Tuple, Callable, Iterable, Awaitable, Mapping, Deque, Hashable, AsyncIterator
+
+from effort_routing import MODEL_CASCADE, CascadeStats, EffortRouter, Route, check_draft, check_speech_draft
+from prompt_templates import AssembledPrompt, PromptTemplate, assemble, estimate_tokens, phase_for_context, prompt_library
+import metrics
+from tracing import tracer
+from narrative_bank import WARMUP_EVENTS, normalize_context, render
+from response_filters import REASK_HINTS, ResponseFilter
 
 logger = logging.getLogger(__name__)
 
@@ -21,17 +30,152 @@ MAX_RESPONSE_LENGTH = 2000
 load_dotenv()
 
 DIGIT_PATTERN = re.compile(r'\d+')
-DAY_PATTERN = re.compile(r'第\s*(\d+)\s*天')
 
 CALLBACK_TIMEOUT = aiohttp.ClientTimeout(total=120)
 
+# HTTP 連線池 (Ollama / Gemini API / LLM 閘道共用同一個 session)
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', '32'))                  # 全部主機的連線上限
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '8')) # 單一主機的連線上限 (0 = 不限)
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', '60'))                  # 閒置連線保留秒數
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', '300'))                       # DNS 快取秒數
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))      # 建立連線的逾時秒數
+
+# Ollama 模型常駐時間 (每個請求都會帶上，避免對局中途被卸載)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+# 閒置超過此秒數後，開局前重新預熱模型 (Ollama 可能已卸載)
+MODEL_REWARM_IDLE = float(os.getenv('MODEL_REWARM_IDLE', '600'))
+MODEL_WARMUP_TIMEOUT = aiohttp.ClientTimeout(total=180) # 冷啟動載入可能很久
+
+# 各呼叫類型的總逾時 (秒)：投票/行動要快，發言與遺言可以等久一點。可用 LLM_TIMEOUTS="action=20,speech=60" 覆寫
+CALL_TIMEOUTS: Dict[str, float] = {
+    "action": 30.0,
+    "speech": 90.0,
+    "last_words": 90.0,
+    "narrative": 30.0,
+    "role_template": 60.0,
+    "other": 120.0,
+}
+for _item in os.getenv('LLM_TIMEOUTS', '').split(','):
+    _name, _, _value = _item.partition('=')
+    try:
+        CALL_TIMEOUTS[_name.strip()] = float(_value)
+    except ValueError:
+        pass
+
+# 各供應商的提示詞 token 預算 (估計值，0 = 不限制)。Ollama 的 context window 較小，超出時會默默截掉提示詞開頭，
+# 因此先依區段優先順序刪減。可用 PROMPT_BUDGETS="ollama=2048,gateway=3072" 覆寫
+PROMPT_BUDGETS: Dict[str, int] = {
+    "ollama": 3072,
+    "gemini-api": 0,
+    "gemini-cli": 0,
+    "gemini": 0,
+    "gateway": 0,
+}
+for _item in os.getenv('PROMPT_BUDGETS', '').split(','):
+    _name, _, _value = _item.partition('=')
+    try:
+        PROMPT_BUDGETS[_name.strip()] = int(_value)
+    except ValueError:
+        pass
+
 ALLOWED_URL_SCHEMES = ('http://', 'https://')
 
 CACHE_FILE = "ai_cache.json"
+# 追加式日誌：新板子只追加一行 JSON，累積到門檻後於背景壓縮回快照檔
+CACHE_JOURNAL_SUFFIX = ".journal"
+CACHE_COMPACT_THRESHOLD = 50
+
+# 旁白語料庫：每個模板保留數個變體隨機選用，並持久化到磁碟
+NARRATIVE_CACHE_FILE = "narrative_cache.json"
+NARRATIVE_VARIANTS = 4
+# 預熱工作：LLM 閒置時每隔多久補一個旁白變體 (秒)
+NARRATIVE_WARMUP_INTERVAL = 30.0
+
+# 各供應商的速率上限 (每分鐘請求數, 每分鐘 token 數)，0 = 不限。實際速率由 AIMD 在上限內調整：
+# 成功時逐步加速，429 時減半並遵守 Retry-After。可用 RATE_LIMITS="gemini-api=30:1000000,ollama=60:0" 覆寫
+RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "gemini-api": (15.0, 250000),
+    "gemini-cli": (15.0, 250000),
+    "gemini": (15.0, 250000),
+    "ollama": (0.0, 0),
+    "gateway": (0.0, 0),
+}
+for _item in os.getenv('RATE_LIMITS', '').split(','):
+    _name, _, _value = _item.partition('=')
+    _rpm, _, _tpm = _value.partition(':')
+    try:
+        RATE_LIMITS[_name.strip()] = (float(_rpm), int(_tpm or 0))
+    except ValueError:
+        pass
+
+# 速率限制狀態 (目前速率、剩餘令牌、Retry-After 暫停) 的保存檔，重啟後沿用 (空白 = 不保存)
+RATE_LIMIT_STATE = os.getenv('RATE_LIMIT_STATE', '')
+
+# 公平排隊：每個伺服器 (guild) 各自排隊，以 deficit round-robin 依估計 token 數輪流放行，
+# 避免大桌的投票回合把小桌的請求全部擠到後面
+RATE_LIMIT_QUANTUM = int(os.getenv('RATE_LIMIT_QUANTUM', '2000'))       # 每輪每個伺服器累積的 token 額度
+RATE_LIMIT_MAX_SHARE = float(os.getenv('RATE_LIMIT_MAX_SHARE', '0.5'))  # 其他伺服器排隊時，單一伺服器最近一分鐘最多取得的請求比例
+RATE_LIMIT_SHARE_WINDOW = 60.0
+# 預估排隊超過此秒數時，先透過 retry_callback 告知玩家排隊位置與預估時間
+QUEUE_NOTICE_SECONDS = float(os.getenv('QUEUE_NOTICE_SECONDS', '8'))
+
+# 多程序部署時共用速率限制的 SQLite 檔 (空白 = 每個程序各自限流)
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', '')
+
+# 429 回應中的建議等待時間 (Gemini: "retryDelay": "17s" 或 "Please retry in 17.5s")
+RETRY_DELAY_PATTERN = re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"|retry in (\d+(?:\.\d+)?)s', re.IGNORECASE)
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# 共用 LLM 閘道 (llm_gateway.py)：設定後 AIManager 進入精簡用戶端模式，
+# 供應商連線、速率限制、快取與請求合併都由閘道負責。支援 http://host:port 或 unix:///path/to.sock
+LLM_GATEWAY_URL = os.getenv('LLM_GATEWAY_URL', '')
+UNIX_SCHEME = "unix://"
+
+# 有信念摘要時，行動決策只保留最近幾行發言紀錄
+BELIEF_HISTORY_LINES = 6
+
+# 發言字數要求 (預算吃緊時改用較短的版本)
+SPEECH_LENGTH = "80-120"
+BRIEF_SPEECH_LENGTH = "30-50"
 
 class RateLimitError(Exception):
     """Exception raised when API rate limit is exceeded."""
-    pass
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after # 供應商要求的等待秒數 (Retry-After / retryDelay)，未提供時為 None
+
+def _parse_duration(value: str) -> Optional[float]:
+    """解析秒數或 "1m30s" / "6.5s" / "250ms" 形式的時間長度"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts or "".join(n + u for n, u in parts) != value:
+        return None
+    return sum(float(n) * DURATION_UNITS[u] for n, u in parts)
+
+def parse_retry_after(headers: Optional[Mapping[str, str]] = None, body: str = "") -> Optional[float]:
+    """
+    從 429 回應取得建議等待秒數：優先使用 Retry-After 標頭 (秒數或 HTTP 日期)，
+    其次是 Gemini 錯誤內容中的 "retryDelay": "17s" / "Please retry in 17.5s"。
+    """
+    value = headers.get("Retry-After") if isinstance(headers, Mapping) else None
+    if value:
+        seconds = _parse_duration(value)
+        if seconds is None:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return max(seconds, 0.0)
+    match = RETRY_DELAY_PATTERN.search(body or "")
+    if match:
+        return float(match.group(1) or match.group(2))
+    return None
 
 class RateLimiter:
     """
@@ -43,8 +187,22 @@ class RateLimiter:
         self.tokens = capacity
         self.last_update = time.monotonic()
         self.lock = asyncio.Lock()
+        self.waiting = 0 # 等待中的請求數 (queue depth)
+
+    async def acquire(self, cost: int = 0, guild: Optional[Hashable] = None):
+        """
+        取得一個請求令牌。cost 為這次請求的估計 token 數、guild 為發出請求的伺服器
+        (只有 AdaptiveRateLimiter 使用：TPM 追蹤與各伺服器公平排隊)。
+        """
+        self.waiting += 1
+        try:
+            await self._acquire(cost, guild)
+        finally:
+            self.waiting -= 1
+            metrics.rate_limiter_queue.set(self.waiting)
 
-    async def acquire(self):
+    async def _acquire(self, cost: int = 0, guild: Optional[Hashable] = None):
+        metrics.rate_limiter_queue.set(self.waiting)
         async with self.lock:
             now = time.monotonic()
             elapsed = now - self.last_update
@@ -68,17 +226,385 @@ class RateLimiter:
             self.tokens = 0
             self.last_update = time.monotonic()
 
+_NOT_VISITING = object()
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    AIMD 速率限制：rate 為上限，每次成功的呼叫把目前速率加回 increase (加法增加)，
+    遇到 429 乘上 decrease (乘法減少) 並暫停到 Retry-After 指定的時間。
+    另以第二個桶追蹤每分鐘 token 數 (TPM)，提示詞在取得令牌時扣除、回應在成功後補扣。
+    請求依 guild 分別排隊，由單一派發工作以 deficit round-robin 輪流放行：每輪每個伺服器累積 quantum 個 token 的額度，
+    額度足以支付隊首請求的估計 token 數才放行；其他伺服器也在排隊時，最近一分鐘取得超過 max_share 比例的伺服器會被跳過。
+    state_path 非空時狀態會寫入該 JSON 檔 (以 key 區分)，重啟後沿用，崩潰重啟也不會瞬間爆量。
+    """
+    def __init__(self, rate: float, capacity: float = 1.0, tokens_per_minute: int = 0, min_rate: Optional[float] = None,
+                 increase: Optional[float] = None, decrease: float = 0.5, state_path: str = "", key: str = "default",
+                 quantum: int = RATE_LIMIT_QUANTUM, max_share: float = RATE_LIMIT_MAX_SHARE):
+        super().__init__(rate, capacity)
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.increase = increase if increase is not None else rate / 20
+        self.decrease = decrease
+        self.tokens_per_minute = tokens_per_minute
+        self.token_budget = float(tokens_per_minute)
+        self.token_update = time.monotonic()
+        self.blocked_until = 0.0 # monotonic；Retry-After 或配額用盡時暫停到此時間
+        self.key = key
+        self.state_path = state_path
+        self.stats: Dict[str, int] = {"ok": 0, "rate_limited": 0}
+        self.quantum = quantum
+        self.max_share = max_share
+        self._queues: "OrderedDict[Optional[Hashable], Deque[Tuple[asyncio.Future, int]]]" = OrderedDict()
+        self._deficit: Dict[Optional[Hashable], float] = {}
+        self._visiting: Any = _NOT_VISITING # 本輪正在服務的伺服器 (已加過 quantum)；guild 可以是 None，因此用哨兵值
+        self._grants: Deque[Tuple[float, Optional[Hashable]]] = deque() # 最近一分鐘的放行紀錄
+        self._grant_counts: Counter = Counter()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        if state_path:
+            self._load_state()
+        metrics.rate_limiter_rpm.set(self.rate * 60, key=key)
+
+    @property
+    def requests_per_minute(self) -> float:
+        return self.rate * 60
+
+    def _take_request(self) -> float:
+        """扣除一個請求令牌，回傳需等待的秒數"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+        self.last_update = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def _take_tokens(self, cost: float) -> float:
+        """從 TPM 桶扣除 cost 個 token，回傳需等待的秒數 (未設定 TPM 時為 0)"""
+        if not self.tokens_per_minute or cost <= 0:
+            return 0.0
+        now = time.monotonic()
+        per_second = self.tokens_per_minute / 60.0
+        self.token_budget = min(self.tokens_per_minute, self.token_budget + (now - self.token_update) * per_second)
+        self.token_update = now
+        # 單一請求超過整個 TPM 時只等一分鐘，避免永遠等不到
+        self.token_budget -= min(cost, self.tokens_per_minute)
+        return -self.token_budget / per_second if self.token_budget < 0 else 0.0
+
+    async def _reserve_request(self) -> float:
+        return self._take_request()
+
+    async def _acquire(self, cost: int = 0, guild: Optional[Hashable] = None):
+        metrics.rate_limiter_queue.set(self.waiting)
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is not None and self._dispatcher.get_loop() is not loop:
+            # 上一個事件迴圈已結束 (例如測試各自建立迴圈)：留下的請求不會再有人等待
+            self._queues.clear()
+            self._deficit.clear()
+            self._visiting = _NOT_VISITING
+        future = loop.create_future()
+        queue = self._queues.get(guild)
+        if queue is None:
+            queue = self._queues[guild] = deque()
+            self._deficit[guild] = 0.0
+        # 估計 token 數未知的請求以一個 quantum 計，每輪每個伺服器放行一個
+        queue.append((future, int(cost) if cost > 0 else self.quantum))
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = loop.create_task(self._dispatch())
+        # 呼叫端被取消時 future 也一併取消，派發工作會略過它
+        await future
+
+    async def _dispatch(self):
+        """依序放行：選出下一個請求、扣除令牌、等到令牌 (與 Retry-After 暫停) 可用後喚醒它"""
+        while True:
+            picked = self._next_waiter()
+            if picked is None:
+                return
+            guild, future, cost = picked
+            try:
+                wait_time = max(await self._reserve_request(), self._take_tokens(cost))
+                self._schedule_save()
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
+                # 等待期間收到 429 時延到暫停結束
+                while self.blocked_until > time.monotonic():
+                    await asyncio.sleep(self.blocked_until - time.monotonic())
+            except Exception as e:
+                logger.error(f"Rate limiter dispatch failed ({self.key}): {e}", exc_info=True)
+            self._record_grant(guild)
+            if not future.done():
+                future.set_result(None)
+
+    def _next_waiter(self) -> Optional[Tuple[Optional[Hashable], asyncio.Future, int]]:
+        """
+        deficit round-robin：輪到的伺服器先累積 quantum，額度足夠就放行隊首請求，否則換下一個伺服器。
+        超過 max_share 的伺服器只在還有未超額的伺服器排隊時才跳過；全部超額時照一般輪流順序。
+        """
+        self._prune_grants()
+        for guild in list(self._queues):
+            queue = self._queues[guild]
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._queues[guild]
+                del self._deficit[guild]
+        if not self._queues:
+            self._visiting = _NOT_VISITING
+            return None
+
+        capped = {guild for guild in self._queues if self._over_share(guild)}
+        if len(capped) == len(self._queues):
+            capped = set()
+        # 每次造訪未超額的伺服器都會加 quantum，因此迴圈必定在有限輪內放行一個請求
+        while True:
+            guild = next(iter(self._queues))
+            if guild not in capped:
+                if guild != self._visiting:
+                    self._visiting = guild
+                    self._deficit[guild] += max(self.quantum, 1)
+                queue = self._queues[guild]
+                future, cost = queue[0]
+                if self._deficit[guild] >= cost:
+                    self._deficit[guild] -= cost
+                    queue.popleft()
+                    return guild, future, cost
+            self._queues.move_to_end(guild)
+            self._visiting = _NOT_VISITING
+
+    def _over_share(self, guild: Optional[Hashable]) -> bool:
+        """此伺服器最近一分鐘取得的請求已達 max_share (其他伺服器也在排隊時才有意義)"""
+        if self.max_share >= 1.0 or len(self._queues) < 2 or len(self._grants) < 4:
+            return False
+        return self._grant_counts[guild] / len(self._grants) >= self.max_share
+
+    def _record_grant(self, guild: Optional[Hashable]):
+        self._grants.append((time.monotonic(), guild))
+        self._grant_counts[guild] += 1
+
+    def _prune_grants(self):
+        cutoff = time.monotonic() - RATE_LIMIT_SHARE_WINDOW
+        while self._grants and self._grants[0][0] < cutoff:
+            _, guild = self._grants.popleft()
+            self._grant_counts[guild] -= 1
+            if not self._grant_counts[guild]:
+                del self._grant_counts[guild]
+
+    def estimate_wait(self, guild: Optional[Hashable] = None) -> Tuple[int, float]:
+        """
+        guild 現在送出新請求時的 (排隊位置, 預估等待秒數)。
+        輪流放行下，排在它前面的是同伺服器的所有請求，加上其他伺服器各自最多同樣數量的請求。
+        """
+        own = sum(1 for f, _ in self._queues.get(guild, ()) if not f.done()) + 1
+        ahead = own - 1
+        for other, queue in self._queues.items():
+            if other != guild:
+                ahead += min(sum(1 for f, _ in queue if not f.done()), own)
+        now = time.monotonic()
+        tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+        wait_time = max(ahead + 1 - tokens, 0.0) / self.rate
+        return ahead + 1, max(wait_time, self.blocked_until - now)
+
+    def on_success(self, tokens_used: int = 0):
+        """呼叫成功：補扣回應的 token 並加法增加速率"""
+        self._take_tokens(tokens_used)
+        self.stats["ok"] += 1
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            metrics.rate_limiter_rpm.set(self.rate * 60, key=self.key)
+        self._schedule_save()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """收到 429：乘法減少速率、清空桶，並暫停到 retry_after 秒後"""
+        self.stats["rate_limited"] += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        metrics.rate_limiter_rpm.set(self.rate * 60, key=self.key)
+        metrics.rate_limiter_throttled.inc(key=self.key)
+        logger.warning(f"Rate limited ({self.key}): slowing to {self.rate * 60:.1f} RPM"
+                       + (f", pausing {retry_after:.1f}s" if retry_after else ""))
+        self._schedule_save()
+
+    def update_quota(self, headers: Optional[Mapping[str, str]]):
+        """
+        套用供應商回傳的配額標頭 (x-ratelimit-limit/remaining/reset-requests|tokens，以每分鐘計)。
+        配額只會調低設定的上限；剩餘為 0 時暫停到重置時間。
+        """
+        if not isinstance(headers, Mapping):
+            return
+        changed = False
+        for kind in ("requests", "tokens"):
+            limit = _parse_duration(headers.get(f"x-ratelimit-limit-{kind}", "") or "")
+            if limit:
+                if kind == "requests" and limit / 60.0 < self.max_rate:
+                    self.max_rate = limit / 60.0
+                    self.rate = min(self.rate, self.max_rate)
+                    self.min_rate = min(self.min_rate, self.max_rate)
+                    changed = True
+                elif kind == "tokens" and (not self.tokens_per_minute or limit < self.tokens_per_minute):
+                    self.tokens_per_minute = int(limit)
+                    self.token_budget = min(self.token_budget, limit)
+                    changed = True
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}", "") or "")
+            if remaining is not None and remaining.strip() == "0" and reset:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+                changed = True
+        if changed:
+            metrics.rate_limiter_rpm.set(self.rate * 60, key=self.key)
+            self._schedule_save()
+
+    def snapshot(self) -> Dict[str, float]:
+        """目前狀態 (時間以 wall clock 表示，才能跨程序重啟)"""
+        now, wall = time.monotonic(), time.time()
+        return {
+            "rate": self.rate,
+            "tokens": self.tokens,
+            "last_update": wall - (now - self.last_update),
+            "token_budget": self.token_budget,
+            "token_update": wall - (now - self.token_update),
+            "blocked_until": wall + (self.blocked_until - now) if self.blocked_until > now else 0.0,
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        """還原 snapshot()；上限沿用目前設定 (配額標頭會在下一次回應時重新套用)"""
+        now, wall = time.monotonic(), time.time()
+        self.rate = min(self.max_rate, max(self.min_rate, float(state.get("rate", self.rate))))
+        self.tokens = min(self.capacity, float(state.get("tokens", self.tokens)))
+        self.last_update = now - max(wall - float(state.get("last_update", wall)), 0.0)
+        self.token_budget = min(float(self.tokens_per_minute), float(state.get("token_budget", self.token_budget)))
+        self.token_update = now - max(wall - float(state.get("token_update", wall)), 0.0)
+        blocked = float(state.get("blocked_until", 0.0))
+        self.blocked_until = now + (blocked - wall) if blocked > wall else 0.0
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f).get(self.key)
+            if isinstance(state, dict):
+                self.restore(state)
+                logger.info(f"Restored rate limiter state ({self.key}): {self.rate * 60:.1f} RPM")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable rate limiter state {self.state_path}: {e}")
+
+    def _save_state(self, state: Dict[str, float]):
+        """寫入保存檔 (同步 I/O，請在 executor 中執行)；保留其他 key 的狀態"""
+        data: Dict[str, Any] = {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                data = loaded
+        except (OSError, ValueError):
+            pass
+        data[self.key] = state
+        _atomic_write_json(self.state_path, data)
+
+    def _schedule_save(self):
+        if not self.state_path:
+            return
+        self._dirty = True
+        loop = asyncio.get_running_loop()
+        if self._save_task is None or self._save_task.done() or self._save_task.get_loop() is not loop:
+            self._save_task = loop.create_task(self._flush_state())
+
+    async def _flush_state(self):
+        """於背景寫檔；寫入期間又有變動時再寫一次，因此最後寫入的一定是最新狀態"""
+        loop = asyncio.get_running_loop()
+        while self._dirty:
+            self._dirty = False
+            try:
+                await loop.run_in_executor(None, self._save_state, self.snapshot())
+            except OSError as e:
+                logger.warning(f"Failed to save rate limiter state: {e}")
+                return
+
+class SQLiteRateLimiter(AdaptiveRateLimiter):
+    """
+    跨程序共用的 Token Bucket：桶的狀態存在 SQLite 檔中，以 BEGIN IMMEDIATE 交易原子地扣除。
+    令牌不足時預約下一個令牌 (tokens 可為負值) 再睡到預約時間，因此各程序不需要輪詢。
+    用於分片部署 (多個 bot 程序) 共用同一個 API 配額。AIMD 速率、TPM 與 Retry-After 暫停由各程序各自追蹤。
+    """
+    def __init__(self, path: str, rate: float, capacity: float, key: str = "default", tokens_per_minute: int = 0, **kwargs):
+        super().__init__(rate, capacity, tokens_per_minute=tokens_per_minute, key=key, **kwargs)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", (key, capacity, time.time()))
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _reserve(self) -> float:
+        """扣除一個令牌 (同步 I/O，請在 executor 中執行)，回傳需等待的秒數"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (self.key,)).fetchone()
+            now = time.time()
+            tokens, updated = row if row else (self.capacity, now)
+            tokens = min(self.capacity, tokens + max(now - updated, 0.0) * self.rate) - 1
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (self.key, tokens, now))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    async def _reserve_request(self) -> float:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self._reserve)
+        except sqlite3.Error as e:
+            logger.error(f"Shared rate limiter unavailable ({e}), falling back to local bucket")
+            return self._take_request()
+
+def _atomic_write_json(path: str, data: Any):
+    """原子寫入：先寫入臨時檔再重新命名，防止寫入中斷導致檔案損壞"""
+    dir_name = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        # 清理臨時檔
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
 class AIManager:
-    def __init__(self, ollama_model: Optional[str] = None):
+    def __init__(self, ollama_model: Optional[str] = None, gateway_url: Optional[str] = None):
         self.provider = os.getenv('AI_PROVIDER', 'gemini').lower()
+        # gateway_url="" 強制直連供應商 (閘道本身使用)
+        self.gateway_url = (LLM_GATEWAY_URL if gateway_url is None else gateway_url).rstrip("/")
         self.ollama_model = ollama_model or os.getenv('OLLAMA_MODEL', 'gpt-oss:20b')
         self.ollama_host = os.getenv('OLLAMA_HOST', 'http://localhost:11434')
         self.gemini_api_key = os.getenv('GEMINI_API_KEY')
         self.gemini_model = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash-lite')
         self.session: Optional[aiohttp.ClientSession] = None
+        self.connection_stats: Dict[str, int] = {"created": 0, "reused": 0, "dns_hit": 0, "dns_miss": 0}
+        self.prompt_stats: Dict[str, int] = {} # 因 token 預算被刪掉的區段 -> 累計估計 token 數
+        self._backend: Optional[Callable[..., Awaitable[str]]] = None
+
+        if self.gateway_url:
+            if not self.gateway_url.startswith(ALLOWED_URL_SCHEMES + (UNIX_SCHEME,)):
+                logger.warning(f"LLM gateway URL scheme not allowed: {self.gateway_url}. Connecting to providers directly.")
+                self.gateway_url = ""
+            else:
+                self.provider = "gateway"
 
         logger.info(f"AI Manager initialized. Provider: {self.provider}")
-        if self.provider == 'ollama':
+        if self.provider == 'gateway':
+            logger.info(f"LLM Gateway: {self.gateway_url}")
+        elif self.provider == 'ollama':
             # 驗證 Ollama URL scheme
             if not any(self.ollama_host.startswith(scheme) for scheme in ALLOWED_URL_SCHEMES):
                 logger.warning(f"Ollama host URL scheme not allowed: {self.ollama_host}. Resetting to default.")
@@ -87,90 +613,283 @@ class AIManager:
         elif self.provider == 'gemini-api':
             logger.info(f"Gemini API Model: {self.gemini_model}")
 
-        # Rate Limiter: 15 RPM = 0.25 requests/sec (1 request every 4 seconds)
-        # Capacity 1 ensures strict spacing.
-        self.rate_limiter = RateLimiter(rate=15/60.0, capacity=1.0)
+        # 次要小模型只有 Ollama (直連或經由閘道) 才有意義
+        self.effort_router = EffortRouter(small_model=None if self.provider in ('ollama', 'gateway') else "")
+        # 模型串接：小模型起草、主要模型把關 (需要 OLLAMA_SMALL_MODEL)
+        self.cascade_model = self.effort_router.small_model if MODEL_CASCADE else ""
+        if MODEL_CASCADE and not self.cascade_model:
+            logger.warning("MODEL_CASCADE needs OLLAMA_SMALL_MODEL with the ollama or gateway provider; cascade disabled.")
+        elif self.cascade_model:
+            logger.info(f"Model cascade: {self.cascade_model} drafts, {self.ollama_model} verifies")
+        self.cascade_stats = CascadeStats()
+        # 發言、遺言與旁白的後處理 (格式、長度、幻覺與身分洩漏檢查)
+        self.response_filter = ResponseFilter(MAX_RESPONSE_LENGTH)
+
+        # Rate Limiter: 預設 15 RPM = 0.25 requests/sec (1 request every 4 seconds)，Capacity 1 ensures strict spacing.
+        # 不限流的供應商也建立限流器 (閘道健康檢查會讀取排隊數)，但 _generate_with_retries 不會使用
+        # 設定 RATE_LIMIT_DB 時，同一台機器上的所有 bot 程序共用這個配額
+        rpm, tpm = RATE_LIMITS.get(self.provider, (0.0, 0))
+        rate = (rpm if rpm > 0 else 15.0) / 60.0
+        if RATE_LIMIT_DB:
+            self.rate_limiter = SQLiteRateLimiter(RATE_LIMIT_DB, rate=rate, capacity=1.0, key=self.provider, tokens_per_minute=tpm)
+        else:
+            self.rate_limiter = AdaptiveRateLimiter(rate=rate, capacity=1.0, tokens_per_minute=tpm, state_path=RATE_LIMIT_STATE, key=self.provider)
 
         self.narrative_cache: OrderedDict = OrderedDict()
         self.role_template_cache: OrderedDict = OrderedDict()
+        self._persist_lock = asyncio.Lock()
+        self._journal_entries = 0
+        self._inflight = 0 # 進行中的 LLM 請求數 (用於判斷閒置)
+        self._last_activity = 0.0 # 最後一次 LLM 回應的時間 (monotonic)
+        self._warmup_task: Optional[asyncio.Task] = None
+        self.model_ready = False
+        self.warmup_latency: Dict[str, float] = {} # {"cold": 秒, "warm": 秒}
         self._load_cache()
+        self._load_narratives()
+
+    def _journal_path(self) -> str:
+        return CACHE_FILE + CACHE_JOURNAL_SUFFIX
+
+    def _add_cache_entry(self, entry: Any) -> bool:
+        # Entry format: {"player_count": 5, "existing_roles": [...], "roles": [...]}
+        if not isinstance(entry, dict) or not all(k in entry for k in ("player_count", "existing_roles", "roles")):
+            return False
+
+        key = (entry["player_count"], tuple(entry["existing_roles"]))
+        self.role_template_cache[key] = entry["roles"]
+        self.role_template_cache.move_to_end(key)
+        if len(self.role_template_cache) > 100:
+            self.role_template_cache.popitem(last=False)
+        return True
 
     def _load_cache(self):
-        if not os.path.exists(CACHE_FILE):
+        """載入快照檔後重播追加日誌。損壞或寫到一半的日誌行會被略過 (崩潰安全)。"""
+        if os.path.exists(CACHE_FILE):
+            try:
+                with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for entry in data:
+                    self._add_cache_entry(entry)
+            except Exception as e:
+                logger.error(f"Failed to load cache: {e}")
+
+        journal_path = self._journal_path()
+        if os.path.exists(journal_path):
+            skipped = 0
+            try:
+                with open(journal_path, 'rb+') as f:
+                    raw = f.read()
+                    if raw and not raw.endswith(b"\n"):
+                        # 崩潰時寫到一半的最後一行：截掉，否則下一次追加會黏在它後面而一起損毀
+                        complete = raw.rfind(b"\n") + 1
+                        f.truncate(complete)
+                        raw = raw[:complete]
+                        skipped += 1
+                for line in raw.decode('utf-8', errors='replace').splitlines():
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if self._add_cache_entry(entry):
+                        self._journal_entries += 1
+                    else:
+                        skipped += 1
+            except Exception as e:
+                logger.error(f"Failed to replay cache journal: {e}")
+            if skipped:
+                logger.warning(f"Skipped {skipped} corrupt cache journal lines.")
+
+        if self.role_template_cache:
+            logger.info(f"Loaded {len(self.role_template_cache)} entries from cache.")
+
+    def _cache_snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"player_count": player_count, "existing_roles": list(existing_roles), "roles": roles}
+            for (player_count, existing_roles), roles in self.role_template_cache.items()
+        ]
+
+    def _append_journal(self, entry: Dict[str, Any]):
+        """追加一行至日誌並 fsync (於執行緒池中執行，不阻塞事件迴圈)"""
+        line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+        with open(self._journal_path(), 'a+b') as f:
+            # 先前的寫入若中斷在行中間，新的一行另起一行，不與殘缺的內容黏在一起
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _save_cache(self, data: Optional[List[Dict[str, Any]]] = None):
+        """將完整快取壓縮寫入快照檔並清空日誌"""
+        if data is None:
+            data = self._cache_snapshot()
+        try:
+            _atomic_write_json(CACHE_FILE, data)
+            # 快照已包含日誌內容，日誌可以清空
+            journal_path = self._journal_path()
+            if os.path.exists(journal_path):
+                os.unlink(journal_path)
+        except Exception as e:
+            logger.error(f"Failed to save cache: {e}")
+
+    async def _persist_template(self, cache_key: Tuple[int, Tuple[str, ...]], roles: List[str]):
+        """非同步持久化一筆新板子：追加日誌，必要時於背景壓縮"""
+        entry = {"player_count": cache_key[0], "existing_roles": list(cache_key[1]), "roles": roles}
+        loop = asyncio.get_running_loop()
+        async with self._persist_lock:
+            try:
+                await loop.run_in_executor(None, self._append_journal, entry)
+                self._journal_entries += 1
+            except Exception as e:
+                logger.error(f"Failed to append cache journal: {e}")
+                return
+
+            if self._journal_entries >= CACHE_COMPACT_THRESHOLD:
+                # 快照資料需在事件迴圈執行緒建立，避免與 OrderedDict 的修改競爭
+                snapshot = self._cache_snapshot()
+                await loop.run_in_executor(None, self._save_cache, snapshot)
+                self._journal_entries = 0
+
+    async def compact_cache(self):
+        """立即將日誌壓縮為快照 (於關閉時呼叫)"""
+        if not self._journal_entries:
+            return
+        loop = asyncio.get_running_loop()
+        async with self._persist_lock:
+            snapshot = self._cache_snapshot()
+            await loop.run_in_executor(None, self._save_cache, snapshot)
+            self._journal_entries = 0
+
+    def _load_narratives(self):
+        if not os.path.exists(NARRATIVE_CACHE_FILE):
             return
 
         try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            with open(NARRATIVE_CACHE_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
             for entry in data:
-                # Entry format: {"player_count": 5, "existing_roles": [...], "roles": [...]}
-                if not all(k in entry for k in ("player_count", "existing_roles", "roles")):
+                # Entry format: {"event_type": "天亮", "context": "...{P1}...", "language": "zh-TW", "variants": [...]}
+                if not all(k in entry for k in ("event_type", "context", "language", "variants")):
                     continue
+                variants = [v for v in entry["variants"] if isinstance(v, str) and v]
+                if variants:
+                    key = (entry["event_type"], entry["context"], entry["language"])
+                    self.narrative_cache[key] = variants[:NARRATIVE_VARIANTS]
 
-                player_count = entry["player_count"]
-                existing_roles = tuple(entry["existing_roles"])
-                roles = entry["roles"]
-
-                key = (player_count, existing_roles)
-                self.role_template_cache[key] = roles
-
-            logger.info(f"Loaded {len(self.role_template_cache)} entries from cache.")
+            logger.info(f"Loaded {len(self.narrative_cache)} narrative templates from cache.")
         except Exception as e:
-            logger.error(f"Failed to load cache: {e}")
+            logger.error(f"Failed to load narrative cache: {e}")
 
-    def _save_cache(self):
+    def _save_narratives(self, data: List[Dict[str, Any]]):
         try:
-            data = []
-            for (player_count, existing_roles), roles in self.role_template_cache.items():
-                data.append({
-                    "player_count": player_count,
-                    "existing_roles": list(existing_roles),
-                    "roles": roles
-                })
-
-            # 原子寫入：先寫入臨時檔再重新命名，防止寫入中斷導致檔案損壞
-            dir_name = os.path.dirname(os.path.abspath(CACHE_FILE))
-            fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix='.tmp')
-            try:
-                with os.fdopen(fd, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                os.replace(tmp_path, CACHE_FILE)
-            except Exception:
-                # 清理臨時檔
-                try:
-                    os.unlink(tmp_path)
-                except OSError:
-                    pass
-                raise
+            _atomic_write_json(NARRATIVE_CACHE_FILE, data)
         except Exception as e:
-            logger.error(f"Failed to save cache: {e}")
+            logger.error(f"Failed to save narrative cache: {e}")
+
+    async def _persist_narratives(self):
+        """在執行緒池中寫入旁白語料庫，避免阻塞事件迴圈"""
+        data = [
+            {"event_type": event_type, "context": context, "language": language, "variants": list(variants)}
+            for (event_type, context, language), variants in self.narrative_cache.items()
+        ]
+        loop = asyncio.get_running_loop()
+        async with self._persist_lock:
+            await loop.run_in_executor(None, self._save_narratives, data)
+
+    def set_backend(self, backend: Callable[..., Awaitable[str]], name: str = "custom"):
+        """
+        替換底層的 LLM 呼叫 (離線模擬、壓力測試用)。
+        backend(prompt, reasoning_effort=...) 仍會經過 generate_response 的重試與閒置追蹤。
+        """
+        self._backend = backend
+        self.provider = name
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """記錄連線建立/重用與 DNS 快取命中，用於確認 keep-alive 與連線池設定是否生效"""
+        trace = aiohttp.TraceConfig()
+
+        def counter(event: str):
+            async def on_event(session, ctx, params):
+                self.connection_stats[event] += 1
+                metrics.http_connections.inc(event=event)
+            return on_event
+
+        trace.on_connection_create_end.append(counter("created"))
+        trace.on_connection_reuseconn.append(counter("reused"))
+        trace.on_dns_cache_hit.append(counter("dns_hit"))
+        trace.on_dns_cache_miss.append(counter("dns_miss"))
+        return trace
 
     async def get_session(self) -> aiohttp.ClientSession:
         if self.session is None or self.session.closed:
-            self.session = aiohttp.ClientSession(timeout=CALLBACK_TIMEOUT)
+            pool = {"limit": HTTP_POOL_LIMIT, "limit_per_host": HTTP_POOL_LIMIT_PER_HOST, "keepalive_timeout": HTTP_KEEPALIVE}
+            if self.gateway_url.startswith(UNIX_SCHEME):
+                connector = aiohttp.UnixConnector(path=self.gateway_url[len(UNIX_SCHEME):], **pool)
+            else:
+                connector = aiohttp.TCPConnector(ttl_dns_cache=HTTP_DNS_TTL, use_dns_cache=True, **pool)
+            self.session = aiohttp.ClientSession(timeout=CALLBACK_TIMEOUT, connector=connector, trace_configs=[self._trace_config()])
         return self.session
 
+    def _request_timeout(self, call_type: str) -> aiohttp.ClientTimeout:
+        total = CALL_TIMEOUTS.get(call_type, CALL_TIMEOUTS["other"])
+        return aiohttp.ClientTimeout(total=total, connect=min(HTTP_CONNECT_TIMEOUT, total))
+
+    def _gateway_endpoint(self, path: str) -> str:
+        base = "http://gateway" if self.gateway_url.startswith(UNIX_SCHEME) else self.gateway_url
+        return f"{base}{path}"
+
+    async def _gateway_call(self, path: str, payload: Dict[str, Any], call_type: str = "other") -> Dict[str, Any]:
+        """呼叫 LLM 閘道；429 轉為 RateLimitError，其他錯誤狀態以 ClientResponseError 交給重試邏輯"""
+        session = await self.get_session()
+        async with session.post(self._gateway_endpoint(path), json=payload, timeout=self._request_timeout(call_type)) as response:
+            if response.status == 429:
+                error_text = await response.text()
+                raise RateLimitError(f"LLM gateway 429: {error_text}", retry_after=parse_retry_after(response.headers, error_text))
+            response.raise_for_status()
+            return await response.json()
+
+    async def _generate_with_gateway(self, prompt: str, reasoning_effort: str = "medium", call_type: str = "other", model: Optional[str] = None,
+                                     guild: Optional[Hashable] = None) -> str:
+        payload = {"prompt": prompt, "reasoning_effort": reasoning_effort, "call_type": call_type}
+        if model:
+            payload["model"] = model
+        if guild is not None:
+            payload["guild"] = str(guild) # 閘道以此公平排隊
+        data = await self._gateway_call("/v1/generate", payload, call_type)
+        return data.get("text", "")
+
     async def close(self):
+        await self.compact_cache()
         if self.session and not self.session.closed:
             await self.session.close()
 
-    async def _generate_with_ollama(self, prompt: str, reasoning_effort: str = "medium") -> str:
+    async def _generate_with_ollama(self, prompt: str, reasoning_effort: str = "medium", call_type: str = "other", model: Optional[str] = None) -> str:
         url = f"{self.ollama_host}/api/generate"
         payload = {
-            "model": self.ollama_model,
+            "model": model or self.ollama_model,
             "prompt": prompt,
-            "stream": False
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
         }
         # 設定思考程度 (low/medium/high)
         if reasoning_effort in ("low", "medium", "high"):
             payload["options"] = {"reasoning_effort": reasoning_effort}
         # Let exceptions bubble up to generate_response for retry logic
         session = await self.get_session()
-        async with session.post(url, json=payload) as response:
+        async with session.post(url, json=payload, timeout=self._request_timeout(call_type)) as response:
             if response.status == 200:
                 data = await response.json()
                 return data.get("response", "").strip()
+            elif response.status == 429:
+                error_text = await response.text()
+                raise RateLimitError(f"Ollama 429: {error_text}", retry_after=parse_retry_after(response.headers, error_text))
             else:
                 error_text = await response.text()
                 logger.error(f"Ollama API Error: {response.status} - {error_text}")
@@ -179,7 +898,55 @@ class AIManager:
                     raise aiohttp.ClientError(f"Ollama Server Error: {response.status}")
                 return ""
 
-    async def _generate_with_gemini_cli(self, prompt: str) -> str:
+    async def _ping_model(self) -> float:
+        """送出極短的請求讓 Ollama 載入模型，回傳耗時秒數"""
+        payload = {
+            "model": self.ollama_model,
+            "prompt": "hi",
+            "stream": False,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"num_predict": 1},
+        }
+        started = time.perf_counter()
+        session = await self.get_session()
+        async with session.post(f"{self.ollama_host}/api/generate", json=payload, timeout=MODEL_WARMUP_TIMEOUT) as response:
+            response.raise_for_status()
+            await response.read()
+        return time.perf_counter() - started
+
+    async def _warm_up(self) -> bool:
+        try:
+            with tracer.span("llm.warmup", "llm", model=self.ollama_model):
+                cold = await self._ping_model()
+                warm = await self._ping_model()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Model warm-up failed for {self.ollama_model}: {e}")
+            self.model_ready = False
+            return False
+
+        self.warmup_latency = {"cold": cold, "warm": warm}
+        metrics.model_warmup.set(cold, state="cold")
+        metrics.model_warmup.set(warm, state="warm")
+        self.model_ready = True
+        self._last_activity = time.monotonic()
+        logger.info(f"Model {self.ollama_model} ready: cold {cold:.1f}s, warm {warm:.2f}s")
+        return True
+
+    def needs_warmup(self) -> bool:
+        """模型尚未載入，或閒置太久可能已被 Ollama 卸載 (只有本地 Ollama 需要預熱)"""
+        if self.provider != 'ollama' or self._backend is not None:
+            return False
+        return not self.model_ready or time.monotonic() - self._last_activity > MODEL_REWARM_IDLE
+
+    async def warm_up_model(self) -> bool:
+        """預先載入模型並量測冷/熱延遲；同時呼叫時共用同一次載入。回傳模型是否就緒。"""
+        if self.provider != 'ollama' or self._backend is not None:
+            return True
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self._warm_up())
+        return await asyncio.shield(self._warmup_task)
+
+    async def _generate_with_gemini_cli(self, prompt: str, call_type: str = "other") -> str:
         """Executes gemini-cli via subprocess."""
         try:
             # Create subprocess: gemini -p "prompt"
@@ -190,7 +957,13 @@ class AIManager:
                 stderr=asyncio.subprocess.PIPE
             )
 
-            stdout, stderr = await process.communicate()
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=CALL_TIMEOUTS.get(call_type, CALL_TIMEOUTS["other"]))
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.error(f"Gemini CLI timed out ({call_type})")
+                return ""
 
             if process.returncode == 0:
                 return stdout.decode().strip()
@@ -198,7 +971,7 @@ class AIManager:
                 error_msg = stderr.decode().strip()
                 # Detect rate limit in stderr
                 if "429" in error_msg or "ResourceExhausted" in error_msg:
-                    raise RateLimitError(f"Gemini CLI 429: {error_msg}")
+                    raise RateLimitError(f"Gemini CLI 429: {error_msg}", retry_after=parse_retry_after(body=error_msg))
 
                 logger.error(f"Gemini CLI Error: {error_msg}")
                 return ""
@@ -208,7 +981,7 @@ class AIManager:
             logger.error(f"Gemini Execution Error: {e}")
             return ""
 
-    async def _generate_with_gemini_api(self, prompt: str) -> str:
+    async def _generate_with_gemini_api(self, prompt: str, call_type: str = "other") -> str:
         """Executes Gemini via Google API."""
         if not self.gemini_api_key:
             logger.error("Gemini API Key is missing.")
@@ -224,7 +997,9 @@ class AIManager:
 
         try:
             session = await self.get_session()
-            async with session.post(url, json=payload, headers=headers) as response:
+            async with session.post(url, json=payload, headers=headers, timeout=self._request_timeout(call_type)) as response:
+                if isinstance(self.rate_limiter, AdaptiveRateLimiter):
+                    self.rate_limiter.update_quota(response.headers)
                 if response.status == 200:
                     data = await response.json()
                     candidates = data.get("candidates", [])
@@ -236,7 +1011,7 @@ class AIManager:
                     return ""
                 elif response.status == 429:
                     error_text = await response.text()
-                    raise RateLimitError(f"Gemini API 429: {error_text}")
+                    raise RateLimitError(f"Gemini API 429: {error_text}", retry_after=parse_retry_after(response.headers, error_text))
                 else:
                     error_text = await response.text()
                     logger.error(f"Gemini API Error: {response.status} - {error_text}")
@@ -247,50 +1022,256 @@ class AIManager:
             logger.error(f"Gemini API Connection Error: {e}")
             return ""
 
-    async def generate_response(self, prompt: str, retry_callback: Optional[Callable] = None, reasoning_effort: str = "medium") -> str:
+    async def _stream_with_ollama(self, prompt: str, reasoning_effort: str = "medium", call_type: str = "other", model: Optional[str] = None) -> AsyncIterator[str]:
+        """以 Ollama 的 NDJSON 串流逐段產出文字"""
+        url = f"{self.ollama_host}/api/generate"
+        payload = {
+            "model": model or self.ollama_model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }
+        if reasoning_effort in ("low", "medium", "high"):
+            payload["options"] = {"reasoning_effort": reasoning_effort}
+        session = await self.get_session()
+        async with session.post(url, json=payload, timeout=self._request_timeout(call_type)) as response:
+            if response.status == 429:
+                error_text = await response.text()
+                raise RateLimitError(f"Ollama 429: {error_text}", retry_after=parse_retry_after(response.headers, error_text))
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"Ollama API Error: {response.status} - {error_text}")
+                if response.status >= 500:
+                    raise aiohttp.ClientError(f"Ollama Server Error: {response.status}")
+                return
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    return
+
+    async def _stream_with_gemini_api(self, prompt: str, call_type: str = "other") -> AsyncIterator[str]:
+        """以 Gemini API 的 SSE 串流 (streamGenerateContent?alt=sse) 逐段產出文字"""
+        if not self.gemini_api_key:
+            logger.error("Gemini API Key is missing.")
+            return
+
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.gemini_model}:streamGenerateContent?alt=sse"
+        headers = {"Content-Type": "application/json", "x-goog-api-key": self.gemini_api_key}
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        session = await self.get_session()
+        async with session.post(url, json=payload, headers=headers, timeout=self._request_timeout(call_type)) as response:
+            if isinstance(self.rate_limiter, AdaptiveRateLimiter):
+                self.rate_limiter.update_quota(response.headers)
+            if response.status == 429:
+                error_text = await response.text()
+                raise RateLimitError(f"Gemini API 429: {error_text}", retry_after=parse_retry_after(response.headers, error_text))
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"Gemini API Error: {response.status} - {error_text}")
+                return
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                for candidate in json.loads(line[5:]).get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+
+    def _stream_chunks(self, prompt: str, reasoning_effort: str, call_type: str, model: Optional[str]) -> Optional[AsyncIterator[str]]:
+        """目前供應商的原生串流；不支援串流 (閘道、Gemini CLI、自訂後端) 時回傳 None"""
+        if self._backend is not None:
+            return None
+        if self.provider == 'ollama':
+            return self._stream_with_ollama(prompt, reasoning_effort=reasoning_effort, call_type=call_type, model=model)
+        if self.provider == 'gemini-api':
+            return self._stream_with_gemini_api(prompt, call_type=call_type)
+        return None
+
+    async def generate_response(self, prompt: str, retry_callback: Optional[Callable] = None, reasoning_effort: str = "medium", call_type: str = "other", model: Optional[str] = None, budget: Optional[Any] = None,
+                                guild: Optional[Hashable] = None) -> str:
         """
         Generic async wrapper for generating content with Rate Limiting and Retry logic.
+        call_type: 呼叫類型 (action / speech / last_words / narrative / role_template)，用於指標分類。
+        model: 改用指定的 Ollama 模型 (例如 OLLAMA_SMALL_MODEL)；其他供應商忽略。
+        budget: 本局的 AI 預算 (ai_budget.AIBudget)，記錄呼叫次數、token 與等待時間。
+        guild: 速率限制排隊用的伺服器 ID，未指定時沿用 budget.guild。
+        """
+        if guild is None:
+            guild = getattr(budget, "guild", None)
+        started = time.perf_counter()
+        outcome = "error"
+        result = ""
+        self._inflight += 1 # 從排隊、呼叫到重試退避結束都算忙碌
+        try:
+            result = await self._generate_with_retries(prompt, retry_callback, reasoning_effort, call_type, model, guild)
+            outcome = "ok" if result else "empty"
+            return result
+        finally:
+            self._inflight -= 1
+            elapsed = time.perf_counter() - started
+            metrics.llm_requests.inc(provider=self.provider, call_type=call_type, outcome=outcome)
+            metrics.llm_latency.observe(elapsed, provider=self.provider, call_type=call_type)
+            if budget is not None:
+                budget.record(prompt, result, elapsed)
+
+    async def stream_response(self, prompt: str, retry_callback: Optional[Callable] = None, reasoning_effort: str = "medium", call_type: str = "other", model: Optional[str] = None,
+                              budget: Optional[Any] = None, guild: Optional[Hashable] = None) -> AsyncIterator[str]:
+        """
+        generate_response 的串流版本，逐段產出新增的文字。
+        供應商不支援串流時整段產出一次；第一段文字出現前失敗則改走 generate_response (含重試)，
+        已經產出部分文字後中斷則保留已產出的部分。
         """
+        if guild is None:
+            guild = getattr(budget, "guild", None)
+        chunks = self._stream_chunks(prompt, reasoning_effort, call_type, model)
+        if chunks is None:
+            text = await self.generate_response(prompt, retry_callback, reasoning_effort, call_type, model, budget, guild)
+            if text:
+                yield text
+            return
+
+        limited = RATE_LIMITS.get(self.provider, (0.0, 0))[0] > 0
+        adaptive = limited and isinstance(self.rate_limiter, AdaptiveRateLimiter)
+        started = time.perf_counter()
+        outcome = "error"
+        parts: List[str] = []
+        fallback = False
+        self._inflight += 1 # 排隊等速率限制時也算忙碌 (旁白預熱不插隊)
+        try:
+            if limited:
+                if adaptive:
+                    position, eta = self.rate_limiter.estimate_wait(guild)
+                    if eta >= QUEUE_NOTICE_SECONDS:
+                        await self._notify(retry_callback, position=position, wait=eta)
+                wait_started = time.perf_counter()
+                with tracer.span("llm.rate_limit_wait", "rate_limit"):
+                    await self.rate_limiter.acquire(estimate_tokens(prompt), guild=guild)
+                metrics.rate_limiter_wait.observe(time.perf_counter() - wait_started)
+
+            try:
+                with tracer.span("llm.stream", "llm", provider=self.provider, effort=reasoning_effort, model=model or "primary"):
+                    async for chunk in chunks:
+                        parts.append(chunk)
+                        yield chunk
+            finally:
+                self._last_activity = time.monotonic()
+            outcome = "ok" if parts else "empty"
+            if adaptive and parts:
+                self.rate_limiter.on_success(estimate_tokens("".join(parts)))
+        except Exception as e:
+            if adaptive and isinstance(e, RateLimitError):
+                self.rate_limiter.on_rate_limited(e.retry_after)
+            if parts:
+                logger.warning(f"Stream interrupted after {len(parts)} chunks: {e}")
+            else:
+                logger.warning(f"Stream failed before first chunk: {e}. Falling back to generate_response")
+                fallback = True
+        finally:
+            self._inflight -= 1
+            if not fallback:
+                elapsed = time.perf_counter() - started
+                metrics.llm_requests.inc(provider=self.provider, call_type=call_type, outcome=outcome)
+                metrics.llm_latency.observe(elapsed, provider=self.provider, call_type=call_type)
+                if budget is not None:
+                    budget.record(prompt, "".join(parts), elapsed)
+
+        if fallback:
+            text = await self.generate_response(prompt, retry_callback, reasoning_effort, call_type, model, budget, guild)
+            if text:
+                yield text
+
+    async def _stream_text(self, prompt: str, call_type: str, checks: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        stream_response 的累積版本：每次產出目前為止的完整文字 (已整理格式並限制長度)。
+        串流結束後才能檢查整段內容；不合格時最後再產出一次修正後的全文。
+        有產出過文字時，最後一次產出必定是檢查後的定稿；空字串表示整段作廢，呼叫端應改用替代訊息。
+        """
+        text = shown = ""
+        async for chunk in self.stream_response(prompt, call_type=call_type, **kwargs):
+            text += chunk
+            cleaned = self.response_filter.clean(text, call_type)
+            if cleaned and cleaned != shown:
+                shown = cleaned
+                yield shown
+        final = await self._finish_response(text, prompt, call_type, kwargs.get("retry_callback"), kwargs.get("budget"), **(checks or {}))
+        if final != shown:
+            yield final
+
+    async def _notify(self, retry_callback: Optional[Callable], **info):
+        """通知玩家 AI 需要等待 (排隊位置 / 預估秒數)；callback 失敗不影響生成"""
+        if not retry_callback:
+            return
+        try:
+            if inspect.iscoroutinefunction(retry_callback):
+                await retry_callback(**info)
+            else:
+                retry_callback(**info)
+        except Exception as cb_e:
+            logger.warning(f"Retry callback failed: {cb_e}")
+
+    async def _generate_with_retries(self, prompt: str, retry_callback: Optional[Callable], reasoning_effort: str, call_type: str = "other", model: Optional[str] = None,
+                                     guild: Optional[Hashable] = None) -> str:
         # Define the generation task based on provider
         async def task():
-            if self.provider == 'ollama':
-                return await self._generate_with_ollama(prompt, reasoning_effort=reasoning_effort)
+            if self._backend is not None:
+                return await self._backend(prompt, reasoning_effort=reasoning_effort)
+            if self.provider == 'gateway':
+                return await self._generate_with_gateway(prompt, reasoning_effort=reasoning_effort, call_type=call_type, model=model, guild=guild)
+            elif self.provider == 'ollama':
+                return await self._generate_with_ollama(prompt, reasoning_effort=reasoning_effort, call_type=call_type, model=model)
             elif self.provider == 'gemini-api':
-                return await self._generate_with_gemini_api(prompt)
+                return await self._generate_with_gemini_api(prompt, call_type=call_type)
             elif self.provider == 'gemini-cli' or self.provider == 'gemini':
-                return await self._generate_with_gemini_cli(prompt)
+                return await self._generate_with_gemini_cli(prompt, call_type=call_type)
             else:
                 logger.warning(f"Unknown provider: {self.provider}, defaulting to Gemini CLI")
-                return await self._generate_with_gemini_cli(prompt)
+                return await self._generate_with_gemini_cli(prompt, call_type=call_type)
 
         # Retry logic with Rate Limiting
         max_retries = 3
         base_delay = 4.0 # Seconds
 
+        # Proactive Rate Limiting (providers with a configured RPM, see RATE_LIMITS)
+        limited = RATE_LIMITS.get(self.provider, (0.0, 0))[0] > 0
+        adaptive = limited and isinstance(self.rate_limiter, AdaptiveRateLimiter)
+
         for attempt in range(max_retries + 1):
             try:
-                # Proactive Rate Limiting (only for Gemini)
-                if 'gemini' in self.provider:
-                    await self.rate_limiter.acquire()
+                if limited:
+                    if attempt == 0 and adaptive:
+                        position, eta = self.rate_limiter.estimate_wait(guild)
+                        if eta >= QUEUE_NOTICE_SECONDS:
+                            await self._notify(retry_callback, position=position, wait=eta)
+                    wait_started = time.perf_counter()
+                    with tracer.span("llm.rate_limit_wait", "rate_limit"):
+                        await self.rate_limiter.acquire(estimate_tokens(prompt), guild=guild)
+                    metrics.rate_limiter_wait.observe(time.perf_counter() - wait_started)
 
-                return await task()
+                try:
+                    with tracer.span("llm.generate", "llm", provider=self.provider, attempt=attempt, effort=reasoning_effort, model=model or "primary"):
+                        result = await task()
+                finally:
+                    self._last_activity = time.monotonic()
+                if adaptive and result:
+                    self.rate_limiter.on_success(estimate_tokens(result))
+                return result
 
             except (RateLimitError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retry_after = e.retry_after if isinstance(e, RateLimitError) else None
+                if adaptive and isinstance(e, RateLimitError):
+                    self.rate_limiter.on_rate_limited(retry_after)
                 if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
+                    # 供應商指定的 Retry-After 比指數退避長時以它為準
+                    delay = max(base_delay * (2 ** attempt), retry_after or 0.0)
                     logger.warning(f"Connection/Rate limit error: {e}. Retrying in {delay}s... (Attempt {attempt+1}/{max_retries})")
+                    await self._notify(retry_callback, wait=delay)
 
-                    if retry_callback:
-                        try:
-                            # Invoke callback to notify user, but don't fail if it fails
-                            if inspect.iscoroutinefunction(retry_callback):
-                                await retry_callback()
-                            else:
-                                retry_callback()
-                        except Exception as cb_e:
-                            logger.warning(f"Retry callback failed: {cb_e}")
-
-                    await asyncio.sleep(delay)
+                    await tracer.sleep(delay, "llm.retry_backoff")
                 else:
                     logger.error(f"Operation failed after {max_retries} retries: {e}")
                     return ""
@@ -299,22 +1280,53 @@ class AIManager:
                 return ""
         return ""
 
-    def _truncate_response(self, text: str) -> str:
-        """截斷過長的 AI 回應，符合 Discord 訊息限制"""
-        if len(text) > MAX_RESPONSE_LENGTH:
-            return text[:MAX_RESPONSE_LENGTH - 3] + "..."
-        return text
+    async def _finish_response(self, response: str, prompt: str, call_type: str, retry_callback: Optional[Callable] = None, budget: Optional[Any] = None, **checks) -> str:
+        """
+        後處理 AI 回應 (response_filters)：整理格式、限制長度並檢查問題用語。
+        不合格時以低思考程度附上修正說明重新生成一次 (預算吃緊時略過)，仍不合格就刪掉有問題的句子。
+        checks: 傳給 ResponseFilter.check 的 first_speaker / role / context。
+        """
+        if not response:
+            return ""
+        result = self.response_filter.check(response, call_type, **checks)
+        if result.ok:
+            return result.text
+        for problem in result.problems:
+            metrics.response_rejections.inc(call_type=call_type, reason=problem)
+        logger.info(f"Rejected {call_type} response ({', '.join(result.problems)}): {result.text[:40]!r}")
+
+        if budget is None or budget.allow("reask"):
+            hints = "\n".join(REASK_HINTS[problem] for problem in result.problems)
+            retry = await self.generate_response(f"{prompt}\n\n⚠️ 上一次的回答不合格，請重新生成。{hints}", retry_callback=retry_callback, reasoning_effort="low",
+                                                 call_type=call_type, model=self.effort_router.small_model or None, budget=budget)
+            if retry:
+                second = self.response_filter.check(retry, call_type, **checks)
+                if second.ok:
+                    return second.text
+                result = second
+        return result.without_problems()
 
     async def generate_role_template(self, player_count: int, existing_roles: List[str], retry_callback: Optional[Callable] = None) -> List[str]:
         """
         Generates a balanced role list for a given player count.
         """
+        if self.gateway_url:
+            # 板子快取由閘道統一維護
+            try:
+                data = await self._gateway_call("/v1/role_template", {"player_count": player_count, "existing_roles": existing_roles}, "role_template")
+            except (RateLimitError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"LLM gateway role template failed: {e}")
+                return []
+            return data.get("roles", [])
+
         # Create cache key
         cache_key = (player_count, tuple(sorted(existing_roles)))
 
         if cache_key in self.role_template_cache:
+            metrics.cache_requests.inc(cache="role_template", result="hit")
             self.role_template_cache.move_to_end(cache_key)
             return self.role_template_cache[cache_key]
+        metrics.cache_requests.inc(cache="role_template", result="miss")
 
         prompt = f"""
         請為 {player_count} 名玩家設計一個平衡的狼人殺配置。
@@ -329,7 +1341,7 @@ class AIManager:
         - 回傳內容必須是純 JSON 陣列，不可包含任何解釋、說明或其他文字。
         """
 
-        response_text = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="low")
+        response_text = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="low", call_type="role_template")
         try:
             clean_text = response_text.replace("```json", "").replace("```", "").strip()
             # Try to find JSON array if extra text exists
@@ -347,7 +1359,7 @@ class AIManager:
                     self.role_template_cache[cache_key] = roles
                     if len(self.role_template_cache) > 100:
                         self.role_template_cache.popitem(last=False)
-                    self._save_cache()
+                    await self._persist_template(cache_key, roles)
                     return roles
             if response_text: # Only print invalid if we actually got a response
                 logger.warning(f"Invalid generated roles for {player_count} players: {roles}")
@@ -356,16 +1368,14 @@ class AIManager:
             logger.error(f"Role generation failed: {e}\nResponse: {response_text}")
             return []
 
-    async def generate_narrative(self, event_type: str, context: str, language: str = "zh-TW", retry_callback: Optional[Callable] = None) -> str:
-        """
-        Generates flavor text for game events.
-        """
-        # Ensure context is hashable and limit cache size
-        cache_key = (event_type, str(context), language)
-        if cache_key in self.narrative_cache:
-            # Move to end to mark as recently used
-            self.narrative_cache.move_to_end(cache_key)
-            return self.narrative_cache[cache_key]
+    def is_idle(self) -> bool:
+        """目前沒有進行中的 LLM 請求 (含排隊等速率限制與重試退避中的請求)，速率限制也沒有人在等"""
+        return self._inflight == 0 and self.rate_limiter.waiting == 0
+
+    def _narrative_prompt(self, event_type: str, context: str) -> str:
+        placeholder_hint = ""
+        if "{P1}" in context:
+            placeholder_hint = "\n        - 詳細資訊中的 {P1}、{P2} 等代號代表玩家名稱；如需提及請原樣保留代號，不要自行替換。"
 
         prompt = f"""
         你是一個狼人殺遊戲的主持人（上帝）。
@@ -382,66 +1392,174 @@ class AIManager:
         - 你只能根據下方提供的事件資訊生成旁白。
         - 嚴禁透露任何玩家的身分、角色、或未公開的遊戲資訊。
         - 嚴禁編造未發生的事件或添加下方未提及的細節。
-        - 只描述氛圍和情境，不要加入具體的遊戲判斷。
+        - 只描述氛圍和情境，不要加入具體的遊戲判斷。{placeholder_hint}
 
         事件類型：{event_type}
         詳細資訊：{context}
         """
-        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="low")
+        return prompt
+
+    async def _generate_narrative_text(self, event_type: str, context: str, retry_callback: Optional[Callable] = None, budget: Optional[Any] = None) -> str:
+        prompt = self._narrative_prompt(event_type, context)
+        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="low", call_type="narrative", budget=budget)
+        return await self._finish_response(response, prompt, "narrative", retry_callback, budget, context=context)
+
+    def _add_narrative_variant(self, cache_key: Tuple[str, str, str], text: str) -> bool:
+        variants = self.narrative_cache.get(cache_key)
+        if variants is None:
+            variants = []
+            self.narrative_cache[cache_key] = variants
+        self.narrative_cache.move_to_end(cache_key)
+
+        # Evict oldest if over limit
+        if len(self.narrative_cache) > 100:
+            self.narrative_cache.popitem(last=False)
+
+        if text in variants or len(variants) >= NARRATIVE_VARIANTS:
+            return False
+        variants.append(text)
+        return True
+
+    async def generate_narrative(self, event_type: str, context: str, language: str = "zh-TW", retry_callback: Optional[Callable] = None, names: Iterable[str] = (),
+                                 budget: Optional[Any] = None, cached_only: bool = False) -> str:
+        """
+        Generates flavor text for game events.
+        names: 玩家名稱/提及字串，會被正規化為佔位符以便同類事件共用旁白。
+        cached_only: 只使用已快取的旁白 (預算吃緊時)，沒有快取則回傳空字串。
+        """
+        # Ensure context is hashable and normalize player names into placeholders
+        template, slots = normalize_context(str(context), names)
+        response = await self.narrative_variant(event_type, template, language, retry_callback=retry_callback, budget=budget, cached_only=cached_only)
+        return render(response, slots) if response else response
 
-        if response:
-            response = self._truncate_response(response)
-            self.narrative_cache[cache_key] = response
-            # Evict oldest if over limit
-            if len(self.narrative_cache) > 100:
-                self.narrative_cache.popitem(last=False)
+    async def stream_narrative(self, event_type: str, context: str, language: str = "zh-TW", retry_callback: Optional[Callable] = None, names: Iterable[str] = (),
+                               budget: Optional[Any] = None, cached_only: bool = False) -> AsyncIterator[str]:
+        """
+        generate_narrative 的串流版本，每次產出目前為止的完整旁白 (已代回玩家名稱)。
+        快取命中、只用快取或經由閘道時整段產出一次；串流生成的旁白完成後，只有通過檢查的定稿會寫入快取。
+        最後產出空字串表示旁白被作廢 (已顯示的部分應改回系統訊息)。
+        """
+        template, slots = normalize_context(str(context), names)
+        cache_key = (event_type, template, language)
+        if self.gateway_url or cached_only or self.narrative_cache.get(cache_key):
+            response = await self.narrative_variant(event_type, template, language, retry_callback=retry_callback, budget=budget, cached_only=cached_only)
+            if response:
+                yield render(response, slots)
+            return
 
+        metrics.cache_requests.inc(cache="narrative", result="miss")
+        prompt = self._narrative_prompt(event_type, template)
+        final = ""
+        async for final in self._stream_text(prompt, "narrative", {"context": template}, retry_callback=retry_callback, reasoning_effort="low", budget=budget):
+            yield render(final, slots)
+        # 串流中途的片段未經檢查，只有最後的定稿可以寫入快取
+        if final and self._add_narrative_variant(cache_key, final):
+            await self._persist_narratives()
+
+    async def narrative_variant(self, event_type: str, template: str, language: str = "zh-TW", retry_callback: Optional[Callable] = None,
+                                budget: Optional[Any] = None, cached_only: bool = False) -> str:
+        """取得已正規化模板的一個旁白變體 (含佔位符)，快取未命中時才呼叫 LLM"""
+        if self.gateway_url:
+            # 旁白語料庫由閘道統一維護
+            payload = {"event_type": event_type, "template": template, "language": language}
+            if cached_only:
+                payload["cached_only"] = True
+            try:
+                data = await self._gateway_call("/v1/narrative", payload, "narrative")
+            except (RateLimitError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"LLM gateway narrative failed: {e}")
+                return ""
+            return data.get("text", "")
+
+        cache_key = (event_type, template, language)
+        variants = self.narrative_cache.get(cache_key)
+        metrics.cache_requests.inc(cache="narrative", result="hit" if variants else "miss")
+        if variants:
+            # Move to end to mark as recently used
+            self.narrative_cache.move_to_end(cache_key)
+            return random.choice(variants)
+        if cached_only:
+            return ""
+
+        response = await self._generate_narrative_text(event_type, template, retry_callback=retry_callback, budget=budget)
+        if response and self._add_narrative_variant(cache_key, response):
+            await self._persist_narratives()
         return response
 
-    async def get_ai_action(self, role: str, game_context: str, valid_targets: List[str], speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None) -> str:
+    def _next_warmup_template(self) -> Optional[Tuple[str, str, str]]:
+        """找出變體數不足的模板：先補預設事件，再補實際出現過的模板"""
+        for event_type, context in WARMUP_EVENTS:
+            key = (event_type, context, "zh-TW")
+            if len(self.narrative_cache.get(key, [])) < NARRATIVE_VARIANTS:
+                return key
+        for key, variants in self.narrative_cache.items():
+            if len(variants) < NARRATIVE_VARIANTS:
+                return key
+        return None
+
+    async def warm_narrative(self) -> bool:
+        """生成一個旁白變體。回傳 False 表示沒有需要補充的模板或生成失敗。"""
+        key = self._next_warmup_template()
+        if key is None:
+            return False
+
+        event_type, template, _language = key
+        response = await self._generate_narrative_text(event_type, template)
+        if response and self._add_narrative_variant(key, response):
+            await self._persist_narratives()
+            return True
+        return False
+
+    async def run_narrative_warmup(self, interval: float = NARRATIVE_WARMUP_INTERVAL):
+        """背景預熱工作：LLM 閒置時逐一補足旁白語料庫，讓大部分通告不需即時呼叫"""
+        if self.gateway_url:
+            logger.info("Narrative warm-up is handled by the LLM gateway.")
+            return
+        logger.info("Narrative warm-up started.")
+        while True:
+            await asyncio.sleep(interval)
+            if not self.is_idle():
+                continue
+            try:
+                await self.warm_narrative()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Narrative warm-up failed: {e}")
+
+    async def get_ai_action(self, role: str, game_context: str, valid_targets: List[str], speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None, belief_summary: Optional[str] = None, verify: Optional[Callable[[str], Optional[str]]] = None, budget: Optional[Any] = None) -> str:
         """
         Decides an action for an AI player.
+        belief_summary: 身分信念追蹤的精簡摘要；提供時只附上最近幾行發言以節省 token。
+        verify: 模型串接時檢查小模型草稿 (例如 ai_policies.draft_disagreement)，回傳 None 表示採用，否則回傳升級原因。
+        budget: 本局的 AI 預算 (ai_budget.AIBudget)。
         """
-        strategy_info = ROLE_STRATEGIES.get(role, {})
-        action_guide = strategy_info.get("action_guide", "")
-        voting_guide = strategy_info.get("voting_guide", "")
-        reasoning_guide = strategy_info.get("reasoning_guide", "")
-
-        history_text = ""
-        if speech_history:
-            history_text = "\n本輪發言/討論紀錄：\n" + "\n".join(speech_history)
+        history_prefix, history = "", speech_history or []
+        if belief_summary:
+            history_prefix = f"\n局勢摘要（根據死亡、票型與起跳推算）：{belief_summary}"
+            history = history[-BELIEF_HISTORY_LINES:]
+            if history:
+                history_prefix += "\n最近發言紀錄：\n"
+        elif history:
+            history_prefix = "\n本輪發言/討論紀錄：\n"
 
         # Determine if this is a voting phase or night action
         is_voting = "投票" in game_context
-        phase_guide = voting_guide if is_voting else action_guide
-        phase_label = "投票決策" if is_voting else "夜晚行動決策"
+        template = prompt_library.action_template(role, is_voting)
+        prompt = self._assemble_prompt("action", template, history=history, history_prefix=history_prefix,
+                                       game_context=game_context, valid_targets=valid_targets)
+
+        kind = "vote" if is_voting else "action"
+        route = self.effort_router.route(kind, game_context, role)
+        if self.cascade_model:
+            response = await self._cascade(kind, prompt, "action", route, retry_callback,
+                                           lambda draft: check_draft(self._parse_action(draft), valid_targets, verify), budget)
+        else:
+            response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort=route.effort, call_type="action", model=route.model, budget=budget)
+        return self._parse_action(response)
 
-        prompt = f"""
-# {phase_label}
-你正在玩狼人殺。你的身分是：【{role}】。
-當前局勢：{game_context}
-你可以選擇的目標（玩家編號）有：{valid_targets}。
-{history_text}
-
-# 決策分析（僅供內部推理，不要輸出分析過程）
-請在心中完成以下分析步驟，然後只輸出最終的目標編號：
-{reasoning_guide}
-
-# 策略指導
-{phase_guide}
-
-⚠️ 行動規則（必須遵守）：
-- 你「只能」從上方列出的「可選擇目標」中選擇一個編號。
-- 不要選擇不在目標列表中的編號。
-- 你只能依據上方提供的「當前局勢」和「發言紀錄」做出判斷，不可虛構理由。
-- 如果資訊不足以做出判斷，請回傳 'no'。
-
-# 輸出格式
-請只回傳你選擇的目標編號（一個數字）。
-如果你決定不行動、空守或棄票，請回傳 'no'。
-只回傳結果，不要解釋。
-"""
-        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="high")
+    def _parse_action(self, response: str) -> str:
+        """從回應中取出目標編號，或 'no'"""
         clean = response.strip().lower().replace(".", "")
 
         if "no" in clean:
@@ -452,162 +1570,92 @@ class AIManager:
             return match.group()
         return "no"
 
+    async def _cascade(self, kind: str, prompt: str, call_type: str, route: Route, retry_callback: Optional[Callable],
+                       review: Callable[[str], Optional[str]], budget: Optional[Any] = None) -> str:
+        """小模型先起草；review 通過 (回傳 None) 就採用，否則以路由的思考程度交給主要模型"""
+        started = time.perf_counter()
+        draft = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="low", call_type=call_type, model=self.cascade_model, budget=budget)
+        reason = review(draft)
+        if reason is None:
+            self.cascade_stats.record(kind, None, time.perf_counter() - started)
+            return draft
+
+        logger.debug(f"Cascade {kind}: escalating draft {draft[:40]!r} ({reason})")
+        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort=route.effort, call_type=call_type, budget=budget)
+        self.cascade_stats.record(kind, reason, time.perf_counter() - started)
+        return response
+
+    def _assemble_prompt(self, call_type: str, template: PromptTemplate, **values) -> str:
+        """依目前供應商的 token 預算組出提示詞，有刪減時記錄被刪掉的區段"""
+        budget = PROMPT_BUDGETS.get(self.provider, 0)
+        assembled: AssembledPrompt = assemble(template, budget, **values)
+        for section, tokens in assembled.dropped.items():
+            self.prompt_stats[section] = self.prompt_stats.get(section, 0) + tokens
+            metrics.prompt_sections_dropped.inc(call_type=call_type, section=section)
+        over_budget = 0 < budget < assembled.tokens
+        if assembled.dropped or over_budget:
+            dropped = ", ".join(f"{name}={tokens}" for name, tokens in assembled.dropped.items()) or "nothing"
+            lines = f" ({assembled.history_dropped} history lines)" if assembled.history_dropped else ""
+            log = logger.warning if over_budget else logger.info
+            log(f"Prompt for {call_type} fitted to ~{assembled.tokens} tokens (budget {budget}, {self.provider}): "
+                f"dropped {dropped}{lines}")
+        return assembled.text
+
     def _get_phase_name(self, game_context: str) -> str:
         """
         Determines the game phase (early/mid/late) from the game context string.
         """
-        day_match = DAY_PATTERN.search(game_context)
-        if day_match:
-            day = int(day_match.group(1))
-            if day <= 2:
-                return "early"
-            elif day <= 4:
-                return "mid"
-            else:
-                return "late"
-        return "early"
+        return phase_for_context(game_context)
 
-    async def get_ai_speech(self, player_id: int, role: str, game_context: str, speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None) -> str:
+    async def get_ai_speech(self, player_id: int, role: str, game_context: str, speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None, belief_summary: Optional[str] = None,
+                            budget: Optional[Any] = None, brief: bool = False) -> str:
         """
         Generates a speech for an AI player.
         speech_history: List of strings (previous speeches in the round).
+        belief_summary: 身分信念追蹤的精簡摘要 (僅供內部推理)。
+        brief: 要求較短的發言 (預算吃緊時)。
         """
-        is_first_speaker = not bool(speech_history)
-
-        strategy_info = ROLE_STRATEGIES.get(role, {})
-        speech_style = strategy_info.get("speech_style", "自然")
-        objective = strategy_info.get("objective", "獲得勝利")
-        speech_guide = strategy_info.get("speech_guide", "")
-        reasoning_guide = strategy_info.get("reasoning_guide", "")
-
-        # Phase-specific strategy
-        phase = self._get_phase_name(game_context)
-        phase_guides = strategy_info.get("phase_guide", {})
-        current_phase_guide = phase_guides.get(phase, "")
-        phase_labels = {"early": "前期（Day 1-2）", "mid": "中期（Day 3-4）", "late": "殘局（Day 5+）"}
-        phase_label = phase_labels.get(phase, "前期")
-
-        # Construct Dynamic Logic based on position
-        if is_first_speaker:
-            scene_restriction = """
-# 當前場景限制（最重要的一點）
-**現在輪到你發言。你是本輪的「第 1 位」發言者（首置位）。**
-**在你之前「沒有任何玩家」發過言。**
-
-**嚴禁捏造資訊**：你只能根據上方「角色設定」所提供的資訊發言。
-禁止聲稱你擁有任何未明確列出的查驗結果、守護記錄、或其他資訊。
-如果你的身分沒有任何夜晚資訊可報，就誠實表達「目前沒資訊」。
-"""
-            logic_restriction = """
-# 思考邏輯與限制
-1. **絕對禁止** 說「我同意前面玩家的說法」或「聽到有人說...」，因為你是第一個，這會讓你產生幻覺。
-2. 因為你是第一個，場上還沒有邏輯資訊。請根據你的身分選擇策略：
-   - **如果你有夜晚資訊（神職）**：可以選擇起跳報資訊，或者隱藏身分先觀察。
-   - **如果你沒有夜晚資訊（平民）**：針對昨晚的死亡情況做評論，表達你的初步判斷。不要只是說「沒資訊」就結束——至少對局勢提出一個觀點或問題。
-   - **如果你是狼人**：選擇偽裝策略。可以發起一個話題引導討論方向，或者低調模仿平民。
-3. 你的目標是：符合你所屬陣營的最大利益，並引導局勢（或隱藏自己）。
-"""
-        else:
-            history_text = "\n".join(speech_history) if speech_history else ""
-            scene_restriction = f"""
-# 當前場景限制
-在你之前已經有 {len(speech_history) if speech_history else 0} 位玩家發言了。
-以下是他們的發言紀錄：
-{history_text}
-"""
-            logic_restriction = f"""
-# 思考邏輯與限制
-1. 你必須參考前面玩家的發言內容。具體做法：
-   - 選擇 1-2 位前面發言的玩家，引用他們的觀點（使用「X 號說...」的格式）。
-   - 明確表達你是同意還是反對，並給出理由。
-2. 你可以選擇：
-   - 站邊：支持某位玩家的邏輯，攻擊另一位。
-   - 質疑：指出某位玩家發言中的矛盾或可疑之處。
-   - 辯解：如果之前有人懷疑你，回應他的質疑。
-   - 歸票：明確說出你認為應該票誰。
-3. 你的發言必須有「落點」——最後要給出一個明確的態度或結論。
-4. 你的目標是：符合你所屬陣營的最大利益，並引導局勢（或隱藏自己）。
-
-**嚴禁捏造資訊**：你只能引用上方「發言紀錄」中實際出現的內容。
-禁止聲稱任何玩家說了紀錄中沒有的話。
-禁止虛構查驗結果、守護資訊、或任何未明確提供的遊戲事件。
-"""
-
-        prompt = f"""
-# 角色設定
-你是狼人殺遊戲中的玩家，你的編號是 {player_id} 號。
-你的真實身分是【{role}】。
-{game_context}
-
-你的發言風格：{speech_style}
-你的主要目標：{objective}
+        if belief_summary:
+            game_context = f"{game_context}\n你的內心判斷（不要直接唸出數字）：{belief_summary}"
 
-# 角色策略
-{speech_guide}
-
-# 當前階段策略（{phase_label}）
-{current_phase_guide}
-
-{scene_restriction}
-
-# 思考步驟（在心中完成以下分析，不要將分析過程輸出到發言中）
-{reasoning_guide}
-綜合以上分析，決定你的發言策略，然後直接輸出你的發言內容。
-
-# 你的發言任務
-請進行發言（80-120字），語氣要自然，像真人玩家一樣（可以使用口語、語助詞）。
-你的發言必須包含至少一個具體的觀點或判斷，不要空泛地划水。
-嚴禁暴露你是 AI。
-
-# ⚠️ 防止幻覺規則（最高優先級）
-- 你「只能」使用本提示中明確提供的資訊。
-- 不可捏造任何遊戲事件、玩家發言、查驗結果或行動。
-- 如果你不確定某件事，請說「我不確定」或「我沒有資訊」，而非編造內容。
-
-{logic_restriction}
+        # 依角色、階段與發言位置 (首置位/後置位) 取用預先編譯的模板
+        phase = phase_for_context(game_context)
+        length = BRIEF_SPEECH_LENGTH if brief else SPEECH_LENGTH
+        if speech_history:
+            template = prompt_library.speech_template(role, phase, first_speaker=False)
+            prompt = self._assemble_prompt("speech", template, history=speech_history, player_id=player_id,
+                                           game_context=game_context, speaker_count=len(speech_history), speech_length=length)
+        else:
+            template = prompt_library.speech_template(role, phase, first_speaker=True)
+            prompt = self._assemble_prompt("speech", template, player_id=player_id, game_context=game_context, speech_length=length)
 
-請開始你的發言（只輸出發言內容，不要輸出分析過程）：
-"""
-        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="high")
-        return self._truncate_response(response)
+        route = self.effort_router.route("speech", game_context, role)
+        if self.cascade_model and phase == "early":
+            # 前期發言交給小模型，太短才升級
+            response = await self._cascade("speech", prompt, "speech", route, retry_callback, check_speech_draft, budget)
+        else:
+            response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort=route.effort, call_type="speech", model=route.model, budget=budget)
+        return await self._finish_response(response, prompt, "speech", retry_callback, budget, first_speaker=not speech_history, role=role)
 
-    async def get_ai_last_words(self, player_id: str, role: str, game_context: str, speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None) -> str:
+    async def get_ai_last_words(self, player_id: str, role: str, game_context: str, speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None, budget: Optional[Any] = None) -> str:
         """
         Generates a last words message for an AI player who has just been voted out.
         """
-        strategy_info = ROLE_STRATEGIES.get(role, {})
-        speech_style = strategy_info.get("speech_style", "自然")
-        objective = strategy_info.get("objective", "獲得勝利")
-
-        prompt = f"""
-# 角色設定
-你是狼人殺遊戲中的玩家，你的編號是 {player_id} 號。
-你的真實身分是【{role}】。
-{game_context}
-
-# 當前狀況
-**你剛剛被投票處決了。**
-現在是你發表「遺言」的時間。這是你對場上玩家說的最後一句話。
-
-你的發言風格：{speech_style}
-你的主要目標：{objective}
-
-# 思考邏輯
-1. 根據你的陣營決定策略：
-   - **好人陣營**：誠懇地告訴大家你是好人，提醒大家注意誰是狼，或者分析剛才的票型。
-   - **狼人陣營**：偽裝成好人被誤殺的樣子，表現出憤怒、委屈，或者繼續誤導好人去推別人。
-2. 參考剛才的局勢（誰投了你？誰救了你？）。
-3. 這是最後的機會，讓大家相信你的身分。
-
-# 你的任務
-請簡短地發表遺言（30-50字）。
-語氣要符合你的角色設定（{speech_style}）。
-嚴禁暴露你是 AI。
-
-請直接輸出遺言內容：
-"""
-        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort="high")
-        return self._truncate_response(response)
+        prompt, route = self._last_words_request(player_id, role, game_context)
+        response = await self.generate_response(prompt, retry_callback=retry_callback, reasoning_effort=route.effort, call_type="last_words", model=route.model, budget=budget)
+        return await self._finish_response(response, prompt, "last_words", retry_callback, budget, role=role)
+
+    async def stream_ai_last_words(self, player_id: str, role: str, game_context: str, speech_history: Optional[List[str]] = None, retry_callback: Optional[Callable] = None,
+                                   budget: Optional[Any] = None) -> AsyncIterator[str]:
+        """get_ai_last_words 的串流版本，每次產出目前為止的完整遺言"""
+        prompt, route = self._last_words_request(player_id, role, game_context)
+        async for text in self._stream_text(prompt, "last_words", {"role": role}, retry_callback=retry_callback, reasoning_effort=route.effort, model=route.model, budget=budget):
+            yield text
+
+    def _last_words_request(self, player_id: str, role: str, game_context: str) -> Tuple[str, Route]:
+        prompt = self._assemble_prompt("last_words", prompt_library.last_words_template(role),
+                                       player_id=player_id, game_context=game_context)
+        return prompt, self.effort_router.route("last_words", game_context, role)
 
 # Global instance
 ai_manager = AIManager()
@@ -0,0 +1,261 @@
+# ai_policies.py
+# AI 夜晚行動策略層：每個角色都有一個低成本的規則策略 (由 ROLE_STRATEGIES 的 action_guide 推導)，
+# 只有在規則信心不足且本局 LLM 預算允許時才升級呼叫 LLM。
+
+import os
+import re
+import time
+import random
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from ai_strategies import ROLE_STRATEGIES
+from game_data import WOLF_FACTION
+
+logger = logging.getLogger(__name__)
+
+# heuristic: 只用規則 / hybrid: 規則優先，信心不足時升級 LLM / llm: 全部交給 LLM (原行為)
+POLICY_MODES = ("heuristic", "hybrid", "llm")
+DEFAULT_POLICY_MODE = "llm"
+DEFAULT_CONFIDENCE_THRESHOLD = 0.6
+DEFAULT_LLM_BUDGET = 30 # 每局 hybrid 模式最多升級幾次
+
+# 可被「起跳」宣稱的神職
+CLAIMABLE_ROLES = ("預言家", "女巫", "獵人", "守衛", "白痴", "騎士")
+CLAIM_PATTERN = re.compile(r'我(?:是|就是|才是)\s*(' + "|".join(CLAIMABLE_ROLES) + r')')
+# 發言紀錄格式："名稱: 內容"、"名稱 (遺言): 內容" 或 "名稱(N號): 內容"
+SPEAKER_PATTERN = re.compile(r'^(?P<name>.+?)(?:\s*\(遺言\)|\(\d+號\))?:\s')
+
+# action_guide 中代表「沒把握就不行動」的字句
+HOLD_MARKERS = ("先留著", "可以不開槍")
+# action_guide 中代表「優先針對發言少的深水牌」的字句
+QUIET_MARKER = "發言少"
+# 信念追蹤的狼人機率高於此值時，「沒把握就不行動」的角色也會出手
+BELIEF_ACT_THRESHOLD = 0.75
+# 模型串接：規則信心高於此值時，小模型的草稿必須與規則選擇相同
+CASCADE_AGREE_CONFIDENCE = 0.8
+
+
+@dataclass
+class PolicyContext:
+    """規則策略所需的局勢資訊 (由 bot 或模擬器建立)"""
+    role: str
+    action: str                     # guard / kill / check / poison / shoot
+    valid_targets: List[int]
+    actor_id: Optional[int] = None
+    teammates: Set[int] = field(default_factory=set)
+    claims: Dict[int, str] = field(default_factory=dict)       # 玩家編號 -> 宣稱的身分
+    speech_counts: Dict[int, int] = field(default_factory=dict)  # 玩家編號 -> 發言次數
+    last_target: Optional[int] = None
+    wolf_probs: Dict[int, float] = field(default_factory=dict)   # 玩家編號 -> 狼人機率 (信念追蹤)
+
+
+@dataclass
+class PolicyDecision:
+    target: str         # 玩家編號字串或 'no'
+    confidence: float
+    source: str         # heuristic / llm
+    reason: str = ""
+
+
+class RoleRule:
+    """由單一角色的 action_guide 文字推導出的規則"""
+    def __init__(self, role: str, action_guide: str):
+        self.role = role
+        found = [(action_guide.find(r), r) for r in CLAIMABLE_ROLES if r in action_guide and r != role]
+        self.priority_roles = [r for _, r in sorted(found)]
+        self.hold = any(m in action_guide for m in HOLD_MARKERS)
+        self.prefer_quiet = QUIET_MARKER in action_guide
+
+
+RULES: Dict[str, RoleRule] = {
+    role: RoleRule(role, info.get("action_guide", "")) for role, info in ROLE_STRATEGIES.items()
+}
+
+
+def parse_speech_history(speech_history: Iterable[str], name_to_id: Dict[str, int]):
+    """從發言紀錄解析身分宣稱與每位玩家的發言次數"""
+    claims: Dict[int, str] = {}
+    counts: Dict[int, int] = {}
+    for line in speech_history:
+        match = SPEAKER_PATTERN.match(line)
+        if not match:
+            continue
+        pid = name_to_id.get(match.group("name"))
+        if pid is None:
+            continue
+        counts[pid] = counts.get(pid, 0) + 1
+        claim = CLAIM_PATTERN.search(line, match.end())
+        if claim:
+            claims[pid] = claim.group(1)
+    return claims, counts
+
+
+def heuristic_decision(ctx: PolicyContext) -> PolicyDecision:
+    """依角色規則給出目標與信心值"""
+    rule = RULES.get(ctx.role) or RoleRule(ctx.role, "")
+    candidates = [t for t in ctx.valid_targets if t not in ctx.teammates]
+    if ctx.action == "guard":
+        candidates = [t for t in candidates if t != ctx.last_target] # 不能連續兩晚守同一人
+    else:
+        candidates = [t for t in candidates if t != ctx.actor_id]
+
+    if not candidates:
+        return PolicyDecision("no", 1.0, "heuristic", "no legal target")
+
+    # 1. 有人宣稱自己的身分 (對跳)：我是真的，對方必為假
+    if ctx.action in ("check", "poison", "shoot"):
+        counter = [t for t in candidates if ctx.claims.get(t) == ctx.role]
+        if counter:
+            return PolicyDecision(str(counter[0]), 0.8, "heuristic", "counter-claim")
+
+    # 2. action_guide 中列出的優先身分 (例如狼人優先刀預言家/女巫，守衛優先守預言家)
+    for wanted in rule.priority_roles:
+        claimed = [t for t in candidates if ctx.claims.get(t) == wanted]
+        if claimed:
+            return PolicyDecision(str(claimed[0]), 0.8, "heuristic", f"claimed {wanted}")
+
+    # 3. 沒把握就不行動 (女巫毒藥、獵人開槍)，除非信念追蹤已高度確信某人是狼
+    if rule.hold:
+        if ctx.wolf_probs:
+            suspect = max(candidates, key=lambda t: ctx.wolf_probs.get(t, 0.0))
+            prob = ctx.wolf_probs.get(suspect, 0.0)
+            if prob >= BELIEF_ACT_THRESHOLD:
+                return PolicyDecision(str(suspect), prob, "heuristic", "belief")
+        return PolicyDecision("no", 0.7, "heuristic", "hold")
+
+    # 4. 優先針對發言少的深水牌 (預言家查驗)
+    if rule.prefer_quiet and ctx.speech_counts:
+        fewest = min(ctx.speech_counts.get(t, 0) for t in candidates)
+        quiet = [t for t in candidates if ctx.speech_counts.get(t, 0) == fewest]
+        confidence = 0.65 if len(quiet) == 1 else 0.4
+        return PolicyDecision(str(random.choice(quiet)), confidence, "heuristic", "quiet player")
+
+    return PolicyDecision(str(random.choice(candidates)), 0.2, "heuristic", "random")
+
+
+def draft_disagreement(ctx: PolicyContext, target: str) -> Optional[str]:
+    """
+    小模型草稿與規則/信念訊號的一致性檢查 (模型串接用)：一致回傳 None，否則回傳原因。
+    ctx.action 可為 "vote" (白天投票)。
+    """
+    is_good = ctx.role not in WOLF_FACTION
+    candidates = [t for t in ctx.valid_targets if t != ctx.actor_id and t not in ctx.teammates]
+    if target == "no":
+        if ctx.action == "vote":
+            # 信念追蹤已高度懷疑某人時，好人不應棄票
+            if is_good and any(ctx.wolf_probs.get(t, 0.0) >= BELIEF_ACT_THRESHOLD for t in candidates):
+                return "abstain"
+            return None
+        return None if heuristic_decision(ctx).target == "no" else "abstain"
+
+    target_id = int(target)
+    if target_id in ctx.teammates:
+        return "teammate"
+    if target_id == ctx.actor_id and ctx.action != "guard":
+        return "self"
+    if ctx.action == "guard" and target_id == ctx.last_target:
+        return "repeat_guard"
+    # 好人的投票/毒/槍不應落在信念上比平均更像好人的玩家
+    if is_good and ctx.wolf_probs and ctx.action in ("vote", "poison", "shoot") and candidates:
+        average = sum(ctx.wolf_probs.get(t, 0.0) for t in candidates) / len(candidates)
+        if ctx.wolf_probs.get(target_id, 0.0) < average:
+            return "belief"
+    if ctx.action != "vote":
+        decision = heuristic_decision(ctx)
+        if decision.confidence >= CASCADE_AGREE_CONFIDENCE and decision.target != target:
+            return "heuristic"
+    return None
+
+
+def heuristic_vote(ctx: PolicyContext) -> PolicyDecision:
+    """
+    不呼叫 LLM 的白天投票 (AI 預算用盡時)：
+    好人投給對跳自己身分的人或信念中最像狼的人，沒有訊號就棄票；狼人投給跳神職的人，否則隨機投非隊友。
+    """
+    candidates = [t for t in ctx.valid_targets if t != ctx.actor_id and t not in ctx.teammates]
+    if not candidates:
+        return PolicyDecision("no", 1.0, "heuristic", "no legal target")
+
+    if ctx.role in WOLF_FACTION:
+        claimed = [t for t in candidates if ctx.claims.get(t) in CLAIMABLE_ROLES]
+        if claimed:
+            return PolicyDecision(str(claimed[0]), 0.7, "heuristic", f"claimed {ctx.claims[claimed[0]]}")
+        return PolicyDecision(str(random.choice(candidates)), 0.2, "heuristic", "random")
+
+    counter = [t for t in candidates if ctx.claims.get(t) == ctx.role]
+    if counter:
+        return PolicyDecision(str(counter[0]), 0.8, "heuristic", "counter-claim")
+    if ctx.wolf_probs:
+        suspect = max(candidates, key=lambda t: ctx.wolf_probs.get(t, 0.0))
+        return PolicyDecision(str(suspect), ctx.wolf_probs.get(suspect, 0.0), "heuristic", "belief")
+    return PolicyDecision("no", 0.5, "heuristic", "no signal")
+
+
+class LLMBudget:
+    """每局可升級呼叫 LLM 的次數"""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def remaining(self) -> int:
+        return max(self.limit - self.used, 0)
+
+    def try_consume(self) -> bool:
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+
+class PolicyEngine:
+    """
+    依模式挑選規則或 LLM 決策，並統計各來源的次數與延遲。
+    """
+    def __init__(self, mode: Optional[str] = None, confidence_threshold: Optional[float] = None, llm_budget: Optional[int] = None):
+        mode = (mode or os.getenv('AI_POLICY_MODE', DEFAULT_POLICY_MODE)).lower()
+        if mode not in POLICY_MODES:
+            logger.warning(f"Unknown AI policy mode: {mode}, defaulting to {DEFAULT_POLICY_MODE}")
+            mode = DEFAULT_POLICY_MODE
+        self.mode = mode
+        self.confidence_threshold = confidence_threshold if confidence_threshold is not None else float(os.getenv('AI_POLICY_CONFIDENCE', DEFAULT_CONFIDENCE_THRESHOLD))
+        self.llm_budget = llm_budget if llm_budget is not None else int(os.getenv('AI_POLICY_LLM_BUDGET', DEFAULT_LLM_BUDGET))
+        self.counts: Dict[str, int] = {"heuristic": 0, "llm": 0}
+        self.latency: Dict[str, float] = {"heuristic": 0.0, "llm": 0.0}
+
+    def new_budget(self) -> LLMBudget:
+        return LLMBudget(self.llm_budget)
+
+    def _record(self, source: str, started: float):
+        self.counts[source] += 1
+        self.latency[source] += time.perf_counter() - started
+
+    async def decide(self, ctx: PolicyContext, llm_call: Callable[[], Awaitable[str]], budget: Optional[LLMBudget] = None) -> PolicyDecision:
+        started = time.perf_counter()
+
+        if self.mode == "llm":
+            target = await llm_call()
+            self._record("llm", started)
+            return PolicyDecision(target, 1.0, "llm")
+
+        decision = heuristic_decision(ctx)
+        if self.mode == "hybrid" and decision.confidence < self.confidence_threshold:
+            if budget is None or budget.try_consume():
+                target = await llm_call()
+                self._record("llm", started)
+                return PolicyDecision(target, 1.0, "llm", f"escalated ({decision.reason})")
+
+        self._record("heuristic", started)
+        return decision
+
+    def summary(self) -> Dict[str, float]:
+        """各來源的呼叫次數與平均延遲 (秒)"""
+        result: Dict[str, float] = {}
+        for source, count in self.counts.items():
+            result[f"{source}_calls"] = count
+            result[f"{source}_avg_latency"] = self.latency[source] / count if count else 0.0
+        return result
+
+# Global instance
+policy_engine = PolicyEngine()
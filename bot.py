@@ -1,4 +1,6 @@
 import os
+import math
+import time
 import asyncio
 import logging
 import discord
@@ -8,10 +10,17 @@ from discord.ext import commands
 from dotenv import load_dotenv
 from random import SystemRandom
 import random
-from typing import Optional, List, Dict, Union, Any, Callable
+from typing import Optional, List, Dict, Tuple, Union, Any, Callable, AsyncIterator
 
 # Modules
 from ai_manager import ai_manager
+from channel_permissions import permission_cache
+from tracing import tracer
+import metrics
+from loop_monitor import LOOP_MONITOR, LoopMonitor
+from ai_policies import CLAIM_PATTERN, PolicyContext, draft_disagreement, heuristic_decision, heuristic_vote, parse_speech_history, policy_engine
+from ai_budget import AIBudget, DEGRADED_SPEECH
+from role_beliefs import RoleBeliefTracker
 from game_data import (
     GAME_TEMPLATES, 
     ROLE_DESCRIPTIONS, 
@@ -22,7 +31,9 @@ from game_data import (
 from game_objects import (
     GameState, 
     AIPlayer, 
-    get_game
+    VoteRound,
+    get_game,
+    games
 )
 
 # 設定日誌
@@ -38,22 +49,72 @@ secure_random = SystemRandom()
 # 載入環境變數
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
+# 是否在 LLM 閒置時於背景預先生成旁白變體
+NARRATIVE_WARMUP = os.getenv('NARRATIVE_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+# 啟動時在背景預先載入 Ollama 模型 (避免第一晚的第一個 AI 呼叫付出冷啟動延遲)
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+# 分片部署：SHARD_COUNT > 0 時使用 AutoShardedBot，SHARD_IDS 指定本程序負責的分片 (由 shard_launcher.py 設定)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_IDS = [int(x) for x in os.getenv('SHARD_IDS', '').split(',') if x.strip()] or None
+# AI 排隊通知 (排隊位置與預估時間) 在同一頻道的最短間隔秒數，避免投票回合每位 AI 各發一則
+QUEUE_NOTICE_INTERVAL = float(os.getenv('QUEUE_NOTICE_INTERVAL', '30'))
+queue_notice_times: Dict[int, float] = {} # 頻道 ID -> 上次排隊通知時間 (monotonic)
+# 串流旁白/遺言時編輯同一則訊息的最短間隔秒數 (Discord 對訊息編輯有速率限制)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
 
 # 設定 Intent (權限)
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-class WerewolfBot(commands.Bot):
+# 每局遊戲只存在於負責該 guild 的程序內 (guild 依 shard 分配)，因此遊戲狀態不需跨程序共享
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+class WerewolfBot(BotBase):
     def __init__(self):
-        super().__init__(command_prefix='!', intents=intents, help_command=None)
+        shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+        super().__init__(command_prefix='!', intents=intents, help_command=None, **shard_options)
+        self.narrative_warmup_task: Optional[asyncio.Task] = None
+        self.model_warmup_task: Optional[asyncio.Task] = None
+        self.metrics_server: Optional[metrics.MetricsServer] = None
+        self.loop_monitor: Optional[LoopMonitor] = None
 
     async def setup_hook(self):
         # 注意: 全域同步可能需要一小時才能生效。開發時建議同步到特定 Guild。
-        await self.tree.sync()
-        logger.info("Slash commands synced globally.")
+        # 分片部署時只由負責 shard 0 的程序同步，避免每個程序重複呼叫
+        if SHARD_IDS is None or 0 in SHARD_IDS:
+            await self.tree.sync()
+            logger.info("Slash commands synced globally.")
+
+        if MODEL_WARMUP:
+            self.model_warmup_task = asyncio.create_task(ai_manager.warm_up_model())
+
+        if NARRATIVE_WARMUP:
+            self.narrative_warmup_task = asyncio.create_task(ai_manager.run_narrative_warmup())
+
+        if LOOP_MONITOR:
+            self.loop_monitor = LoopMonitor()
+            self.loop_monitor.start()
+
+        if metrics.METRICS_PORT:
+            metrics.set_game_source(lambda: games)
+            self.metrics_server = metrics.MetricsServer()
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint: {e}")
+                self.metrics_server = None
 
     async def close(self):
+        if self.narrative_warmup_task:
+            self.narrative_warmup_task.cancel()
+        if self.model_warmup_task:
+            self.model_warmup_task.cancel()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.loop_monitor:
+            logger.info(self.loop_monitor.report())
+            await self.loop_monitor.stop()
         await ai_manager.close()
         await super().close()
 
@@ -62,14 +123,80 @@ bot = WerewolfBot()
 def create_retry_callback(channel: discord.TextChannel) -> Callable:
     """
     Creates a callback function to notify users about rate limit retries.
+    AIManager 會附上排隊位置 (position) 與預估等待秒數 (wait)；排隊通知每個頻道每 QUEUE_NOTICE_INTERVAL 秒最多一則。
     """
-    async def callback():
+    async def callback(position: Optional[int] = None, wait: Optional[float] = None):
+        if position is not None:
+            now = time.monotonic()
+            if now - queue_notice_times.get(channel.id, float("-inf")) < QUEUE_NOTICE_INTERVAL:
+                return
+            queue_notice_times[channel.id] = now
+            text = f"⏳ AI 排隊中 (第 {position} 位)，預計約 {math.ceil(wait or 0)} 秒後開始思考... 請稍候。"
+        elif wait is not None:
+            text = f"⚠️ AI 正在思考中 (連線重試，約 {math.ceil(wait)} 秒後)... 請稍候。"
+        else:
+            text = "⚠️ AI 正在思考中 (連線重試)... 請稍候。"
         try:
-            await channel.send("⚠️ AI 正在思考中 (連線重試)... 請稍候。")
+            await send_message(channel, text)
         except Exception:
             pass # 無法發送訊息時忽略
     return callback
 
+def trace_id(channel: discord.abc.Messageable) -> Optional[int]:
+    """追蹤 span 使用的遊戲 ID (與 get_game 相同，以 guild ID 區分)"""
+    guild = getattr(channel, 'guild', None)
+    return guild.id if guild else None
+
+async def send_message(target: discord.abc.Messageable, content: str):
+    """發送訊息並記錄 Discord API 耗時與次數"""
+    kind = "dm" if isinstance(target, (discord.Member, discord.User)) else "channel"
+    metrics.discord_sends.inc(kind=kind)
+    with tracer.span("discord.send", "discord", kind=kind):
+        return await target.send(content)
+
+async def edit_message(message: discord.Message, content: str):
+    """編輯已送出的訊息並記錄 Discord API 耗時與次數"""
+    metrics.discord_sends.inc(kind="edit")
+    with tracer.span("discord.edit", "discord"):
+        return await message.edit(content=content)
+
+async def stream_to_message(target: discord.abc.Messageable, texts: AsyncIterator[str], render: Callable[[str], str]) -> Tuple[str, Optional[discord.Message]]:
+    """
+    把逐段產出的文字 (每次為目前為止的全文) 顯示在同一則訊息：第一段送出新訊息，之後依 STREAM_EDIT_INTERVAL 節流編輯，
+    結束時補上最後的全文。最後的全文為空字串 (內容被作廢) 時，已送出的訊息改為 render("")。
+    回傳 (全文, 訊息)；訊息為 None 表示沒有文字或送出失敗 (仍會讀完全文)。
+    """
+    message = None
+    failed = False
+    text = shown = ""
+    last_edit = 0.0
+    async for text in texts:
+        if failed or (message is None and not text):
+            continue
+        try:
+            if message is None:
+                message = await send_message(target, render(text))
+                shown, last_edit = text, time.monotonic()
+            elif time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                await edit_message(message, render(text))
+                shown, last_edit = text, time.monotonic()
+        except Exception as e:
+            logger.warning(f"Failed to stream message: {e}")
+            failed = message is None
+    if message is not None and text != shown:
+        try:
+            await edit_message(message, render(text))
+        except Exception as e:
+            logger.warning(f"Failed to finish streamed message: {e}")
+    return text, message
+
+async def set_channel_send_permission(channel: discord.TextChannel, game: GameState, allowed: bool):
+    """透過權限快取設定頻道發言權限，並統計本局省下的 REST 呼叫次數"""
+    with tracer.span("discord.set_permissions", "discord", allowed=allowed):
+        saved = not await permission_cache.set_send_messages(channel, allowed)
+    if saved:
+        game.permission_calls_saved += 1
+
 @bot.event
 async def on_ready():
     logger.info(f'{bot.user} 已上線！(Slash Commands Enabled)')
@@ -90,47 +217,77 @@ async def on_message(message: discord.Message):
                          # 紀錄玩家發言
                          msg_content = f"{message.author.name}: {message.content}"
                          game.speech_history.append(msg_content)
+                         record_speech_claim(game, message.author, message.content)
             # 自由討論階段 (例如投票前)
             elif message.author in game.players:
                  async with game.lock:
                      msg_content = f"{message.author.name}: {message.content}"
                      game.speech_history.append(msg_content)
+                     record_speech_claim(game, message.author, message.content)
 
     # 必須加上這行，否則 commands 框架會失效
     await bot.process_commands(message)
 
-async def announce_event(channel: discord.TextChannel, game: GameState, event_type: str, system_msg: str):
-    narrative = await ai_manager.generate_narrative(event_type, system_msg, retry_callback=create_retry_callback(channel))
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    # 保持權限快取與頻道實際狀態同步 (例如管理員手動修改權限)
+    permission_cache.update_from_channel(after)
 
-    if game.game_mode == "online":
-        await channel.send(f"🎙️ **{narrative}**\n\n({system_msg})")
-    else:
-        # 線下模式: 發送給主持人
-        host_msg = f"🔔 **主持人提示** 🔔\n請宣讀以下內容：\n> {narrative}\n\n系統訊息：{system_msg}"
-        sent = False
-        if game.creator:
-            try:
-                await game.creator.send(host_msg)
-                sent = True
-            except Exception as e: 
-                logger.warning(f"Failed to DM host: {e}")
+def get_player_names(game: GameState) -> List[str]:
+    """本局所有玩家的名稱與提及字串 (用於旁白模板正規化)"""
+    members = set(game.players) | set(game.player_id_map.keys())
+    return [s for p in members for s in (p.name, p.mention) if isinstance(s, str)]
 
-        if not sent:
-            await channel.send(f"*(無法私訊主持人，請直接宣讀)*\n{narrative}\n({system_msg})")
+async def announce_event(channel: discord.TextChannel, game: GameState, event_type: str, system_msg: str):
+    with tracer.span("announce_event", game=trace_id(channel), event=event_type):
+        # 預算吃緊時旁白只用快取，沒有快取就只發系統訊息
+        budget = game.ai_budget
+        cached_only = budget is not None and not budget.allow("narrative")
+        # 旁白邊生成邊顯示：同一則訊息隨串流節流編輯
+        texts = ai_manager.stream_narrative(event_type, system_msg, retry_callback=create_retry_callback(channel), names=get_player_names(game),
+                                            budget=budget, cached_only=cached_only)
+
+        if game.game_mode == "online":
+            narrative, message = await stream_to_message(channel, texts, lambda text: f"🎙️ **{text}**\n\n({system_msg})" if text else f"📢 {system_msg}")
+            if message is None:
+                await send_message(channel, f"📢 {system_msg}")
         else:
-            await channel.send(f"*(已發送台詞給主持人 {game.creator.name})*")
+            # 線下模式: 串流私訊給主持人 (沒有旁白時改唸系統訊息)
+            def host_msg(text: str) -> str:
+                return f"🔔 **主持人提示** 🔔\n請宣讀以下內容：\n> {text or system_msg}\n\n系統訊息：{system_msg}"
+
+            narrative, message = "", None
+            if game.creator:
+                narrative, message = await stream_to_message(game.creator, texts, host_msg)
+                if message is None and not narrative:
+                    try:
+                        message = await send_message(game.creator, host_msg(system_msg))
+                    except Exception as e:
+                        logger.warning(f"Failed to DM host: {e}")
+            else:
+                async for narrative in texts:
+                    pass
+            narrative = narrative or system_msg
+
+            if message is None:
+                await send_message(channel, f"*(無法私訊主持人，請直接宣讀)*\n{narrative}\n({system_msg})")
+            else:
+                await send_message(channel, f"*(已發送台詞給主持人 {game.creator.name})*")
+
+def format_last_words(player: Union[discord.Member, AIPlayer], content: str) -> str:
+    return f"📢 **{player.name} 的遺言**：\n> {content}"
 
 async def announce_last_words(channel: discord.TextChannel, game: GameState, player: Union[discord.Member, AIPlayer], content: str):
     """公佈遺言"""
     async with game.lock:
         game.speech_history.append(f"{player.name} (遺言): {content}")
     
-    await channel.send(f"📢 **{player.name} 的遺言**：\n> {content}")
+    await send_message(channel, format_last_words(player, content))
 
-async def check_game_over(channel: discord.TextChannel, game: GameState):
-    """檢查是否滿足獲勝條件 (需在 Lock 保護下呼叫)"""
+def evaluate_game_over(game: GameState) -> Optional[Tuple[str, str]]:
+    """判斷是否滿足獲勝條件；若遊戲結束則標記並回傳 (獲勝者, 原因) (需在 Lock 保護下呼叫，不做任何 I/O)"""
     if not game.game_active:
-        return
+        return None
 
     wolf_count = 0
     god_count = 0
@@ -161,27 +318,118 @@ async def check_game_over(channel: discord.TextChannel, game: GameState):
         winner = "好人陣營"
         reason = "狼人已全部陣亡。"
 
-    if winner:
-        game.game_active = False
-        await announce_event(channel, game, "遊戲結束", f"獲勝者：{winner}。原因：{reason}")
+    if not winner:
+        return None
+    game.game_active = False
+    return winner, reason
 
-        # 公佈身分
-        msg = "**本局玩家身分：**\n" + "".join([f"{p.name}: {r}\n" for p, r in game.roles.items()])
+async def check_game_over(channel: discord.TextChannel, game: GameState):
+    """檢查是否滿足獲勝條件 (不可在 Lock 內呼叫：勝負在 Lock 內判定，公告在 Lock 外發送)"""
+    async with game.lock:
+        result = evaluate_game_over(game)
+        if not result:
+            return
+        # 公佈身分 (在 Lock 內取快照)
+        reveal_msg = "**本局玩家身分：**\n" + "".join([f"{p.name}: {r}\n" for p, r in game.roles.items()])
+        if game.ai_budget and game.ai_players:
+            reveal_msg += "\n" + game.ai_budget.summary()
 
-        await channel.send(msg)
+    winner, reason = result
+    await announce_event(channel, game, "遊戲結束", f"獲勝者：{winner}。原因：{reason}")
+    await send_message(channel, reveal_msg)
 
-        try:
-            await channel.set_permissions(channel.guild.default_role, send_messages=True)
-        except (discord.Forbidden, discord.HTTPException) as e:
-             logger.error(f"Failed to reset permissions: {e}")
-             await channel.send("警告：Bot 權限不足，無法自動恢復頻道發言權限。")
+    try:
+        await set_channel_send_permission(channel, game, True)
+    except (discord.Forbidden, discord.HTTPException) as e:
+         logger.error(f"Failed to reset permissions: {e}")
+         await send_message(channel, "警告：Bot 權限不足，無法自動恢復頻道發言權限。")
+
+    logger.info(f"Game over. Permission cache saved {game.permission_calls_saved} REST calls this game. Lock: {game.lock.stats}")
+    if ai_manager.cascade_model:
+        logger.info(f"Model cascade: {ai_manager.cascade_stats.format_summary()}")
+
+    await send_message(channel, "請使用 `/reset` 重置遊戲以開始新的一局。")
+
+    # 輸出本局的關鍵路徑分析 (不等待匯出)
+    asyncio.create_task(tracer.finish_game(trace_id(channel)))
+
+def init_role_beliefs(game: GameState, role_pool: List[str]):
+    """為每位 AI 玩家建立身分信念矩陣 (需在 Lock 保護下呼叫)"""
+    seat_ids = sorted(game.player_ids.keys())
+    wolf_seats = [pid for pid, p in game.player_ids.items() if game.roles.get(p) in WOLF_FACTION]
+    game.beliefs = {}
+    for p in game.ai_players:
+        pid = game.player_id_map.get(p)
+        if pid is None:
+            continue
+        role = game.roles.get(p)
+        tracker = RoleBeliefTracker(seat_ids, role_pool, observer=pid, observer_role=role)
+        if role in WOLF_FACTION:
+            tracker.observe_teammates(wolf_seats)
+        game.beliefs[p] = tracker
+
+def record_public_deaths(game: GameState, players: List[Union[discord.Member, AIPlayer]], night_kill: bool):
+    """公開事件：死亡 (需在 Lock 保護下呼叫)"""
+    seats = [game.player_id_map[p] for p in players if p in game.player_id_map]
+    for tracker in game.beliefs.values():
+        tracker.observe_deaths(seats, night_kill=night_kill)
+
+def record_speech_claim(game: GameState, player: Union[discord.Member, AIPlayer], content: str):
+    """公開事件：發言中的身分宣稱 (需在 Lock 保護下呼叫)"""
+    if not game.beliefs:
+        return
+    match = CLAIM_PATTERN.search(content)
+    pid = game.player_id_map.get(player)
+    if match and pid is not None:
+        for tracker in game.beliefs.values():
+            tracker.observe_claim(pid, match.group(1))
+
+def get_belief_summary(game: GameState, player: Union[discord.Member, AIPlayer]) -> Optional[str]:
+    tracker = game.beliefs.get(player)
+    return tracker.summary() if tracker else None
+
+def build_policy_context(game: GameState, player: Union[discord.Member, AIPlayer], role: str, action: str, speech_history: List[str]) -> PolicyContext:
+    """建立 AI 規則策略所需的局勢資訊 (需在 Lock 保護下呼叫)"""
+    name_to_id = {p.name: pid for p, pid in game.player_id_map.items()}
+    claims, speech_counts = parse_speech_history(speech_history, name_to_id)
+
+    teammates = set()
+    if role in WOLF_FACTION:
+        teammates = {game.player_id_map[p] for p, r in game.roles.items() if r in WOLF_FACTION and p in game.player_id_map}
+
+    return PolicyContext(
+        role=role,
+        action=action,
+        valid_targets=[game.player_id_map[p] for p in game.players if p in game.player_id_map],
+        actor_id=game.player_id_map.get(player),
+        teammates=teammates,
+        claims=claims,
+        speech_counts=speech_counts,
+        last_target=game.last_guard_target if action == "guard" else None,
+        wolf_probs=game.beliefs[player].wolf_probabilities() if player in game.beliefs else {},
+    )
+
+async def decide_ai_action(channel: discord.TextChannel, game: GameState, player: AIPlayer, role: str, action: str, context: str, targets: List[int], speech_history: List[str]) -> str:
+    """透過策略層決定 AI 行動：規則足夠有把握時不呼叫 LLM"""
+    async with game.lock:
+        ctx = build_policy_context(game, player, role, action, speech_history)
+        belief_summary = get_belief_summary(game, player)
 
-        await channel.send("請使用 `/reset` 重置遊戲以開始新的一局。")
+    # 本局 AI 預算用盡：只用規則策略
+    if game.ai_budget and not game.ai_budget.allow("action"):
+        return heuristic_decision(ctx).target
+
+    async def llm_call():
+        return await ai_manager.get_ai_action(role, context, targets, speech_history=speech_history, retry_callback=create_retry_callback(channel), belief_summary=belief_summary,
+                                              verify=lambda draft: draft_disagreement(ctx, draft), budget=game.ai_budget)
+
+    decision = await policy_engine.decide(ctx, llm_call, game.policy_budget)
+    return decision.target
 
 async def request_dm_input(player: Union[discord.Member, AIPlayer], prompt: str, valid_check: Callable[[str], bool], timeout: int = 45) -> Optional[str]:
     """私訊請求輸入的輔助函式"""
     try:
-        await player.send(prompt)
+        await send_message(player, prompt)
         def check(m):
             try:
                 if not (m.author == player and isinstance(m.channel, discord.DMChannel)):
@@ -192,7 +440,8 @@ async def request_dm_input(player: Union[discord.Member, AIPlayer], prompt: str,
             except Exception:
                 return False
 
-        msg = await bot.wait_for('message', check=check, timeout=timeout)
+        with tracer.span("human.dm_input", "human"):
+            msg = await bot.wait_for('message', check=check, timeout=timeout)
         return msg.content
     except (asyncio.TimeoutError, discord.Forbidden):
         return None
@@ -202,217 +451,222 @@ async def request_dm_input(player: Union[discord.Member, AIPlayer], prompt: str,
 
 async def perform_night(channel: discord.TextChannel, game: GameState):
     """執行天黑邏輯"""
-    try:
-        # Check current permissions before making API call
-        perms = channel.permissions_for(channel.guild.default_role)
-        if perms.send_messages:
-            await channel.set_permissions(channel.guild.default_role, send_messages=False)
-
-        await announce_event(channel, game, "天黑", "夜晚行動開始，請留意私訊。")
-    except discord.Forbidden:
-        await channel.send("警告：Bot 權限不足 (Manage Channels)，無法執行天黑禁言。")
-    except discord.HTTPException as e:
-        logger.error(f"Failed to set night permissions: {e}")
-        await channel.send("錯誤：設定頻道權限時發生未知錯誤。")
-
-    def is_valid_id(content):
-        if content.strip().lower() == 'no': return True
+    with tracer.span("perform_night", game=trace_id(channel), day=game.day_count):
         try:
-            pid = int(content)
-            return pid in game.player_ids
-        except Exception: return False
+            await set_channel_send_permission(channel, game, False)
 
-    # 統一獲取目標 ID 列表
-    all_player_ids = list(game.player_ids.keys())
-    async with game.lock:
-        shared_history = list(game.speech_history)
-
-    # 輔助：獲取行動
-    async def get_action(player, role, prompt, targets=None):
-        if hasattr(player, 'bot') and player.bot:
-            alive_count = len(game.players)
-            return await ai_manager.get_ai_action(role, f"夜晚行動。場上存活 {alive_count} 人。", targets if targets else all_player_ids, speech_history=shared_history, retry_callback=create_retry_callback(channel))
-        return await request_dm_input(player, prompt, is_valid_id)
-
-    # 守衛
-    async def run_guard():
-        guard_protect = None
-        async with game.lock:
-            guard_candidates = game.role_to_players.get("守衛", [])
-            guard = next((p for p in guard_candidates if p in game.players), None)
+            await announce_event(channel, game, "天黑", "夜晚行動開始，請留意私訊。")
+        except discord.Forbidden:
+            await send_message(channel, "警告：Bot 權限不足 (Manage Channels)，無法執行天黑禁言。")
+        except discord.HTTPException as e:
+            logger.error(f"Failed to set night permissions: {e}")
+            await send_message(channel, "錯誤：設定頻道權限時發生未知錯誤。")
 
-        if guard:
-            resp = await get_action(guard, "守衛", "🛡️ **守衛請睜眼。** 今晚要守護誰？請輸入玩家編號 (輸入 no 空守):")
-            if resp and resp.lower() != 'no':
-                try:
-                    guard_protect = int(resp)
-                    try: await guard.send(f"今晚守護了 {guard_protect} 號。")
-                    except Exception: pass
-                except ValueError: pass
-            else:
-                try: await guard.send("今晚不守護任何人。")
-                except Exception: pass
-        return guard_protect
+        def is_valid_id(content):
+            if content.strip().lower() == 'no': return True
+            try:
+                pid = int(content)
+                return pid in game.player_ids
+            except Exception: return False
 
-    # 狼人
-    async def run_wolf():
-        wolf_kill = None
+        # 統一獲取目標 ID 列表
+        all_player_ids = list(game.player_ids.keys())
         async with game.lock:
-            wolf_candidates = game.role_to_players.get("狼人", [])
-            wolves = [p for p in wolf_candidates if p in game.players]
-
-        if wolves:
-            # 狼人分開詢問
-            tasks = []
-            for wolf in wolves:
-                prompt = "🐺 **狼人請睜眼。** 今晚要殺誰？請輸入玩家編號 (輸入 no 放棄):"
-                tasks.append(get_action(wolf, "狼人", prompt))
-
-            results = await asyncio.gather(*tasks)
-            votes = []
-            for res in results:
-                if res and res.lower() != 'no':
-                    try: votes.append(int(res))
+            shared_history = list(game.speech_history)
+
+        # 輔助：獲取行動
+        async def get_action(player, role, prompt, action, targets=None):
+            if hasattr(player, 'bot') and player.bot:
+                alive_count = len(game.players)
+                return await decide_ai_action(channel, game, player, role, action, f"夜晚行動。場上存活 {alive_count} 人。", targets if targets else all_player_ids, shared_history)
+            return await request_dm_input(player, prompt, is_valid_id)
+
+        # 守衛
+        async def run_guard():
+            guard_protect = None
+            async with game.lock:
+                guard_candidates = game.role_to_players.get("守衛", [])
+                guard = next((p for p in guard_candidates if p in game.players), None)
+
+            if guard:
+                resp = await get_action(guard, "守衛", "🛡️ **守衛請睜眼。** 今晚要守護誰？請輸入玩家編號 (輸入 no 空守):", "guard")
+                if resp and resp.lower() != 'no':
+                    try:
+                        guard_protect = int(resp)
+                        try: await guard.send(f"今晚守護了 {guard_protect} 號。")
+                        except Exception: pass
+                    except ValueError: pass
+                else:
+                    try: await guard.send("今晚不守護任何人。")
                     except Exception: pass
+            return guard_protect
+
+        # 狼人
+        async def run_wolf():
+            wolf_kill = None
+            async with game.lock:
+                wolf_candidates = game.role_to_players.get("狼人", [])
+                wolves = [p for p in wolf_candidates if p in game.players]
 
-            if votes:
-                counts = Counter(votes)
-                max_votes = counts.most_common(1)[0][1]
-                candidates = [k for k, v in counts.items() if v == max_votes]
-                wolf_kill = secure_random.choice(candidates)
+            if wolves:
+                # 狼人分開詢問
+                tasks = []
                 for wolf in wolves:
-                    try: await wolf.send(f"今晚狼隊鎖定目標：**{wolf_kill} 號**。")
-                    except Exception: pass
-            else:
-                 for wolf in wolves:
-                    try: await wolf.send("今晚狼隊沒有達成目標 (或棄刀)。")
-                    except Exception: pass
-        return wolf_kill
+                    prompt = "🐺 **狼人請睜眼。** 今晚要殺誰？請輸入玩家編號 (輸入 no 放棄):"
+                    tasks.append(get_action(wolf, "狼人", prompt, "kill"))
+
+                results = await asyncio.gather(*tasks)
+                votes = []
+                for res in results:
+                    if res and res.lower() != 'no':
+                        try: votes.append(int(res))
+                        except Exception: pass
 
-    # 女巫
-    async def run_witch(wolf_kill):
-        witch_save = False
-        witch_poison = None
-        async with game.lock:
-            witch_candidates = game.role_to_players.get("女巫", [])
-            witch = next((p for p in witch_candidates if p in game.players), None)
+                if votes:
+                    counts = Counter(votes)
+                    max_votes = counts.most_common(1)[0][1]
+                    candidates = [k for k, v in counts.items() if v == max_votes]
+                    wolf_kill = secure_random.choice(candidates)
+                    for wolf in wolves:
+                        try: await wolf.send(f"今晚狼隊鎖定目標：**{wolf_kill} 號**。")
+                        except Exception: pass
+                else:
+                     for wolf in wolves:
+                        try: await wolf.send("今晚狼隊沒有達成目標 (或棄刀)。")
+                        except Exception: pass
+            return wolf_kill
 
-        if witch:
-            use_antidote = False
+        # 女巫
+        async def run_witch(wolf_kill):
+            witch_save = False
+            witch_poison = None
             async with game.lock:
-                can_use_antidote = game.witch_potions['antidote']
-                target_msg = f"今晚 {wolf_kill} 號玩家被殺了。" if wolf_kill else "今晚是平安夜。"
-
-            # 解藥
-            if can_use_antidote:
-                prompt = f"🔮 **女巫請睜眼。** {target_msg} 要使用解藥嗎？(輸入 yes/no)"
-                if hasattr(witch, 'bot') and witch.bot:
-                    resp = "yes" if wolf_kill else "no" # AI 簡單邏輯：有人死就救
-                else:
-                    resp = await request_dm_input(witch, prompt, lambda c: c.strip().lower() in ['yes', 'y', 'no', 'n'])
+                witch_candidates = game.role_to_players.get("女巫", [])
+                witch = next((p for p in witch_candidates if p in game.players), None)
+
+            if witch:
+                use_antidote = False
+                async with game.lock:
+                    can_use_antidote = game.witch_potions['antidote']
+                    target_msg = f"今晚 {wolf_kill} 號玩家被殺了。" if wolf_kill else "今晚是平安夜。"
+
+                # 解藥
+                if can_use_antidote:
+                    prompt = f"🔮 **女巫請睜眼。** {target_msg} 要使用解藥嗎？(輸入 yes/no)"
+                    if hasattr(witch, 'bot') and witch.bot:
+                        resp = "yes" if wolf_kill else "no" # AI 簡單邏輯：有人死就救
+                    else:
+                        resp = await request_dm_input(witch, prompt, lambda c: c.strip().lower() in ['yes', 'y', 'no', 'n'])
 
-                if resp and resp.strip().lower() in ['yes', 'y'] and wolf_kill:
-                    witch_save = True
-                    use_antidote = True
-                    try: await witch.send("已使用解藥。")
-                    except Exception: pass
+                    if resp and resp.strip().lower() in ['yes', 'y'] and wolf_kill:
+                        witch_save = True
+                        use_antidote = True
+                        try: await witch.send("已使用解藥。")
+                        except Exception: pass
+                    else:
+                        try: await witch.send("未使用解藥。")
+                        except Exception: pass
                 else:
-                    try: await witch.send("未使用解藥。")
-                    except Exception: pass
-            else:
-                 try: await witch.send(f"🔮 **女巫請睜眼。** {target_msg} (解藥已用完)")
-                 except Exception: pass
+                     try: await witch.send(f"🔮 **女巫請睜眼。** {target_msg} (解藥已用完)")
+                     except Exception: pass
 
-            if use_antidote:
-                 async with game.lock:
-                    game.witch_potions['antidote'] = False
+                if use_antidote:
+                     async with game.lock:
+                        game.witch_potions['antidote'] = False
+
+                # 毒藥
+                use_poison = False
+                poison_target_id = None
+                async with game.lock:
+                     can_use_poison = game.witch_potions['poison']
+
+                if can_use_poison:
+                    resp = await get_action(witch, "女巫", "要使用毒藥嗎？請輸入玩家編號 (輸入 no 不使用):", "poison")
+                    if resp and resp.strip().lower() != 'no':
+                        try:
+                            witch_poison = int(resp)
+                            use_poison = True
+                            poison_target_id = witch_poison
+                            try: await witch.send(f"已對 {witch_poison} 號使用毒藥。")
+                            except Exception: pass
+                        except Exception: pass
+                    else:
+                        try: await witch.send("未使用毒藥。")
+                        except Exception: pass
 
-            # 毒藥
-            use_poison = False
-            poison_target_id = None
+                if use_poison:
+                     async with game.lock:
+                        game.witch_potions['poison'] = False
+
+            return witch_save, witch_poison
+
+        # 預言家
+        async def run_seer():
             async with game.lock:
-                 can_use_poison = game.witch_potions['poison']
+                seer_candidates = game.role_to_players.get("預言家", [])
+                seer = next((p for p in seer_candidates if p in game.players), None)
 
-            if can_use_poison:
-                resp = await get_action(witch, "女巫", "要使用毒藥嗎？請輸入玩家編號 (輸入 no 不使用):")
+            if seer:
+                resp = await get_action(seer, "預言家", "🔮 **預言家請睜眼。** 今晚要查驗誰？請輸入玩家編號:", "check")
                 if resp and resp.strip().lower() != 'no':
                     try:
-                        witch_poison = int(resp)
-                        use_poison = True
-                        poison_target_id = witch_poison
-                        try: await witch.send(f"已對 {witch_poison} 號使用毒藥。")
+                        target_id = int(resp)
+                        async with game.lock:
+                            target_obj = game.player_ids.get(target_id)
+                            target_role = game.roles.get(target_obj, "未知") if target_obj else "未知"
+                            is_bad = "狼" in target_role and target_role != "隱狼"
+                            if seer in game.beliefs:
+                                game.beliefs[seer].observe_seer_result(target_id, is_bad)
+
+                        result = "狼人 (查殺)" if is_bad else "好人 (金水)"
+
+                        try: await seer.send(f"{target_id} 號的身分是：**{result}**")
+                        except Exception: pass
+                    except ValueError:
+                        try: await seer.send("無效的編號。")
                         except Exception: pass
-                    except Exception: pass
                 else:
-                    try: await witch.send("未使用毒藥。")
+                    try: await seer.send("今晚未查驗。")
                     except Exception: pass
 
-            if use_poison:
-                 async with game.lock:
-                    game.witch_potions['poison'] = False
-
-        return witch_save, witch_poison
-
-    # 預言家
-    async def run_seer():
+        async def traced_role(name, coro):
+            with tracer.span(name):
+                return await coro
+
+        # 並發執行 (Concurrent Execution)
+        guard_task = asyncio.create_task(traced_role("night.guard", run_guard()))
+        wolf_task = asyncio.create_task(traced_role("night.wolf", run_wolf()))
+        seer_task = asyncio.create_task(traced_role("night.seer", run_seer()))
+
+        # 狼人優先完成以供女巫參考
+        wolf_kill = await wolf_task
+
+        # 女巫行動 (依賴狼人結果)
+        witch_task = asyncio.create_task(traced_role("night.witch", run_witch(wolf_kill)))
+        witch_save, witch_poison = await witch_task
+
+        # 等待其他任務完成
+        guard_protect = await guard_task
+        await seer_task
+
+        # 結算
+        dead_ids = set()
+        if wolf_kill:
+            is_guarded = (wolf_kill == guard_protect)
+            is_saved = witch_save
+            if is_guarded and is_saved: pass # 奶穿
+            elif not is_guarded and not is_saved:
+                dead_ids.add(wolf_kill)
+        if witch_poison:
+            dead_ids.add(witch_poison)
+
+        dead_players_list = []
         async with game.lock:
-            seer_candidates = game.role_to_players.get("預言家", [])
-            seer = next((p for p in seer_candidates if p in game.players), None)
-
-        if seer:
-            resp = await get_action(seer, "預言家", "🔮 **預言家請睜眼。** 今晚要查驗誰？請輸入玩家編號:")
-            if resp and resp.strip().lower() != 'no':
-                try:
-                    target_id = int(resp)
-                    async with game.lock:
-                        target_obj = game.player_ids.get(target_id)
-                        target_role = game.roles.get(target_obj, "未知") if target_obj else "未知"
-
-                    is_bad = "狼" in target_role and target_role != "隱狼"
-                    result = "狼人 (查殺)" if is_bad else "好人 (金水)"
-
-                    try: await seer.send(f"{target_id} 號的身分是：**{result}**")
-                    except Exception: pass
-                except ValueError:
-                    try: await seer.send("無效的編號。")
-                    except Exception: pass
-            else:
-                try: await seer.send("今晚未查驗。")
-                except Exception: pass
-
-    # 並發執行 (Concurrent Execution)
-    guard_task = asyncio.create_task(run_guard())
-    wolf_task = asyncio.create_task(run_wolf())
-    seer_task = asyncio.create_task(run_seer())
-
-    # 狼人優先完成以供女巫參考
-    wolf_kill = await wolf_task
-
-    # 女巫行動 (依賴狼人結果)
-    witch_task = asyncio.create_task(run_witch(wolf_kill))
-    witch_save, witch_poison = await witch_task
-
-    # 等待其他任務完成
-    guard_protect = await guard_task
-    await seer_task
-
-    # 結算
-    dead_ids = set()
-    if wolf_kill:
-        is_guarded = (wolf_kill == guard_protect)
-        is_saved = witch_save
-        if is_guarded and is_saved: pass # 奶穿
-        elif not is_guarded and not is_saved:
-            dead_ids.add(wolf_kill)
-    if witch_poison:
-        dead_ids.add(witch_poison)
-
-    dead_players_list = []
-    async with game.lock:
-        for did in dead_ids:
-            p = game.player_ids.get(did)
-            if p and p in game.players:
-                dead_players_list.append(p)
+            game.last_guard_target = guard_protect
+            for did in dead_ids:
+                p = game.player_ids.get(did)
+                if p and p in game.players:
+                    dead_players_list.append(p)
 
     await perform_day(channel, game, dead_players_list, poison_victim_id=witch_poison)
 
@@ -437,91 +691,107 @@ async def unmute_all_players(channel: discord.TextChannel, game: GameState):
     await asyncio.gather(*tasks)
 
 async def perform_ai_voting(channel: discord.TextChannel, game: GameState):
-    await asyncio.sleep(5)
-
-    ai_voters = []
-    shared_history = []
-    ai_roles = {}
-    async with game.lock:
-        if not game.game_active or game.speaking_active: return
-        ai_voters = [p for p in game.ai_players if p in game.players and p not in game.voted_players]
-        all_targets = list(game.player_ids.keys())
-        shared_history = list(game.speech_history)
-        ai_roles = {p: game.roles.get(p, "平民") for p in ai_voters}
-
-    if not ai_voters: return
+    with tracer.span("perform_ai_voting", game=trace_id(channel)):
+        await tracer.sleep(5, "sleep.before_ai_voting")
 
-    async def process_ai_voter(ai_player):
-        await asyncio.sleep(random.uniform(1, 3))
-
-        role = ai_roles.get(ai_player, "平民")
-        target_id = await ai_manager.get_ai_action(role, f"第 {game.day_count} 天白天投票階段。場上存活 {len(game.players)} 人。", all_targets, speech_history=shared_history, retry_callback=create_retry_callback(channel))
-
-        target_member = None
-        is_abstain = (str(target_id).strip().lower() == "no")
-        if not is_abstain and str(target_id).isdigit():
-             target_member = game.player_ids.get(int(target_id))
-
-        should_resolve = False
+        ai_voters = []
+        shared_history = []
+        ai_roles = {}
         async with game.lock:
-            if ai_player in game.voted_players: return
-
-            if is_abstain:
-                game.voted_players.add(ai_player)
-                await channel.send(f"{ai_player.mention} 投了廢票。")
+            if not game.game_active or game.speaking_active: return
+            voted = game.vote_round.ballots if game.vote_round else {}
+            ai_voters = [p for p in game.ai_players if p in game.players and p not in voted]
+            all_targets = list(game.player_ids.keys())
+            shared_history = list(game.speech_history)
+            ai_roles = {p: game.roles.get(p, "平民") for p in ai_voters}
+            belief_summaries = {p: get_belief_summary(game, p) for p in ai_voters}
+            # 預算吃緊時改用規則投票；模型串接時小模型的投票草稿要與規則/信念訊號比對
+            heuristic_votes = bool(game.ai_budget) and not game.ai_budget.allow("vote")
+            vote_contexts = {p: build_policy_context(game, p, ai_roles[p], "vote", shared_history) for p in ai_voters} if ai_manager.cascade_model or heuristic_votes else {}
+
+        if not ai_voters: return
+
+        async def process_ai_voter(ai_player):
+            await tracer.sleep(random.uniform(1, 3), "sleep.ai_vote_delay")
+
+            role = ai_roles.get(ai_player, "平民")
+            ctx = vote_contexts.get(ai_player)
+            if heuristic_votes:
+                target_id = heuristic_vote(ctx).target
             else:
-                if target_member and target_member in game.players:
-                    if target_member not in game.votes:
-                        game.votes[target_member] = 0
-                    game.votes[target_member] += 1
-                    game.voted_players.add(ai_player)
-                    await channel.send(f"{ai_player.mention} 投票給了 {target_member.mention}。")
-                else:
-                    game.voted_players.add(ai_player)
-                    await channel.send(f"{ai_player.mention} 投了廢票 (無效目標)。")
+                target_id = await ai_manager.get_ai_action(role, f"第 {game.day_count} 天白天投票階段。場上存活 {len(game.players)} 人。", all_targets, speech_history=shared_history, retry_callback=create_retry_callback(channel), belief_summary=belief_summaries.get(ai_player),
+                                                           verify=(lambda draft: draft_disagreement(ctx, draft)) if ctx else None, budget=game.ai_budget)
 
-            if len(game.voted_players) == len(game.players):
-                should_resolve = True
+            target_member = None
+            is_abstain = (str(target_id).strip().lower() == "no")
+            if not is_abstain and str(target_id).isdigit():
+                 target_member = game.player_ids.get(int(target_id))
 
-        if should_resolve:
-            await resolve_votes(channel, game)
+            async with game.lock:
+                if not game.game_active or ai_player not in game.players: return
+                vote_round = game.open_vote_round()
+                if vote_round.has_voted(ai_player): return
+
+                if is_abstain:
+                    vote_round.cast(ai_player, None)
+                    vote_msg = f"{ai_player.mention} 投了廢票。"
+                elif target_member and target_member in game.players:
+                    vote_round.cast(ai_player, target_member)
+                    vote_msg = f"{ai_player.mention} 投票給了 {target_member.mention}。"
+                else:
+                    vote_round.cast(ai_player, None)
+                    vote_msg = f"{ai_player.mention} 投了廢票 (無效目標)。"
+                should_resolve = vote_round.complete
+
+            await send_message(channel, vote_msg)
+            if should_resolve:
+                await resolve_votes(channel, game)
 
-    tasks = [process_ai_voter(p) for p in ai_voters]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+        tasks = [process_ai_voter(p) for p in ai_voters]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
 
-    for res in results:
-        if isinstance(res, Exception):
-            logger.error(f"Error in AI voting task: {res}")
+        for res in results:
+            if isinstance(res, Exception):
+                logger.error(f"Error in AI voting task: {res}")
 
 async def start_next_turn(channel: discord.TextChannel, game: GameState):
-    next_player = None
-    remaining_count = 0
+    # 上一位真人玩家的發言回合 (等待 /done) 到此結束
+    tracer.close_span(trace_id(channel), "human.speech_turn")
+    with tracer.span("start_next_turn", game=trace_id(channel)):
+        next_player = None
+        remaining_count = 0
 
-    async with game.lock:
-        if not game.speaking_queue:
-            game.speaking_active = False
-            game.current_speaker = None
-            await channel.send("🎙️ **發言階段結束！** 現在可以自由討論與投票。")
+        async with game.lock:
+            speaking_over = not game.speaking_queue
+            if speaking_over:
+                game.speaking_active = False
+                game.current_speaker = None
+            else:
+                next_player = game.speaking_queue.popleft()
+                game.current_speaker = next_player
+                remaining_count = len(game.speaking_queue)
+
+        if speaking_over:
+            await send_message(channel, "🎙️ **發言階段結束！** 現在可以自由討論與投票。")
             asyncio.create_task(unmute_all_players(channel, game))
             asyncio.create_task(perform_ai_voting(channel, game))
             return
 
-        next_player = game.speaking_queue.popleft()
-        game.current_speaker = next_player
-        remaining_count = len(game.speaking_queue)
+        await set_player_mute(next_player, False)
 
-    await set_player_mute(next_player, False)
+        pid = "未知"
+        role = "未知"
+        async with game.lock:
+            pid = game.player_id_map.get(next_player, "未知")
+            role = game.roles.get(next_player, "平民")
 
-    pid = "未知"
-    role = "未知"
-    async with game.lock:
-        pid = game.player_id_map.get(next_player, "未知")
-        role = game.roles.get(next_player, "平民")
+        await send_message(channel, f"🎙️ 輪到 **{pid} 號 {next_player.mention}** 發言。 (剩餘 {remaining_count} 人等待)\n請發言完畢後輸入 `/done` 結束回合。")
 
-    await channel.send(f"🎙️ 輪到 **{pid} 號 {next_player.mention}** 發言。 (剩餘 {remaining_count} 人等待)\n請發言完畢後輸入 `/done` 結束回合。")
+        if not (hasattr(next_player, 'bot') and next_player.bot):
+            tracer.open_span(trace_id(channel), "human.speech_turn", "human", player=next_player.name)
+            return
 
-    if hasattr(next_player, 'bot') and next_player.bot:
-        await asyncio.sleep(random.uniform(2, 5))
+        await tracer.sleep(random.uniform(2, 5), "sleep.ai_speech_delay")
 
         current_history = []
         day_count = 0
@@ -530,22 +800,33 @@ async def start_next_turn(channel: discord.TextChannel, game: GameState):
             current_history = list(game.speech_history)
             day_count = game.day_count
             dead_names = list(game.last_dead_players)
+            belief_summary = get_belief_summary(game, next_player)
 
         alive_count = len(game.players)
         dead_info = ", ".join(dead_names) if dead_names else "無"
         context_str = f"現在是第 {day_count} 天白天。存活玩家: {alive_count} 人。昨晚死亡名單：{dead_info}。"
 
-        speech = await ai_manager.get_ai_speech(pid, role, context_str, current_history, retry_callback=create_retry_callback(channel))
+        # 預算吃緊時先縮短發言，用盡時改用固定台詞
+        budget = game.ai_budget
+        if budget and not budget.allow("speech"):
+            speech = DEGRADED_SPEECH
+        else:
+            brief = bool(budget) and not budget.allow("full_speech")
+            speech = await ai_manager.get_ai_speech(pid, role, context_str, current_history, retry_callback=create_retry_callback(channel), belief_summary=belief_summary,
+                                                    budget=budget, brief=brief)
 
         async with game.lock:
             game.speech_history.append(f"{next_player.name}: {speech}")
+            record_speech_claim(game, next_player, speech)
 
-        await channel.send(f"🗣️ **{next_player.name}**: {speech}")
-        await asyncio.sleep(random.uniform(2, 4))
+        await send_message(channel, f"🗣️ **{next_player.name}**: {speech}")
+        await tracer.sleep(random.uniform(2, 4), "sleep.ai_speech_delay")
 
-        await channel.send(f"*(AI {next_player.name} 發言結束)*")
+        await send_message(channel, f"*(AI {next_player.name} 發言結束)*")
         await set_player_mute(next_player, True)
-        await start_next_turn(channel, game)
+
+    # 在 span 結束後才進入下一位，避免遞迴造成 span 巢狀累加
+    await start_next_turn(channel, game)
 
 async def handle_death_rattle(channel: discord.TextChannel, game: GameState, dead_players: List[Union[discord.Member, AIPlayer]], poison_victim_id: Optional[int] = None) -> List[Union[discord.Member, AIPlayer]]:
     """處理死亡玩家的技能 (如獵人開槍)"""
@@ -587,7 +868,7 @@ async def handle_death_rattle(channel: discord.TextChannel, game: GameState, dea
                              shared_history = list(game.speech_history)
                              all_ids = list(game.player_ids.keys())
                              
-                         target_id = await ai_manager.get_ai_action("獵人", f"你已死亡。請選擇射擊目標。場上存活: {alive_count}", all_ids, speech_history=shared_history, retry_callback=create_retry_callback(channel))
+                         target_id = await decide_ai_action(channel, game, player, "獵人", "shoot", f"你已死亡。請選擇射擊目標。場上存活: {alive_count}", all_ids, shared_history)
                     else:
                         # Human Logic
                         def is_valid(c):
@@ -600,9 +881,9 @@ async def handle_death_rattle(channel: discord.TextChannel, game: GameState, dea
                         victim = None
                         async with game.lock:
                             victim = game.player_ids.get(int(target_id))
-                            if victim and victim in game.players:
-                                game.players.remove(victim) # 立即死亡
+                            if victim and game.remove_player(victim): # 立即死亡
                                 game.last_dead_players.append(victim.name) # 加入死亡名單顯示
+                                record_public_deaths(game, [victim], night_kill=False)
                                 
                         if victim:
                             await announce_event(channel, game, "獵人開槍", f"砰！**{victim.name}** 被帶走了。")
@@ -619,7 +900,7 @@ async def perform_day(channel: discord.TextChannel, game: GameState, dead_player
     if dead_players is None:
         dead_players = []
     try:
-        await channel.set_permissions(channel.guild.default_role, send_messages=True)
+        await set_channel_send_permission(channel, game, True)
     except Exception: pass
 
     msg = "🌞 **天亮了！** 請開始討論。\n"
@@ -632,13 +913,13 @@ async def perform_day(channel: discord.TextChannel, game: GameState, dead_player
             names = ", ".join([p.name for p in dead_players])
             msg += f"昨晚死亡的是：**{names}**"
             for p in dead_players:
-                if p in game.players:
-                    game.players.remove(p)
+                game.remove_player(p)
+            record_public_deaths(game, dead_players, night_kill=True)
         else:
             msg += "昨晚是平安夜。"
 
-        await check_game_over(channel, game)
-        game_over = not game.game_active
+    await check_game_over(channel, game)
+    game_over = not game.game_active
 
     await announce_event(channel, game, "天亮", msg)
 
@@ -647,12 +928,11 @@ async def perform_day(channel: discord.TextChannel, game: GameState, dead_player
          extra_dead = await handle_death_rattle(channel, game, dead_players, poison_victim_id)
          if extra_dead:
              # 有人被獵人帶走，需要更新 game_over 檢查
-             async with game.lock:
-                 await check_game_over(channel, game)
-                 game_over = not game.game_active
+             await check_game_over(channel, game)
+             game_over = not game.game_active
 
     if not game_over:
-        await channel.send("🔊 **進入依序發言階段**，正在隨機排序並設定靜音...")
+        await send_message(channel, "🔊 **進入依序發言階段**，正在隨機排序並設定靜音...")
         async with game.lock:
             temp_queue = list(game.players)
             secure_random.shuffle(temp_queue)
@@ -666,87 +946,104 @@ async def perform_day(channel: discord.TextChannel, game: GameState, dead_player
 
 async def request_last_words(channel: discord.TextChannel, game: GameState, player: Union[discord.Member, AIPlayer]):
     """請求玩家發表遺言"""
-    try:
-        await channel.send(f"🎤 **請 {player.mention} 發表遺言。** (限時 60 秒)")
+    with tracer.span("request_last_words", game=trace_id(channel)):
+        try:
+            await send_message(channel, f"🎤 **請 {player.mention} 發表遺言。** (限時 60 秒)")
         
-        content = None
-        if hasattr(player, 'bot') and player.bot:
-            # AI Logic
-            async with game.lock:
-                role = game.roles.get(player, "平民")
-                shared_history = list(game.speech_history)
-                # 使用剛更新的 ai_manager 方法
-                # Context: 告知 AI 它被票出了
-                msg = await ai_manager.get_ai_last_words(
-                    player.name, 
-                    role, 
-                    f"現在是第 {game.day_count} 天，你被投票處決了。", 
+            content = None
+            if hasattr(player, 'bot') and player.bot:
+                # AI Logic
+                async with game.lock:
+                    role = game.roles.get(player, "平民")
+                    shared_history = list(game.speech_history)
+                    day_count = game.day_count
+
+                if game.ai_budget and not game.ai_budget.allow("last_words"):
+                    await send_message(channel, f"*({player.name} 沒有留下遺言)*")
+                    return
+
+                # Context: 告知 AI 它被票出了 (LLM 呼叫不持有 Lock)；遺言邊生成邊顯示，串流本身就是輸入過程，不再模擬輸入延遲
+                texts = ai_manager.stream_ai_last_words(
+                    player.name,
+                    role,
+                    f"現在是第 {day_count} 天，你被投票處決了。",
                     speech_history=shared_history,
-                    retry_callback=create_retry_callback(channel)
+                    retry_callback=create_retry_callback(channel),
+                    budget=game.ai_budget
                 )
-                content = msg
-                # 模擬輸入延遲
-                await asyncio.sleep(random.uniform(3, 6))
-        else:
-            # Human Logic
-            def check(m):
-                return m.author == player and m.channel == channel and not m.author.bot
-            
-            try:
-                msg = await bot.wait_for('message', check=check, timeout=60.0)
-                content = msg.content
-            except asyncio.TimeoutError:
-                await channel.send("⏳ 時間到，未留下遺言。")
+                content, message = await stream_to_message(channel, texts, lambda text: format_last_words(player, text) if text else f"*({player.name} 沒有留下遺言)*")
+                if message is not None and content:
+                    async with game.lock:
+                        game.speech_history.append(f"{player.name} (遺言): {content}")
                 return
-
-        if content:
-             await announce_last_words(channel, game, player, content)
+            else:
+                # Human Logic
+                def check(m):
+                    return m.author == player and m.channel == channel and not m.author.bot
             
-    except Exception as e:
-        logger.error(f"Error in request_last_words: {e}")
-        await channel.send("(遺言環節發生錯誤，跳過)")
+                try:
+                    with tracer.span("human.last_words", "human"):
+                        msg = await bot.wait_for('message', check=check, timeout=60.0)
+                    content = msg.content
+                except asyncio.TimeoutError:
+                    await send_message(channel, "⏳ 時間到，未留下遺言。")
+                    return
+
+            if content:
+                 await announce_last_words(channel, game, player, content)
+            
+        except Exception as e:
+            logger.error(f"Error in request_last_words: {e}")
+            await send_message(channel, "(遺言環節發生錯誤，跳過)")
 
 async def resolve_votes(channel: discord.TextChannel, game: GameState):
-    async with game.lock:
-        if not game.votes:
-            await channel.send("所有人均投廢票 (Abstain)，無人死亡。")
-            game.votes = {}
-            game.voted_players = set()
+    with tracer.span("resolve_votes", game=trace_id(channel)):
+        async with game.lock:
+            # 收票：之後的選票會開啟新的一輪
+            vote_round = game.vote_round or VoteRound(game.players)
+            vote_round.close()
+            game.vote_round = None
+            game.vote_history.append(vote_round)
+
+            # 票型是公開資訊，更新 AI 的身分信念
+            ballots = {game.player_id_map[v]: game.player_id_map[t] for v, t in vote_round.ballots.items()
+                       if v in game.player_id_map and t in game.player_id_map}
+            for tracker in game.beliefs.values():
+                tracker.observe_votes(ballots)
+
+            candidates = vote_round.leaders
+            max_votes = vote_round.top
+            all_abstain = not candidates
+
+        if all_abstain:
+            await send_message(channel, "所有人均投廢票 (Abstain)，無人死亡。")
             return
 
-        max_votes = max(game.votes.values())
-        candidates = [p for p, c in game.votes.items() if c == max_votes]
-
-    if len(candidates) > 1:
-        names = ", ".join([p.name for p in candidates])
-        msg = f"平票！({names}) 均為 {max_votes} 票。請重新投票。"
-        await channel.send(msg)
-        async with game.lock:
-            game.speech_history.append(f"系統: {msg}")
-            game.votes = {}
-            game.voted_players = set()
+        if len(candidates) > 1:
+            names = ", ".join([p.name for p in candidates])
+            msg = f"平票！({names}) 均為 {max_votes} 票。請重新投票。"
+            await send_message(channel, msg)
+            async with game.lock:
+                game.speech_history.append(f"系統: {msg}")
 
-        asyncio.create_task(perform_ai_voting(channel, game))
-    else:
-        victim = candidates[0]
-        await channel.send(f"投票結束！**{victim.name}** 以 {max_votes} 票被處決。")
+            asyncio.create_task(perform_ai_voting(channel, game))
+        else:
+            victim = candidates[0]
+            await send_message(channel, f"投票結束！**{victim.name}** 以 {max_votes} 票被處決。")
 
-        async with game.lock:
-            if victim in game.players:
-                game.players.remove(victim)
-            game.votes = {}
-            game.voted_players = set()
+            async with game.lock:
+                if game.remove_player(victim):
+                    record_public_deaths(game, [victim], night_kill=False)
             await check_game_over(channel, game)
-            
-        # 遺言階段 (只有被投票出局且遊戲仍在進行時)
-        if game.game_active:
-             await request_last_words(channel, game, victim)
 
-        # 票出也能發動技能 (不算毒死)
-        if game.game_active: # 只有遊戲未結束才處理
-             extra_dead = await handle_death_rattle(channel, game, [victim], poison_victim_id=None)
-             if extra_dead:
-                 async with game.lock:
+            # 遺言階段 (只有被投票出局且遊戲仍在進行時)
+            if game.game_active:
+                 await request_last_words(channel, game, victim)
+
+            # 票出也能發動技能 (不算毒死)
+            if game.game_active: # 只有遊戲未結束才處理
+                 extra_dead = await handle_death_rattle(channel, game, [victim], poison_victim_id=None)
+                 if extra_dead:
                      await check_game_over(channel, game)
 
 # Slash Commands
@@ -755,27 +1052,33 @@ async def resolve_votes(channel: discord.TextChannel, game: GameState):
 async def join(interaction: discord.Interaction):
     game = get_game(interaction.guild_id)
 
+    was_god = False
+    ephemeral = True
     async with game.lock:
         if game.game_active:
-            await interaction.response.send_message("遊戲已經開始，無法加入。", ephemeral=True)
-            return
-
-        if interaction.user in game.gods:
-            game.gods.remove(interaction.user)
-            await interaction.channel.send(f"{interaction.user.mention} 已從天神轉為玩家。")
-
-        if interaction.user in game.players:
-            await interaction.response.send_message("你已經在玩家列表中了。", ephemeral=True)
+            reply = "遊戲已經開始，無法加入。"
         else:
-            if len(game.players) >= 20:
-                await interaction.response.send_message("人數已達上限 (20人)。", ephemeral=True)
-                return
+            if interaction.user in game.gods:
+                game.gods.remove(interaction.user)
+                was_god = True
+
+            if interaction.user in game.players:
+                reply = "你已經在玩家列表中了。"
+            elif len(game.players) >= 20:
+                reply = "人數已達上限 (20人)。"
+            else:
+                if not game.players and not game.gods:
+                    game.creator = interaction.user
 
-            if not game.players and not game.gods:
-                game.creator = interaction.user
+                game.players.append(interaction.user)
+                reply, ephemeral = f"{interaction.user.mention} 加入了遊戲！目前人數: {len(game.players)}", False
 
-            game.players.append(interaction.user)
-            await interaction.response.send_message(f"{interaction.user.mention} 加入了遊戲！目前人數: {len(game.players)}")
+    if was_god:
+        await interaction.channel.send(f"{interaction.user.mention} 已從天神轉為玩家。")
+    if ephemeral:
+        await interaction.response.send_message(reply, ephemeral=True)
+    else:
+        await interaction.response.send_message(reply)
 
 @bot.tree.command(name="addbot", description="加入 AI 玩家")
 async def addbot(interaction: discord.Interaction, count: int):
@@ -819,18 +1122,24 @@ async def mode(interaction: discord.Interaction, mode: app_commands.Choice[str])
 async def god(interaction: discord.Interaction):
     game = get_game(interaction.guild_id)
 
+    was_player = False
+    already_god = False
     async with game.lock:
-        if interaction.user in game.players:
-            game.players.remove(interaction.user)
-            await interaction.channel.send(f"{interaction.user.mention} 已從玩家轉為天神。")
+        if game.remove_player(interaction.user):
+            was_player = True
 
-        if interaction.user not in game.gods:
+        already_god = interaction.user in game.gods
+        if not already_god:
             if not game.players and not game.gods:
                 game.creator = interaction.user
             game.gods.append(interaction.user)
-            await interaction.response.send_message(f"{interaction.user.mention} 已加入天神組 (God)！")
-        else:
-            await interaction.response.send_message("你已經是天神了。", ephemeral=True)
+
+    if was_player:
+        await interaction.channel.send(f"{interaction.user.mention} 已從玩家轉為天神。")
+    if already_god:
+        await interaction.response.send_message("你已經是天神了。", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"{interaction.user.mention} 已加入天神組 (God)！")
 
 @bot.tree.command(name="start", description="開始遊戲")
 @app_commands.checks.cooldown(1, 10)
@@ -844,32 +1153,64 @@ async def start(interaction: discord.Interaction):
 
     await interaction.response.send_message("正在準備遊戲...")
 
+    error = None
     async with game.lock:
         # 重複檢查，避免 Race Condition
         if game.game_active:
-            await interaction.followup.send("遊戲已經在進行中。")
-            return
-
-        # 開始遊戲的人不一定要是天神
-        # 只有在不是玩家的情況下，才自動加入天神組
-        if interaction.user not in game.players:
-            if interaction.user not in game.gods:
-                game.gods.append(interaction.user)
+            error = "遊戲已經在進行中。"
+        else:
+            # 開始遊戲的人不一定要是天神
+            # 只有在不是玩家的情況下，才自動加入天神組
+            if interaction.user not in game.players:
+                if interaction.user not in game.gods:
+                    game.gods.append(interaction.user)
+
+            # 確保 creator 被設定 (用於權限控制)
+            game.creator = interaction.user
+
+            current_player_count = len(game.players)
+            if current_player_count < 3:
+                error = "人數不足，至少需要 3 人 (不含天神) 才能開始。"
+            else:
+                # 先佔住開局 (其他 /start 與 /join 會被拒絕)，之後的 AI 生成不持有 Lock
+                game.game_active = True
+                game.generation += 1
+                claim = game.generation
+                claimed_players = list(game.players)
+                game.roles = {}
+                game.role_to_players = {}
+                game.vote_round = None
+
+    if error:
+        await interaction.followup.send(error)
+        return
 
-        # 確保 creator 被設定 (用於權限控制)
-        game.creator = interaction.user
+    # 就緒檢查：模型冷啟動在開局前完成並回報，而不是卡在第一晚
+    if ai_manager.needs_warmup():
+        await interaction.channel.send("🔥 正在載入 AI 模型，請稍候...")
+        if await ai_manager.warm_up_model():
+            await interaction.channel.send(f"✅ AI 模型已就緒 (載入耗時 {ai_manager.warmup_latency['cold']:.1f} 秒)。")
+        else:
+            await interaction.channel.send("⚠️ AI 模型尚未就緒，AI 回應可能會較慢。")
 
-        current_player_count = len(game.players)
-        if current_player_count < 3:
-            await interaction.followup.send("人數不足，至少需要 3 人 (不含天神) 才能開始。")
-            return
+    # 非標準人數：嘗試 AI 生成 (LLM 呼叫與頻道訊息都在 Lock 外)
+    generated_roles = None
+    if current_player_count not in GAME_TEMPLATES and current_player_count >= 6:
+        await interaction.channel.send("⚠️ 偵測到非標準人數，正在請求 AI 生成平衡板子...")
+        generated_roles = await ai_manager.generate_role_template(current_player_count, list(ROLE_DESCRIPTIONS.keys()), retry_callback=create_retry_callback(interaction.channel))
 
-        game.game_active = True
-        game.roles = {}
-        game.role_to_players = {}
-        game.votes = {}
-        game.voted_players = set()
+    notices = []
+    async with game.lock:
+        # Lock 外等待期間可能有 /reset (重置遊戲) 或 /god (玩家轉天神)：不再是同一局或名單已變動就取消開局
+        if game.generation != claim or game.players != claimed_players:
+            if game.generation == claim:
+                game.game_active = False
+            error = "開局準備期間遊戲已被重置或玩家名單有變動，已取消開局，請重新 /start。"
+    if error:
+        await interaction.channel.send(error)
+        return
 
+    async with game.lock:
         role_pool = []
         template_name = "未知"
         active_players = []
@@ -881,49 +1222,43 @@ async def start(interaction: discord.Interaction):
             role_pool = selected_template["roles"].copy()
             template_name = f"{current_player_count}人 {selected_template['name']}"
             active_players = game.players.copy()
+        elif current_player_count < 6:
+            werewolf_count = 1
+            seer_count = 1
+            villager_count = current_player_count - werewolf_count - seer_count
+            role_pool = ["狼人"] * werewolf_count + ["預言家"] * seer_count + ["平民"] * villager_count
+            template_name = f"{current_player_count}人 基礎局"
+            active_players = game.players.copy()
+        elif generated_roles:
+            role_pool = generated_roles
+            template_name = f"{current_player_count}人 AI 生成局"
+            active_players = game.players.copy()
         else:
-            if current_player_count < 6:
-                werewolf_count = 1
-                seer_count = 1
-                villager_count = current_player_count - werewolf_count - seer_count
-                role_pool = ["狼人"] * werewolf_count + ["預言家"] * seer_count + ["平民"] * villager_count
-                template_name = f"{current_player_count}人 基礎局"
-                active_players = game.players.copy()
-            else:
-                # 嘗試 AI 生成
-                await interaction.channel.send("⚠️ 偵測到非標準人數，正在請求 AI 生成平衡板子...")
-                generated_roles = await ai_manager.generate_role_template(current_player_count, list(ROLE_DESCRIPTIONS.keys()), retry_callback=create_retry_callback(interaction.channel))
-
-                if generated_roles:
-                    role_pool = generated_roles
-                    template_name = f"{current_player_count}人 AI 生成局"
-                    active_players = game.players.copy()
-                else:
-                    # AI 失敗，回退到標準縮減邏輯
-                    await interaction.channel.send("AI 生成失敗或連線逾時，切換為標準板子縮減模式。")
-                    supported_counts = sorted(GAME_TEMPLATES.keys(), reverse=True)
-                    target_count = 0
-                    for count in supported_counts:
-                        if current_player_count >= count:
-                            target_count = count
-                            break
-
-                    if target_count == 0:
-                        target_count = 6
-
-                    secure_random.shuffle(game.players)
-                    active_players = game.players[:target_count]
-                    excess_players = game.players[target_count:]
-                    game.players[:] = active_players
-
-                    for p in excess_players:
-                        game.gods.append(p)
-                        await interaction.channel.send(f"{p.mention} 因人數超出板子 ({target_count}人)，自動轉為天神。")
-
-                    templates = GAME_TEMPLATES[target_count]
-                    selected_template = secure_random.choice(templates)
-                    role_pool = selected_template["roles"].copy()
-                    template_name = f"{target_count}人 {selected_template['name']}"
+            # AI 失敗，回退到標準縮減邏輯
+            notices.append("AI 生成失敗或連線逾時，切換為標準板子縮減模式。")
+            supported_counts = sorted(GAME_TEMPLATES.keys(), reverse=True)
+            target_count = 0
+            for count in supported_counts:
+                if current_player_count >= count:
+                    target_count = count
+                    break
+
+            if target_count == 0:
+                target_count = 6
+
+            secure_random.shuffle(game.players)
+            active_players = game.players[:target_count]
+            excess_players = game.players[target_count:]
+            game.players[:] = active_players
+
+            for p in excess_players:
+                game.gods.append(p)
+                notices.append(f"{p.mention} 因人數超出板子 ({target_count}人)，自動轉為天神。")
+
+            templates = GAME_TEMPLATES[target_count]
+            selected_template = secure_random.choice(templates)
+            role_pool = selected_template["roles"].copy()
+            template_name = f"{target_count}人 {selected_template['name']}"
 
         secure_random.shuffle(role_pool)
         game.player_ids = {}
@@ -931,6 +1266,9 @@ async def start(interaction: discord.Interaction):
         game.witch_potions = {'antidote': True, 'poison': True}
         game.day_count = 0
         game.last_dead_players = []
+        game.permission_calls_saved = 0
+        game.policy_budget = policy_engine.new_budget()
+        game.ai_budget = AIBudget(guild=interaction.guild_id)
 
         player_list_msg_lines = ["**本局玩家列表：**\n"]
         for idx, player in enumerate(active_players, 1):
@@ -939,11 +1277,15 @@ async def start(interaction: discord.Interaction):
             player_list_msg_lines.append(f"**{idx}.** {player.name}\n")
         player_list_msg = "".join(player_list_msg_lines)
 
+    for notice in notices:
+        await interaction.channel.send(notice)
     await interaction.channel.send(player_list_msg)
 
     role_summary = []
     for player, role in zip(active_players, role_pool):
         async with game.lock:
+             if game.generation != claim:
+                 return # 發牌途中被 /reset
              game.roles[player] = role
              if role not in game.role_to_players:
                  game.role_to_players[role] = []
@@ -959,6 +1301,9 @@ async def start(interaction: discord.Interaction):
                 logger.warning(f"Failed to DM {player.name}: {e}")
                 await interaction.channel.send(f"無法發送私訊給 {player.mention}，請檢查隱私設定。")
 
+    async with game.lock:
+        init_role_beliefs(game, role_pool)
+
     summary_msg = f"**本局板子：{template_name}**\n**本局身分列表：**\n" + "\n".join(role_summary)
     for god in game.gods:
         try: await god.send(summary_msg)
@@ -1007,13 +1352,18 @@ async def die(interaction: discord.Interaction, target: str):
         return
 
     async with game.lock:
-        if target_member not in game.players:
-            await interaction.response.send_message("該玩家不在遊戲中。", ephemeral=True)
-            return
-        game.players.remove(target_member)
-        await check_game_over(interaction.channel, game)
+        removed = game.remove_player(target_member)
+        # 處決尚未投票的玩家後，其餘存活玩家可能已全部投完
+        should_resolve = removed and game.vote_round is not None and game.vote_round.complete
+
+    if not removed:
+        await interaction.response.send_message("該玩家不在遊戲中。", ephemeral=True)
+        return
 
     await interaction.response.send_message(f"👑 天神執行了處決，**{target_member.name}** 已死亡。")
+    await check_game_over(interaction.channel, game)
+    if should_resolve and game.game_active:
+        await resolve_votes(interaction.channel, game)
 
 @bot.tree.command(name="done", description="結束發言")
 async def done(interaction: discord.Interaction):
@@ -1057,9 +1407,11 @@ async def vote(interaction: discord.Interaction, target_id: str):
         return
 
     async with game.lock:
-        if game.speaking_active:
-            await interaction.response.send_message("請等待發言結束。", ephemeral=True)
-            return
+        speaking_active = game.speaking_active
+
+    if speaking_active:
+        await interaction.response.send_message("請等待發言結束。", ephemeral=True)
+        return
 
     if interaction.user not in game.players:
         await interaction.response.send_message("你沒有參與遊戲。", ephemeral=True)
@@ -1074,27 +1426,29 @@ async def vote(interaction: discord.Interaction, target_id: str):
              await interaction.response.send_message("無效的玩家編號。", ephemeral=True)
              return
 
+    # 回應訊息在 Lock 外發送，Lock 只保護票數更新；收票前可以改票
     should_resolve = False
+    ephemeral = True
     async with game.lock:
-        if interaction.user in game.voted_players:
-            await interaction.response.send_message("你已經投過票了。", ephemeral=True)
-            return
-
-        if is_abstain:
-            game.voted_players.add(interaction.user)
-            await interaction.response.send_message(f"{interaction.user.mention} 投了廢票。")
+        if not is_abstain and target_member not in game.players:
+            reply = "該玩家不在遊戲中。"
         else:
-            if target_member not in game.players:
-                await interaction.response.send_message("該玩家不在遊戲中。", ephemeral=True)
-                return
-            if target_member not in game.votes:
-                game.votes[target_member] = 0
-            game.votes[target_member] += 1
-            game.voted_players.add(interaction.user)
-            await interaction.response.send_message(f"{interaction.user.mention} 投票成功。")
+            vote_round = game.open_vote_round()
+            changed = vote_round.cast(interaction.user, None if is_abstain else target_member)
+            if is_abstain:
+                reply = f"{interaction.user.mention} {'改投' if changed else '投了'}廢票。"
+            elif changed:
+                reply = f"{interaction.user.mention} 改投 {target_member.mention}。"
+            else:
+                reply = f"{interaction.user.mention} 投票成功。"
+            ephemeral = False
+            # 改票不會讓投票完成 (最後一票進來時已經結算)
+            should_resolve = not changed and vote_round.complete
 
-        if len(game.voted_players) == len(game.players):
-            should_resolve = True
+    if ephemeral:
+        await interaction.response.send_message(reply, ephemeral=True)
+        return
+    await interaction.response.send_message(reply)
 
     if should_resolve:
         await resolve_votes(interaction.channel, game)
@@ -1111,8 +1465,9 @@ async def reset(interaction: discord.Interaction):
 
     async with game.lock:
         game.reset()
+    tracer.clear(interaction.guild_id)
 
-    try: await interaction.channel.set_permissions(interaction.guild.default_role, send_messages=True)
+    try: await set_channel_send_permission(interaction.channel, game, True)
     except Exception: pass
 
     await interaction.response.send_message("遊戲已重置。")
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import discord
+from typing import Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+# 暫時性錯誤 (5xx) 的重試設定
+MAX_PERMISSION_RETRIES = 2
+PERMISSION_RETRY_DELAY = 1.0 # Seconds
+
+
+class ChannelPermissionCache:
+    """
+    快取每個頻道 @everyone 的發言權限狀態，避免日夜切換時重複呼叫 set_permissions。
+    快取由 on_guild_channel_update 事件同步，API 失敗時會失效以便下次重新讀取。
+    """
+    def __init__(self):
+        self._send_state: Dict[Any, bool] = {}
+        self.calls_made = 0
+        self.calls_saved = 0
+
+    def _current_state(self, channel: discord.abc.GuildChannel) -> Optional[bool]:
+        key = channel.id
+        if key in self._send_state:
+            return self._send_state[key]
+
+        # 快取未命中：從 discord.py 本地狀態讀取 (不需要 REST 呼叫)
+        try:
+            perms = channel.permissions_for(channel.guild.default_role)
+            value = perms.send_messages
+        except Exception:
+            return None
+        if isinstance(value, bool):
+            self._send_state[key] = value
+            return value
+        return None
+
+    def update_from_channel(self, channel: discord.abc.GuildChannel):
+        """根據頻道的最新狀態更新快取 (用於 on_guild_channel_update)"""
+        self._send_state.pop(channel.id, None)
+        self._current_state(channel)
+
+    def invalidate(self, channel: discord.abc.GuildChannel):
+        self._send_state.pop(channel.id, None)
+
+    async def set_send_messages(self, channel: discord.abc.GuildChannel, allowed: bool) -> bool:
+        """
+        設定 @everyone 的發言權限。若快取顯示狀態已相同則跳過 API 呼叫。
+        回傳 True 表示實際發出了 REST 呼叫，False 表示被快取省略。
+        Forbidden 會直接拋出；5xx 等暫時性錯誤會重試後再拋出。
+        """
+        if self._current_state(channel) == allowed:
+            self.calls_saved += 1
+            return False
+
+        for attempt in range(MAX_PERMISSION_RETRIES + 1):
+            try:
+                await channel.set_permissions(channel.guild.default_role, send_messages=allowed)
+                self.calls_made += 1
+                self._send_state[channel.id] = allowed
+                return True
+            except discord.Forbidden:
+                self.invalidate(channel)
+                raise
+            except discord.HTTPException as e:
+                self.invalidate(channel)
+                if e.status >= 500 and attempt < MAX_PERMISSION_RETRIES:
+                    delay = PERMISSION_RETRY_DELAY * (2 ** attempt)
+                    logger.warning(f"Transient error setting permissions: {e}. Retrying in {delay}s... (Attempt {attempt+1}/{MAX_PERMISSION_RETRIES})")
+                    await asyncio.sleep(delay)
+                    continue
+                raise
+        return True
+
+# Global instance
+permission_cache = ChannelPermissionCache()
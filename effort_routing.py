@@ -0,0 +1,163 @@
+# effort_routing.py
+# reasoning_effort 路由：依呼叫類型、遊戲階段 (天數)、存活人數與角色決定思考程度，
+# 低風險的呼叫 (遺言、前期平民發言、前期投票) 可以改用較小的次要 Ollama 模型。
+#
+#   fixed    : 原行為，行動/發言/遺言一律 high
+#   adaptive : 前期、人多、平民 → 省；殘局、神職/狼人的關鍵決策 → high
+#
+# MODEL_CASCADE：夜晚行動、投票與前期發言先交給小模型起草，草稿通過檢查就採用，否則升級主要模型。
+
+import os
+import re
+import math
+import logging
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterable, Optional
+
+import metrics
+from game_data import VILLAGER_FACTION, WOLF_FACTION
+from prompt_templates import phase_for_context
+
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ("fixed", "adaptive")
+DEFAULT_ROUTING_MODE = "fixed"
+
+# 局勢描述中的存活人數：「場上存活 7 人」、「存活玩家: 8 人」、「場上存活: 5」
+ALIVE_PATTERN = re.compile(r'存活[^\d\n]{0,4}(\d+)')
+# 存活人數小於等於此值視為殘局，一律 high
+ENDGAME_ALIVE = 5
+
+EFFORTS = ("low", "medium", "high")
+
+MODEL_CASCADE = os.getenv('MODEL_CASCADE', 'false').lower() in ('1', 'true', 'yes')
+# 小模型的發言草稿至少要這麼多字才採用 (太短通常是拒答或格式錯誤)
+CASCADE_MIN_SPEECH = int(os.getenv('CASCADE_MIN_SPEECH', '20'))
+CASCADE_LATENCY_SAMPLES = 1000 # 每種呼叫類型保留的延遲樣本數
+
+
+@dataclass(frozen=True)
+class Route:
+    effort: str
+    model: Optional[str] = None # None = 主要模型
+
+
+def alive_from_context(game_context: str) -> Optional[int]:
+    match = ALIVE_PATTERN.search(game_context)
+    return int(match.group(1)) if match else None
+
+
+class EffortRouter:
+    """
+    為每次 AI 呼叫挑選 reasoning_effort 與模型，並統計各路由的次數。
+    small_model 只在 effort 為 low 時使用 (未設定時仍用主要模型)。
+    """
+    def __init__(self, mode: Optional[str] = None, small_model: Optional[str] = None):
+        mode = (mode or os.getenv('EFFORT_ROUTING', DEFAULT_ROUTING_MODE)).lower()
+        if mode not in ROUTING_MODES:
+            logger.warning(f"Unknown effort routing mode: {mode}, defaulting to {DEFAULT_ROUTING_MODE}")
+            mode = DEFAULT_ROUTING_MODE
+        self.mode = mode
+        self.small_model = small_model if small_model is not None else os.getenv('OLLAMA_SMALL_MODEL', '')
+        self.counts: Counter = Counter() # (call_type, effort, model) -> 次數
+
+    def route(self, call_type: str, game_context: str, role: str) -> Route:
+        """call_type: action / vote / speech / last_words"""
+        effort = self._effort(call_type, game_context, role) if self.mode == "adaptive" else "high"
+        route = Route(effort, self.small_model if effort == "low" and self.small_model else None)
+        self.counts[(call_type, route.effort, route.model or "primary")] += 1
+        return route
+
+    def _effort(self, call_type: str, game_context: str, role: str) -> str:
+        if call_type == "last_words":
+            return "low" # 30-50 字的遺言不需要深度推理
+
+        phase = phase_for_context(game_context)
+        alive = alive_from_context(game_context)
+        if phase == "late" or (alive is not None and alive <= ENDGAME_ALIVE):
+            return "high"
+
+        if call_type == "vote":
+            # 前期資訊少、棄票多；中期開始票型才有意義
+            return "low" if phase == "early" else "medium"
+        if call_type == "speech":
+            if role in VILLAGER_FACTION:
+                return "low" if phase == "early" else "medium"
+            return "medium" if phase == "early" else "high"
+        # 夜晚行動：狼刀與神職技能影響大，只有前期人多時降一級
+        if role in WOLF_FACTION or phase != "early":
+            return "high"
+        return "medium"
+
+    def summary(self) -> Dict[str, int]:
+        """各路由的呼叫次數，例如 {"speech/low/llama3.2:3b": 12}"""
+        return {f"{call_type}/{effort}/{model}": count for (call_type, effort, model), count in sorted(self.counts.items())}
+
+
+def check_draft(draft: str, valid_targets: Iterable, verify: Optional[Callable[[str], Optional[str]]] = None) -> Optional[str]:
+    """
+    檢查小模型的行動草稿：通過回傳 None，否則回傳升級原因。
+    verify 由呼叫端提供 (規則策略/信念訊號)；沒有 verify 時棄票一律交給主要模型確認。
+    """
+    if draft != "no" and draft not in {str(t) for t in valid_targets}:
+        return "illegal"
+    if verify is None:
+        return "abstain" if draft == "no" else None
+    return verify(draft)
+
+
+def check_speech_draft(draft: str) -> Optional[str]:
+    return None if len(draft.strip()) >= CASCADE_MIN_SPEECH else "short"
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+class CascadeStats:
+    """各呼叫類型的小模型採用/升級次數、升級原因與端到端延遲 (含草稿時間)"""
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.escalations: Counter = Counter()
+        self.reasons: Counter = Counter() # (call_type, reason) -> 次數
+        self.latency: Dict[str, Deque[float]] = {}
+
+    def record(self, call_type: str, reason: Optional[str], elapsed: float):
+        self.calls[call_type] += 1
+        if reason:
+            self.escalations[call_type] += 1
+            self.reasons[(call_type, reason)] += 1
+        self.latency.setdefault(call_type, deque(maxlen=CASCADE_LATENCY_SAMPLES)).append(elapsed)
+        metrics.cascade_requests.inc(call_type=call_type, outcome="escalated" if reason else "accepted")
+        metrics.cascade_latency.observe(elapsed, call_type=call_type)
+
+    def merge(self, other: "CascadeStats"):
+        self.calls.update(other.calls)
+        self.escalations.update(other.escalations)
+        self.reasons.update(other.reasons)
+        for call_type, values in other.latency.items():
+            self.latency.setdefault(call_type, deque(maxlen=CASCADE_LATENCY_SAMPLES)).extend(values)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for call_type, calls in sorted(self.calls.items()):
+            latency = self.latency.get(call_type, ())
+            result[call_type] = {
+                "calls": calls,
+                "escalation_rate": self.escalations[call_type] / calls,
+                "p50": _percentile(latency, 50),
+                "p90": _percentile(latency, 90),
+            }
+        return result
+
+    def format_summary(self) -> str:
+        parts = []
+        for call_type, stats in self.summary().items():
+            reasons = ", ".join(f"{r} {n}" for (c, r), n in sorted(self.reasons.items()) if c == call_type)
+            parts.append(f"{call_type}: {stats['calls']:.0f} calls, {stats['escalation_rate']:.0%} escalated"
+                         f"{f' ({reasons})' if reasons else ''}, p50 {stats['p50']:.2f}s p90 {stats['p90']:.2f}s")
+        return "; ".join(parts) or "no calls"
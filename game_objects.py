@@ -1,8 +1,78 @@
+import os
+import time
 import asyncio
+import logging
 import uuid
 import discord
 from collections import deque
-from typing import Dict, List, Set, Optional, Any, Union
+from typing import Dict, Iterable, List, Set, Optional, Any, Tuple, Union
+
+import metrics
+from tracing import current_span_name
+
+logger = logging.getLogger(__name__)
+
+LOCK_HOLD_WARNING = float(os.getenv('LOCK_HOLD_WARNING', '0.5')) # 持有 Lock 超過此秒數即記錄警告
+
+lock_wait_seconds = metrics.registry.histogram("werewolf_game_lock_wait_seconds", "Time spent waiting to acquire a game lock", ("site",),
+                                               buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+lock_hold_seconds = metrics.registry.histogram("werewolf_game_lock_hold_seconds", "Time a game lock was held", ("site",),
+                                               buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+class LockStats:
+    def __init__(self):
+        self.acquisitions = 0
+        self.contended = 0 # 需要等待才取得的次數
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hold = 0.0
+        self.max_hold = 0.0
+        self.max_hold_site: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return (f"LockStats(acquisitions={self.acquisitions}, contended={self.contended}, "
+                f"max_wait={self.max_wait * 1000:.1f}ms, max_hold={self.max_hold * 1000:.1f}ms @ {self.max_hold_site})")
+
+class InstrumentedLock(asyncio.Lock):
+    """
+    記錄等待與持有時間的 asyncio.Lock。持有者以取得 Lock 當下的追蹤 span 名稱標示，
+    持有過久 (通常代表在 Lock 內做了網路 I/O) 時記錄警告。
+    """
+    def __init__(self):
+        super().__init__()
+        self.stats = LockStats()
+        self._acquired_at = 0.0
+        self._site = "unknown"
+
+    async def acquire(self) -> bool:
+        started = time.perf_counter()
+        await super().acquire()
+        self._acquired_at = time.perf_counter()
+        self._site = current_span_name() or "unknown"
+        wait = self._acquired_at - started
+
+        stats = self.stats
+        stats.acquisitions += 1
+        if wait > 0.0001:
+            stats.contended += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        lock_wait_seconds.observe(wait, site=self._site)
+        return True
+
+    def release(self):
+        held = time.perf_counter() - self._acquired_at
+        site = self._site
+        super().release()
+
+        stats = self.stats
+        stats.total_hold += held
+        if held > stats.max_hold:
+            stats.max_hold = held
+            stats.max_hold_site = site
+        lock_hold_seconds.observe(held, site=site)
+        if held >= LOCK_HOLD_WARNING:
+            logger.warning(f"Game lock held for {held * 1000:.0f}ms in {site}")
 
 class AIPlayer:
     def __init__(self, name: str):
@@ -27,19 +97,119 @@ class AIPlayer:
     def __hash__(self) -> int:
         return hash(self.id)
 
+WITHDRAWN = object() # log 中表示投票者在收票前死亡/離開 (選票作廢)
+
+class VoteRound:
+    """
+    一輪白天投票。每張選票以 O(1) 更新票數與「票數 -> 目標」分桶，隨時可取得最高票數、領先者與是否平票；
+    electorate 為開票時有投票權的玩家，全員投完即 complete；收票前死亡的玩家以 withdraw 移出並作廢選票。收票 (close) 前可以改票。
+    ballots 保留每位投票者的最後選票 (None 為廢票)，供票型分析與 AI 身分信念使用；
+    log 依序記錄每一次投票 (含改票)，replay 可重建出完全相同的一輪 (領先者順序為各目標達到該票數的先後)。
+    """
+    def __init__(self, electorate: Iterable[Any] = ()):
+        self.electorate: Set[Any] = set(electorate)
+        self.ballots: Dict[Any, Optional[Any]] = {}   # 投票者 -> 目標 (None = 廢票)
+        self.counts: Dict[Any, int] = {}              # 目標 -> 票數 (只含至少一票的目標)
+        self.top: int = 0                             # 最高票數
+        self.log: List[Tuple[Any, Optional[Any]]] = []
+        self.closed: bool = False
+        self._buckets: Dict[int, Dict[Any, None]] = {} # 票數 -> 該票數的目標 (依達到的先後排序)
+
+    @classmethod
+    def replay(cls, log: Iterable[Tuple[Any, Optional[Any]]], electorate: Iterable[Any] = ()) -> "VoteRound":
+        vote_round = cls(electorate)
+        for voter, target in log:
+            if target is WITHDRAWN:
+                vote_round.withdraw(voter)
+            else:
+                vote_round.cast(voter, target)
+        return vote_round
+
+    def cast(self, voter: Any, target: Optional[Any]) -> bool:
+        """記錄一張選票 (target 為 None 表示廢票)；已投過則改票。回傳是否為改票。"""
+        if self.closed:
+            raise ValueError("vote round is closed")
+        if voter not in self.electorate:
+            raise ValueError(f"{voter} is not in this vote round")
+        changed = voter in self.ballots
+        if changed:
+            previous = self.ballots[voter]
+            if previous is not None:
+                self._remove(previous)
+        self.ballots[voter] = target
+        if target is not None:
+            self._add(target)
+        self.log.append((voter, target))
+        return changed
+
+    def withdraw(self, voter: Any):
+        """投票者在收票前離開 (例如被天神處決)：移出 electorate 並作廢已投的選票"""
+        if voter not in self.electorate:
+            return
+        self.electorate.discard(voter)
+        if voter in self.ballots:
+            target = self.ballots.pop(voter)
+            if target is not None:
+                self._remove(target)
+        self.log.append((voter, WITHDRAWN))
+
+    def _add(self, target: Any):
+        count = self.counts.get(target, 0)
+        if count:
+            self._discard(count, target)
+        self.counts[target] = count + 1
+        self._buckets.setdefault(count + 1, {})[target] = None
+        self.top = max(self.top, count + 1)
+
+    def _remove(self, target: Any):
+        count = self.counts[target]
+        self._discard(count, target)
+        if count == self.top and count not in self._buckets:
+            self.top -= 1 # 唯一的領先者少一票：它 (或 0 票) 成為新的最高票
+        if count == 1:
+            del self.counts[target]
+        else:
+            self.counts[target] = count - 1
+            self._buckets.setdefault(count - 1, {})[target] = None
+
+    def _discard(self, count: int, target: Any):
+        bucket = self._buckets[count]
+        del bucket[target]
+        if not bucket:
+            del self._buckets[count]
+
+    def has_voted(self, voter: Any) -> bool:
+        return voter in self.ballots
+
+    @property
+    def complete(self) -> bool:
+        return len(self.ballots) >= len(self.electorate)
+
+    @property
+    def leaders(self) -> List[Any]:
+        """得票最高的目標 (全部廢票時為空)"""
+        return list(self._buckets.get(self.top, ()))
+
+    @property
+    def tied(self) -> bool:
+        return len(self._buckets.get(self.top, ())) > 1
+
+    def close(self):
+        self.closed = True
+
 class GameState:
     def __init__(self):
         self.players: List[Union[discord.Member, AIPlayer]] = []
         self.roles: Dict[Union[discord.Member, AIPlayer], str] = {}
         self.gods: List[Union[discord.Member, AIPlayer]] = []
-        self.votes: Dict[Union[discord.Member, AIPlayer], int] = {}
-        self.voted_players: Set[Union[discord.Member, AIPlayer]] = set()
+        self.vote_round: Optional[VoteRound] = None # 進行中的投票 (第一張選票時開啟，結算後清除)
+        self.vote_history: List[VoteRound] = []     # 本局已結算的投票 (含平票重投)
         self.game_active: bool = False
         self.player_ids: Dict[int, Union[discord.Member, AIPlayer]] = {}     # ID -> Member
         self.player_id_map: Dict[Union[discord.Member, AIPlayer], int] = {}  # Member -> ID
         self.witch_potions: Dict[str, bool] = {'antidote': True, 'poison': True}
         self.creator: Optional[Union[discord.Member, discord.User]] = None      # 房主 (用於權限控制)
-        self.lock = asyncio.Lock() # 並發控制鎖
+        self.lock = InstrumentedLock() # 並發控制鎖 (記錄等待/持有時間)
 
         # 發言階段狀態
         self.speaking_queue: deque = deque()
@@ -53,14 +223,21 @@ class GameState:
         self.role_to_players: Dict[str, List[Union[discord.Member, AIPlayer]]] = {} # 角色 -> 玩家列表 (優化查找)
         self.day_count: int = 0
         self.last_dead_players: List[str] = []
+        self.last_guard_target: Optional[int] = None # 守衛上一晚守護的玩家編號 (不能連續兩晚守同一人)
+        self.permission_calls_saved: int = 0 # 權限快取省下的 REST 呼叫次數
+        self.policy_budget: Optional[Any] = None # 本局 AI 策略層可升級呼叫 LLM 的預算 (LLMBudget)
+        self.ai_budget: Optional[Any] = None # 本局 AI 呼叫次數/token/時間的總預算 (AIBudget)
+        self.beliefs: Dict[Union[discord.Member, AIPlayer], Any] = {} # AI 玩家 -> 身分信念矩陣 (RoleBeliefTracker)
+        self.generation: int = 0 # 每次開局佔位與重置時遞增；在 Lock 外等待後用來確認仍是同一局
 
     def reset(self):
+        self.generation += 1
         self.players = []
         self.roles = {}
         self.role_to_players = {}
         self.gods = []
-        self.votes = {}
-        self.voted_players = set()
+        self.vote_round = None
+        self.vote_history = []
         self.game_active = False
         self.player_ids = {}
         self.player_id_map = {}
@@ -76,6 +253,26 @@ class GameState:
         self.ai_players = []
         self.day_count = 0
         self.last_dead_players = []
+        self.last_guard_target = None
+        self.permission_calls_saved = 0
+        self.policy_budget = None
+        self.ai_budget = None
+        self.beliefs = {}
+
+    def open_vote_round(self) -> VoteRound:
+        """目前的投票；第一張選票時以存活玩家開啟新的一輪 (需持有 lock)"""
+        if self.vote_round is None:
+            self.vote_round = VoteRound(self.players)
+        return self.vote_round
+
+    def remove_player(self, player: Union[discord.Member, AIPlayer]) -> bool:
+        """玩家死亡/離開：移出存活名單與進行中的投票 (需持有 lock)。回傳玩家原本是否存活。"""
+        if player not in self.players:
+            return False
+        self.players.remove(player)
+        if self.vote_round is not None:
+            self.vote_round.withdraw(player)
+        return True
 
 # Guild ID -> GameState
 games: Dict[int, GameState] = {}
@@ -0,0 +1,178 @@
+# llm_gateway.py
+# 本地 LLM 閘道：由單一程序持有供應商連線、全域速率限制、板子/旁白快取，並合併相同的進行中請求。
+# 多個 bot 程序 (或與 IQ 測試同時執行) 設定 LLM_GATEWAY_URL 後以精簡用戶端模式連線，共用同一份配額。
+#
+#   python llm_gateway.py                              # 監聽 LLM_GATEWAY_URL (預設 http://127.0.0.1:8765)
+#   python llm_gateway.py --url unix:///tmp/werewolf-llm.sock
+
+import os
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from aiohttp import web
+
+from ai_manager import AIManager, LLM_GATEWAY_URL, UNIX_SCHEME
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GATEWAY_URL = "http://127.0.0.1:8765"
+MAX_PROMPT_LENGTH = 200_000 # 拒絕異常巨大的請求
+
+
+class RequestCoalescer:
+    """相同 key 的進行中請求共用同一個結果 (例如多局同時請求相同的旁白或板子)"""
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: 某個用戶端斷線不會取消其他人正在等待的請求
+        return await asyncio.shield(task)
+
+
+class LLMGateway:
+    def __init__(self, manager: AIManager):
+        self.manager = manager
+        self.coalescer = RequestCoalescer()
+        self.stats: Counter = Counter()
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=MAX_PROMPT_LENGTH * 4)
+        app.router.add_post("/v1/generate", self.handle_generate)
+        app.router.add_post("/v1/role_template", self.handle_role_template)
+        app.router.add_post("/v1/narrative", self.handle_narrative)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def _read_json(self, request: web.Request) -> Dict[str, Any]:
+        try:
+            data = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="invalid JSON")
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest(text="expected a JSON object")
+        return data
+
+    async def _coalesced(self, endpoint: str, key: Tuple, factory: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats[endpoint] += 1
+        return await self.coalescer.run((endpoint,) + key, factory)
+
+    async def handle_generate(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        prompt = data.get("prompt")
+        if not isinstance(prompt, str) or not prompt or len(prompt) > MAX_PROMPT_LENGTH:
+            raise web.HTTPBadRequest(text="prompt must be a non-empty string")
+        effort = str(data.get("reasoning_effort", "medium"))
+        call_type = str(data.get("call_type", "other"))
+        model = data.get("model") or None
+        if model is not None and not isinstance(model, str):
+            raise web.HTTPBadRequest(text="model must be a string")
+        guild = data.get("guild")
+        guild = str(guild) if guild is not None else None # 各伺服器在閘道的速率限制中公平排隊
+
+        text = await self._coalesced("generate", (prompt, effort, model), lambda: self.manager.generate_response(
+            prompt, reasoning_effort=effort, call_type=call_type, model=model, guild=guild))
+        return web.json_response({"text": text})
+
+    async def handle_role_template(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        player_count = data.get("player_count")
+        existing_roles = data.get("existing_roles")
+        if not isinstance(player_count, int) or not isinstance(existing_roles, list):
+            raise web.HTTPBadRequest(text="player_count and existing_roles are required")
+        existing_roles = [str(r) for r in existing_roles]
+
+        roles = await self._coalesced("role_template", (player_count, tuple(sorted(existing_roles))),
+                                      lambda: self.manager.generate_role_template(player_count, existing_roles))
+        return web.json_response({"roles": roles})
+
+    async def handle_narrative(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        event_type, template = data.get("event_type"), data.get("template")
+        if not isinstance(event_type, str) or not isinstance(template, str):
+            raise web.HTTPBadRequest(text="event_type and template are required")
+        language = str(data.get("language", "zh-TW"))
+        cached_only = bool(data.get("cached_only", False))
+
+        text = await self._coalesced("narrative", (event_type, template, language, cached_only),
+                                     lambda: self.manager.narrative_variant(event_type, template, language, cached_only=cached_only))
+        return web.json_response({"text": text})
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "provider": self.manager.provider,
+            "inflight": len(self.coalescer._inflight),
+            "coalesced": self.coalescer.coalesced,
+            "requests": dict(self.stats),
+            "rate_limiter_waiting": self.manager.rate_limiter.waiting,
+            "rate_limiter_rpm": round(self.manager.rate_limiter.rate * 60, 2),
+            "connections": self.manager.connection_stats,
+        })
+
+    async def start(self, url: str = DEFAULT_GATEWAY_URL):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        if url.startswith(UNIX_SCHEME):
+            path = url[len(UNIX_SCHEME):]
+            site = web.UnixSite(self._runner, path)
+            await site.start()
+            os.chmod(path, 0o600) # 只允許同一使用者的程序連線
+            self.url = url
+        else:
+            host_port = url.split("://", 1)[-1].rstrip("/")
+            host, _, port = host_port.rpartition(":")
+            site = web.TCPSite(self._runner, host or "127.0.0.1", int(port or 0))
+            await site.start()
+            bound = site._server.sockets[0].getsockname()
+            self.url = f"http://{bound[0]}:{bound[1]}"
+        logger.info(f"LLM gateway listening on {self.url} (provider: {self.manager.provider})")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        await self.manager.close()
+
+
+async def serve(url: str, warmup: bool):
+    gateway = LLMGateway(AIManager(gateway_url=""))
+    await gateway.start(url)
+    warmup_task = asyncio.create_task(gateway.manager.run_narrative_warmup()) if warmup else None
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if warmup_task:
+            warmup_task.cancel()
+        await gateway.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared LLM gateway for werewolf bot processes")
+    parser.add_argument("--url", default=LLM_GATEWAY_URL or DEFAULT_GATEWAY_URL,
+                        help="listen address: http://host:port or unix:///path/to.sock")
+    parser.add_argument("--warmup", action="store_true",
+                        default=os.getenv('NARRATIVE_WARMUP', 'false').lower() in ('1', 'true', 'yes'),
+                        help="pre-generate narrative variants while idle")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    try:
+        asyncio.run(serve(args.url, args.warmup))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# loop_monitor.py
+# 事件迴圈延遲監控：協程定期取樣迴圈延遲，背景執行緒在迴圈卡住時擷取主執行緒的堆疊，
+# 並以追蹤 span 將卡頓歸因到當時進行中的遊戲階段。成本低，可在正式環境常駐。
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional
+
+import metrics
+from tracing import INTERNAL, tracer
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR = os.getenv('LOOP_MONITOR', 'true').lower() in ('1', 'true', 'yes')
+LOOP_SAMPLE_INTERVAL = float(os.getenv('LOOP_SAMPLE_INTERVAL', '0.5')) # Seconds
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.25')) # Seconds
+MAX_STALL_RECORDS = 50
+STACK_LIMIT = 15 # 擷取的堆疊最多幾層
+
+loop_stalls = metrics.registry.counter("werewolf_event_loop_stalls_total", "Event loop stalls above the threshold by game phase", ("phase",))
+loop_stall_seconds = metrics.registry.histogram("werewolf_event_loop_stall_seconds", "Duration of event loop stalls",
+                                                buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+
+
+@dataclass
+class StallRecord:
+    lag: float
+    at: float
+    phases: List[str] = field(default_factory=list)
+    stack: str = ""
+
+
+def attribute_phases(start: float, end: float) -> List[str]:
+    """以追蹤 span 找出卡頓期間進行中的遊戲階段 (由內而外，去除重複)"""
+    spans = sorted(tracer.spans_between(start, end), key=lambda s: -s.start)
+    phases: List[str] = []
+    for span in spans:
+        if span.category == INTERNAL and span.name not in phases:
+            phases.append(span.name)
+    return phases
+
+
+class LoopMonitor:
+    """
+    取樣協程每 interval 秒更新一次心跳並量測延遲；
+    看門狗執行緒發現心跳超過 interval + threshold 沒更新時，擷取事件迴圈執行緒當下的堆疊 (即卡住的程式碼)。
+    """
+    def __init__(self, interval: float = LOOP_SAMPLE_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD, watchdog: bool = True):
+        self.interval = interval
+        self.threshold = threshold
+        self.watchdog = watchdog
+        self.stalls: Deque[StallRecord] = deque(maxlen=MAX_STALL_RECORDS)
+        self.phase_counts: Counter = Counter()
+        self._heartbeat = time.monotonic()
+        self._pending_stack = ""
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        if self.watchdog:
+            self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._thread.join(timeout=self.interval * 2)
+            self._thread = None
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0.0)
+            self._heartbeat = time.monotonic()
+            metrics.event_loop_lag.set(lag)
+            metrics.event_loop_lag_hist.observe(lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, lag: float):
+        now = time.time()
+        phases = attribute_phases(now - lag, now)
+        stack, self._pending_stack = self._pending_stack, ""
+        record = StallRecord(lag=lag, at=now, phases=phases, stack=stack)
+        self.stalls.append(record)
+
+        phase = phases[0] if phases else "idle"
+        self.phase_counts[phase] += 1
+        loop_stalls.inc(phase=phase)
+        loop_stall_seconds.observe(lag)
+        message = f"Event loop stalled for {lag * 1000:.0f}ms during {' < '.join(phases) or 'no traced phase'}"
+        if stack:
+            message += f"\nStack while blocked:\n{stack}"
+        logger.warning(message)
+
+    def _watch(self):
+        """看門狗執行緒：迴圈卡住時擷取堆疊 (每次卡頓只擷取一次)"""
+        captured_for = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            if time.monotonic() - heartbeat < self.interval + self.threshold or captured_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._pending_stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+            captured_for = heartbeat
+
+    def report(self) -> str:
+        if not self.stalls:
+            return "No event loop stalls recorded."
+        worst = max(self.stalls, key=lambda r: r.lag)
+        by_phase = ", ".join(f"{phase}: {count}" for phase, count in self.phase_counts.most_common())
+        return f"{len(self.stalls)} stalls (worst {worst.lag * 1000:.0f}ms). By phase: {by_phase}"
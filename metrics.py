@@ -0,0 +1,232 @@
+# metrics.py
+# Prometheus 文字格式的指標：計數器、量表與直方圖，以及可選的本地 /metrics HTTP 端點。
+# 不依賴 prometheus_client，端點直接跑在 bot 的事件迴圈上 (aiohttp.web)。
+
+import os
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0')) # 0 = 不啟動端點
+
+# 秒數直方圖的預設分桶 (LLM 呼叫從數百毫秒到數十秒都有)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """量表：可直接設定，或提供 callback 在抓取時計算 (回傳 {標籤值: 數值})"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        values = self.values
+        if self.callback:
+            try:
+                values = {tuple(str(v) for v in k): val for k, val in self.callback().items()}
+            except Exception as e:
+                logger.warning(f"Metric callback {self.name} failed: {e}")
+                values = {}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self.counts.get(key)
+        if counts is None:
+            counts = self.counts[key] = [0] * len(self.buckets)
+            self.sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self.sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self.counts.get(self._key(labels), ()))
+
+    def samples(self):
+        for key, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(self.sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ─── 指標定義 ───
+
+llm_requests = registry.counter("werewolf_llm_requests_total", "LLM requests by provider, call type and outcome", ("provider", "call_type", "outcome"))
+llm_latency = registry.histogram("werewolf_llm_request_duration_seconds", "LLM request latency including retries", ("provider", "call_type"))
+rate_limiter_queue = registry.gauge("werewolf_rate_limiter_queue_depth", "Requests waiting on the LLM rate limiter")
+rate_limiter_wait = registry.histogram("werewolf_rate_limiter_wait_seconds", "Time spent waiting on the LLM rate limiter")
+rate_limiter_rpm = registry.gauge("werewolf_rate_limiter_rpm", "Current adaptive LLM request rate (requests per minute)", ("key",))
+rate_limiter_throttled = registry.counter("werewolf_rate_limiter_throttled_total", "429 responses that cut the adaptive LLM request rate", ("key",))
+cache_requests = registry.counter("werewolf_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+http_connections = registry.counter("werewolf_http_connections_total", "LLM HTTP connection pool events (created, reused, dns_hit, dns_miss)", ("event",))
+model_warmup = registry.gauge("werewolf_model_warmup_seconds", "Latest model warm-up latency (cold load vs warm follow-up)", ("state",))
+prompt_sections_dropped = registry.counter("werewolf_prompt_sections_dropped_total", "Prompt sections trimmed to fit the provider token budget", ("call_type", "section"))
+cascade_requests = registry.counter("werewolf_cascade_requests_total", "Small-model drafts accepted or escalated to the primary model", ("call_type", "outcome"))
+cascade_latency = registry.histogram("werewolf_cascade_duration_seconds", "End-to-end latency of cascaded calls including escalation", ("call_type",))
+response_rejections = registry.counter("werewolf_response_rejections_total", "AI responses rejected by the post-processing filter by reason", ("call_type", "reason"))
+discord_sends = registry.counter("werewolf_discord_sends_total", "Messages sent to Discord by target kind", ("kind",))
+event_loop_lag = registry.gauge("werewolf_event_loop_lag_seconds", "Most recent event loop lag sample")
+event_loop_lag_hist = registry.histogram("werewolf_event_loop_lag_seconds_distribution", "Event loop lag samples",
+                                         buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+def set_game_source(get_games: Callable[[], Dict[int, object]]):
+    """註冊遊戲狀態來源，於抓取時計算進行中的遊戲數與每局玩家數"""
+    def active_games():
+        return {(): sum(1 for g in get_games().values() if getattr(g, "game_active", False))}
+
+    def players_per_game():
+        return {(str(gid),): len(g.players) for gid, g in get_games().items() if getattr(g, "game_active", False)}
+
+    registry.gauge("werewolf_active_games", "Games currently in progress", callback=active_games)
+    registry.gauge("werewolf_players", "Alive players per active game", ("game",), callback=players_per_game)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+class MetricsServer:
+    """本地 /metrics 端點 (事件迴圈延遲由 loop_monitor 取樣)"""
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
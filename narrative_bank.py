@@ -0,0 +1,61 @@
+# narrative_bank.py
+# 旁白語意快取：把事件內容中的玩家名稱替換為 {P1}、{P2}... 佔位符，
+# 使「天亮 + N 人死亡」等同類事件共用同一組旁白變體，生成後再代回實際名稱。
+
+import re
+from typing import Iterable, List, Optional, Tuple
+
+PLACEHOLDER_PATTERN = re.compile(r'\{P(\d+)\}')
+
+# 名稱至少 2 個字元，避免單字名稱誤替換一般詞彙 (例如「天」)
+MIN_NAME_LENGTH = 2
+
+# 預熱用的事件模板 (需與 bot.py 中 announce_event 的系統訊息格式一致)
+# 觀察到的新模板也會在閒置時自動補足變體
+WARMUP_EVENTS: List[Tuple[str, str]] = [
+    ("天黑", "夜晚行動開始，請留意私訊。"),
+    ("天亮", "🌞 **天亮了！** 請開始討論。\n昨晚是平安夜。"),
+    ("天亮", "🌞 **天亮了！** 請開始討論。\n昨晚死亡的是：**{P1}**"),
+    ("天亮", "🌞 **天亮了！** 請開始討論。\n昨晚死亡的是：**{P1}, {P2}**"),
+    ("遊戲結束", "獲勝者：狼人陣營。原因：神職已全部陣亡 (屠邊)。"),
+    ("遊戲結束", "獲勝者：狼人陣營。原因：平民已全部陣亡 (屠邊)。"),
+    ("遊戲結束", "獲勝者：好人陣營。原因：狼人已全部陣亡。"),
+]
+
+
+def compile_name_pattern(names: Iterable[str]) -> Optional[re.Pattern]:
+    """將玩家名稱/提及字串編譯為單一正規表示式 (長名稱優先，避免 AI-1 吃掉 AI-10)"""
+    unique = {n for n in names if n and len(n) >= MIN_NAME_LENGTH}
+    if not unique:
+        return None
+    ordered = sorted(unique, key=len, reverse=True)
+    return re.compile("|".join(re.escape(n) for n in ordered))
+
+
+def normalize_context(context: str, names: Iterable[str] = ()) -> Tuple[str, List[str]]:
+    """
+    將事件內容正規化為模板。
+    回傳 (模板字串, 佔位符對應的原始值列表)，相同的名稱共用同一個佔位符。
+    """
+    pattern = compile_name_pattern(names)
+    if pattern is None:
+        return context, []
+
+    slots: List[str] = []
+
+    def replace(match: re.Match) -> str:
+        value = match.group(0)
+        if value not in slots:
+            slots.append(value)
+        return f"{{P{slots.index(value) + 1}}}"
+
+    return pattern.sub(replace, context), slots
+
+
+def render(template: str, slots: List[str]) -> str:
+    """將旁白模板中的佔位符代回實際名稱，多餘的佔位符會被移除"""
+    def replace(match: re.Match) -> str:
+        idx = int(match.group(1)) - 1
+        return slots[idx] if 0 <= idx < len(slots) else ""
+
+    return PLACEHOLDER_PATTERN.sub(replace, template)
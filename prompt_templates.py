@@ -0,0 +1,355 @@
+# prompt_templates.py
+# 預先編譯的提示詞模板：每個 角色 × 階段 × 呼叫類型 的靜態骨架 (規則、角色策略、階段指導) 在載入時組好一次，
+# 每次呼叫只填入動態欄位 (局勢、發言紀錄、可選目標)。同時快取靜態部分的位元組數與估計 token 數。
+# assemble() 依各區段的優先順序把提示詞壓進供應商的 token 預算 (低優先的區段先刪)。
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ai_strategies import ROLE_STRATEGIES
+
+DAY_PATTERN = re.compile(r'第\s*(\d+)\s*天')
+CJK_PATTERN = re.compile(r'[\u3000-\u9fff\uff00-\uffef]')
+
+PHASES = ("early", "mid", "late")
+PHASE_LABELS = {"early": "前期（Day 1-2）", "mid": "中期（Day 3-4）", "late": "殘局（Day 5+）"}
+
+_SLOT = "\x00" # 動態欄位的分隔符 (不會出現在策略文字中)
+
+# 超出預算時的刪減順序 (數字越小越先刪)；未列出的區段 (規則、身分、局勢、可選目標) 一律保留。
+# 發言紀錄從最舊的一行開始刪，其餘區段整段刪除。
+SECTION_PRIORITIES: Dict[str, int] = {
+    "reasoning_guide": 1,      # 通用思考步驟
+    "speech_guide": 2,         # 角色整體策略
+    "history_text": 3,         # 發言紀錄
+    "phase_guide": 4,          # 夜晚行動/投票指導
+    "current_phase_guide": 4,  # 當前階段策略
+}
+HISTORY_SECTION = "history_text"
+HISTORY_OMITTED = "（較早的 {count} 則發言已省略）"
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：中日韓字元約 1 字 1 token，其餘約 4 字元 1 token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def phase_for_context(game_context: str) -> str:
+    """由局勢描述中的天數判斷遊戲階段 (early/mid/late)"""
+    day_match = DAY_PATTERN.search(game_context)
+    if day_match:
+        day = int(day_match.group(1))
+        if day <= 2:
+            return "early"
+        elif day <= 4:
+            return "mid"
+        else:
+            return "late"
+    return "early"
+
+
+class PromptTemplate:
+    """
+    已編譯的模板：靜態文字與動態欄位名稱交錯存放，render 時只做一次 join。
+    可刪減的靜態區段 (SECTION_PRIORITIES) 也保留為欄位，未指定時填入預設文字。
+    static_bytes / static_tokens 為完整靜態部分 (含可刪減區段) 的大小，section_tokens 為各可刪減區段的大小。
+    """
+    __slots__ = ("parts", "slots", "defaults", "section_tokens", "static_bytes", "static_tokens")
+
+    def __init__(self, skeleton: str, static: Dict[str, str], dynamic: Iterable[str]):
+        values = dict(static)
+        self.defaults: Dict[str, str] = {name: values.pop(name) for name in SECTION_PRIORITIES if name in values}
+        values.update({name: f"{_SLOT}{name}{_SLOT}" for name in list(dynamic) + list(self.defaults)})
+        pieces = skeleton.format(**values).split(_SLOT)
+        # 偶數索引為靜態文字，奇數索引為欄位名稱
+        self.parts: Tuple[str, ...] = tuple(pieces)
+        self.slots: Tuple[str, ...] = tuple(name for name in pieces[1::2] if name not in self.defaults)
+        self.section_tokens: Dict[str, int] = {name: estimate_tokens(text) for name, text in self.defaults.items()}
+        static_text = "".join(self.defaults.get(p, "") if i % 2 else p for i, p in enumerate(pieces))
+        self.static_bytes = len(static_text.encode("utf-8"))
+        self.static_tokens = estimate_tokens(static_text)
+
+    def render(self, **values) -> str:
+        parts, defaults = self.parts, self.defaults
+        out: List[str] = [parts[0]]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            out.append(str(values[name]) if name in values else defaults[name])
+            out.append(parts[i + 1])
+        return "".join(out)
+
+
+@dataclass
+class AssembledPrompt:
+    text: str
+    tokens: int                                                # 估計 token 數
+    dropped: Dict[str, int] = field(default_factory=dict)      # 被刪減的區段 -> 刪掉的估計 token 數
+    history_dropped: int = 0                                   # 被省略的發言紀錄行數
+
+
+def assemble(template: PromptTemplate, budget: int, history: Sequence[str] = (), history_prefix: str = "",
+             **values) -> AssembledPrompt:
+    """
+    組出提示詞並壓進 token 預算 (budget <= 0 表示不限制)。
+    history 為發言紀錄 (由舊到新)，與 history_prefix 一起組成 history_text 欄位；模板沒有此欄位時忽略。
+    超出預算時依 SECTION_PRIORITIES 由低到高刪減；只剩必要區段仍超出時照樣送出 (tokens > budget)。
+    """
+    has_history = HISTORY_SECTION in template.slots
+    if has_history:
+        values[HISTORY_SECTION] = history_prefix + "\n".join(history)
+    tokens = template.static_tokens + sum(estimate_tokens(str(values[name])) for name in template.slots)
+    if budget <= 0 or tokens <= budget:
+        return AssembledPrompt(template.render(**values), tokens)
+
+    result = AssembledPrompt("", tokens)
+    sections = list(template.defaults)
+    if has_history and history:
+        sections.append(HISTORY_SECTION)
+    for name in sorted(sections, key=SECTION_PRIORITIES.__getitem__):
+        if result.tokens <= budget:
+            break
+        if name == HISTORY_SECTION:
+            _trim_history(result, budget, history, history_prefix, values)
+        else:
+            values[name] = ""
+            result.tokens -= template.section_tokens[name]
+            result.dropped[name] = template.section_tokens[name]
+    result.text = template.render(**values)
+    return result
+
+
+def _trim_history(result: AssembledPrompt, budget: int, history: Sequence[str], prefix: str, values: Dict[str, object]):
+    """從最舊的一行開始刪，並以一行說明取代被省略的部分"""
+    before = estimate_tokens(values[HISTORY_SECTION])
+    line_tokens = [estimate_tokens(line) + 1 for line in history]
+    excess = result.tokens - budget + estimate_tokens(HISTORY_OMITTED.format(count=len(history)))
+    drop = 0
+    while drop < len(history) and excess > 0:
+        excess -= line_tokens[drop]
+        drop += 1
+    kept = [HISTORY_OMITTED.format(count=drop)] + list(history[drop:])
+    values[HISTORY_SECTION] = prefix + "\n".join(kept)
+    after = estimate_tokens(values[HISTORY_SECTION])
+    result.tokens -= before - after
+    result.dropped[HISTORY_SECTION] = before - after
+    result.history_dropped = drop
+
+
+ACTION_SKELETON = """
+# {phase_label}
+你正在玩狼人殺。你的身分是：【{role}】。
+當前局勢：{game_context}
+你可以選擇的目標（玩家編號）有：{valid_targets}。
+{history_text}
+
+# 決策分析（僅供內部推理，不要輸出分析過程）
+請在心中完成以下分析步驟，然後只輸出最終的目標編號：
+{reasoning_guide}
+
+# 策略指導
+{phase_guide}
+
+⚠️ 行動規則（必須遵守）：
+- 你「只能」從上方列出的「可選擇目標」中選擇一個編號。
+- 不要選擇不在目標列表中的編號。
+- 你只能依據上方提供的「當前局勢」和「發言紀錄」做出判斷，不可虛構理由。
+- 如果資訊不足以做出判斷，請回傳 'no'。
+
+# 輸出格式
+請只回傳你選擇的目標編號（一個數字）。
+如果你決定不行動、空守或棄票，請回傳 'no'。
+只回傳結果，不要解釋。
+"""
+
+FIRST_SPEAKER_SCENE = """
+# 當前場景限制（最重要的一點）
+**現在輪到你發言。你是本輪的「第 1 位」發言者（首置位）。**
+**在你之前「沒有任何玩家」發過言。**
+
+**嚴禁捏造資訊**：你只能根據上方「角色設定」所提供的資訊發言。
+禁止聲稱你擁有任何未明確列出的查驗結果、守護記錄、或其他資訊。
+如果你的身分沒有任何夜晚資訊可報，就誠實表達「目前沒資訊」。
+"""
+
+FIRST_SPEAKER_LOGIC = """
+# 思考邏輯與限制
+1. **絕對禁止** 說「我同意前面玩家的說法」或「聽到有人說...」，因為你是第一個，這會讓你產生幻覺。
+2. 因為你是第一個，場上還沒有邏輯資訊。請根據你的身分選擇策略：
+   - **如果你有夜晚資訊（神職）**：可以選擇起跳報資訊，或者隱藏身分先觀察。
+   - **如果你沒有夜晚資訊（平民）**：針對昨晚的死亡情況做評論，表達你的初步判斷。不要只是說「沒資訊」就結束——至少對局勢提出一個觀點或問題。
+   - **如果你是狼人**：選擇偽裝策略。可以發起一個話題引導討論方向，或者低調模仿平民。
+3. 你的目標是：符合你所屬陣營的最大利益，並引導局勢（或隱藏自己）。
+"""
+
+LATER_SPEAKER_SCENE = """
+# 當前場景限制
+在你之前已經有 {speaker_count} 位玩家發言了。
+以下是他們的發言紀錄：
+{history_text}
+"""
+
+LATER_SPEAKER_LOGIC = """
+# 思考邏輯與限制
+1. 你必須參考前面玩家的發言內容。具體做法：
+   - 選擇 1-2 位前面發言的玩家，引用他們的觀點（使用「X 號說...」的格式）。
+   - 明確表達你是同意還是反對，並給出理由。
+2. 你可以選擇：
+   - 站邊：支持某位玩家的邏輯，攻擊另一位。
+   - 質疑：指出某位玩家發言中的矛盾或可疑之處。
+   - 辯解：如果之前有人懷疑你，回應他的質疑。
+   - 歸票：明確說出你認為應該票誰。
+3. 你的發言必須有「落點」——最後要給出一個明確的態度或結論。
+4. 你的目標是：符合你所屬陣營的最大利益，並引導局勢（或隱藏自己）。
+
+**嚴禁捏造資訊**：你只能引用上方「發言紀錄」中實際出現的內容。
+禁止聲稱任何玩家說了紀錄中沒有的話。
+禁止虛構查驗結果、守護資訊、或任何未明確提供的遊戲事件。
+"""
+
+SPEECH_SKELETON = """
+# 角色設定
+你是狼人殺遊戲中的玩家，你的編號是 {player_id} 號。
+你的真實身分是【{role}】。
+{game_context}
+
+你的發言風格：{speech_style}
+你的主要目標：{objective}
+
+# 角色策略
+{speech_guide}
+
+# 當前階段策略（{phase_label}）
+{current_phase_guide}
+
+{scene_restriction}
+
+# 思考步驟（在心中完成以下分析，不要將分析過程輸出到發言中）
+{reasoning_guide}
+綜合以上分析，決定你的發言策略，然後直接輸出你的發言內容。
+
+# 你的發言任務
+請進行發言（{speech_length}字），語氣要自然，像真人玩家一樣（可以使用口語、語助詞）。
+你的發言必須包含至少一個具體的觀點或判斷，不要空泛地划水。
+嚴禁暴露你是 AI。
+
+# ⚠️ 防止幻覺規則（最高優先級）
+- 你「只能」使用本提示中明確提供的資訊。
+- 不可捏造任何遊戲事件、玩家發言、查驗結果或行動。
+- 如果你不確定某件事，請說「我不確定」或「我沒有資訊」，而非編造內容。
+
+{logic_restriction}
+
+請開始你的發言（只輸出發言內容，不要輸出分析過程）：
+"""
+
+LAST_WORDS_SKELETON = """
+# 角色設定
+你是狼人殺遊戲中的玩家，你的編號是 {player_id} 號。
+你的真實身分是【{role}】。
+{game_context}
+
+# 當前狀況
+**你剛剛被投票處決了。**
+現在是你發表「遺言」的時間。這是你對場上玩家說的最後一句話。
+
+你的發言風格：{speech_style}
+你的主要目標：{objective}
+
+# 思考邏輯
+1. 根據你的陣營決定策略：
+   - **好人陣營**：誠懇地告訴大家你是好人，提醒大家注意誰是狼，或者分析剛才的票型。
+   - **狼人陣營**：偽裝成好人被誤殺的樣子，表現出憤怒、委屈，或者繼續誤導好人去推別人。
+2. 參考剛才的局勢（誰投了你？誰救了你？）。
+3. 這是最後的機會，讓大家相信你的身分。
+
+# 你的任務
+請簡短地發表遺言（30-50字）。
+語氣要符合你的角色設定（{speech_style}）。
+嚴禁暴露你是 AI。
+
+請直接輸出遺言內容：
+"""
+
+
+def _compile_action(role: str, is_voting: bool) -> PromptTemplate:
+    info = ROLE_STRATEGIES.get(role, {})
+    return PromptTemplate(ACTION_SKELETON, {
+        "phase_label": "投票決策" if is_voting else "夜晚行動決策",
+        "role": role,
+        "reasoning_guide": info.get("reasoning_guide", ""),
+        "phase_guide": info.get("voting_guide", "") if is_voting else info.get("action_guide", ""),
+    }, ("game_context", "valid_targets", "history_text"))
+
+
+def _compile_speech(role: str, phase: str, first_speaker: bool) -> PromptTemplate:
+    info = ROLE_STRATEGIES.get(role, {})
+    static = {
+        "role": role,
+        "speech_style": info.get("speech_style", "自然"),
+        "objective": info.get("objective", "獲得勝利"),
+        "speech_guide": info.get("speech_guide", ""),
+        "phase_label": PHASE_LABELS.get(phase, "前期"),
+        "current_phase_guide": info.get("phase_guide", {}).get(phase, ""),
+        "reasoning_guide": info.get("reasoning_guide", ""),
+        "logic_restriction": FIRST_SPEAKER_LOGIC if first_speaker else LATER_SPEAKER_LOGIC,
+    }
+    if first_speaker:
+        static["scene_restriction"] = FIRST_SPEAKER_SCENE
+    else:
+        # 後置位的場景區塊含有發言人數與發言紀錄兩個動態欄位
+        static["scene_restriction"] = LATER_SPEAKER_SCENE.format(
+            speaker_count=f"{_SLOT}speaker_count{_SLOT}", history_text=f"{_SLOT}history_text{_SLOT}")
+    return PromptTemplate(SPEECH_SKELETON, static, ("player_id", "game_context", "speech_length"))
+
+
+def _compile_last_words(role: str) -> PromptTemplate:
+    info = ROLE_STRATEGIES.get(role, {})
+    return PromptTemplate(LAST_WORDS_SKELETON, {
+        "role": role,
+        "speech_style": info.get("speech_style", "自然"),
+        "objective": info.get("objective", "獲得勝利"),
+    }, ("player_id", "game_context"))
+
+
+class PromptLibrary:
+    """所有已編譯模板；未列於 ROLE_STRATEGIES 的角色在第一次使用時編譯並快取"""
+    def __init__(self, roles: Iterable[str] = ()):
+        self.action: Dict[Tuple[str, bool], PromptTemplate] = {}
+        self.speech: Dict[Tuple[str, str, bool], PromptTemplate] = {}
+        self.last_words: Dict[str, PromptTemplate] = {}
+        for role in roles:
+            for is_voting in (False, True):
+                self.action_template(role, is_voting)
+            for phase in PHASES:
+                for first_speaker in (True, False):
+                    self.speech_template(role, phase, first_speaker)
+            self.last_words_template(role)
+
+    def action_template(self, role: str, is_voting: bool) -> PromptTemplate:
+        key = (role, is_voting)
+        template = self.action.get(key)
+        if template is None:
+            template = self.action[key] = _compile_action(role, is_voting)
+        return template
+
+    def speech_template(self, role: str, phase: str, first_speaker: bool) -> PromptTemplate:
+        key = (role, phase, first_speaker)
+        template = self.speech.get(key)
+        if template is None:
+            template = self.speech[key] = _compile_speech(role, phase, first_speaker)
+        return template
+
+    def last_words_template(self, role: str) -> PromptTemplate:
+        template = self.last_words.get(role)
+        if template is None:
+            template = self.last_words[role] = _compile_last_words(role)
+        return template
+
+    def __len__(self) -> int:
+        return len(self.action) + len(self.speech) + len(self.last_words)
+
+
+# 載入時預先編譯所有已知角色
+prompt_library = PromptLibrary(ROLE_STRATEGIES)
@@ -0,0 +1,117 @@
+# response_filters.py
+# AI 回應的後處理：去除 Markdown 與「主持人：」等前綴、依呼叫類型限制長度，並檢查
+#
+#   hallucination : 首位發言者引用根本不存在的前人發言 (「前面幾位說…」)
+#   role_leak     : 旁白提到事件資訊以外的身分；狼人陣營在發言/遺言中自曝身分或隊友
+#
+# 所有檢查合併為一個預先編譯的正規表示式 (具名群組的 alternation)，每則回應只掃描一次，成本為 O(回應長度)。
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from game_data import ROLE_DESCRIPTIONS, WOLF_FACTION
+
+# 首位發言者不應出現的引用前人用語 (與 tests/test_ai_iq.py 的幻覺評分一致)
+HALLUCINATION_PHRASES = (
+    r"前面.{0,5}(?:說|提|講)",
+    r"同意.{0,5}(?:的|說法|觀點)",
+    r"\d+\s*號.{0,5}(?:說|提到|認為)",
+    r"剛才.{0,5}(?:有人|玩家)",
+    r"聽[到了].{0,5}(?:有人|玩家)",
+)
+
+
+def _alternation(words: Iterable[str]) -> str:
+    # 長的名稱優先，避免「白狼王」被「狼王」先匹配
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+FILTER_PATTERN = re.compile(
+    rf"(?P<hallucination>{'|'.join(HALLUCINATION_PHRASES)})"
+    rf"|(?P<wolf_claim>(?<!如果)(?<!假如)(?<!要是)(?<!若)(?:我|本人)(?:就是|是|身為|作為)(?:一[名隻個])?(?:{_alternation(WOLF_FACTION)})(?!的話)|我的狼隊友|我們狼隊)"
+    rf"|(?P<role>{_alternation(ROLE_DESCRIPTIONS)})"
+)
+MARKDOWN_PATTERN = re.compile(r"\*+|__|~~|`+|^#{1,6}\s*|^>\s?", re.MULTILINE)
+PREFIX_PATTERN = re.compile(r"^\s*[(（【\[]?(?:主持人|上帝|法官|旁白|系統|\d+\s*號(?:玩家)?)[)）】\]]?\s*[:：]\s*")
+SENTENCE_PATTERN = re.compile(r"[^。！？!?\n]+[。！？!?]*\n?|\n")
+SENTENCE_ENDS = "。！？!?…"
+
+# 各呼叫類型的長度上限 (字)，超過時在句尾截斷；其他類型只受 Discord 訊息長度限制
+RESPONSE_LIMITS = {"narrative": 150, "speech": 400, "last_words": 300}
+# 旁白一律可以提到的泛稱 (例如「狼人們請睜眼」)
+NARRATIVE_GENERIC_ROLES = {"狼人"}
+
+# 重新生成時附在提示詞後的修正說明
+REASK_HINTS = {
+    "hallucination": "你是第一位發言者，在你之前沒有任何人發言；不要引用、同意或回應其他玩家的發言。",
+    "role_leak": "不要透露任何玩家的真實身分，也不要承認自己或隊友屬於狼人陣營。",
+}
+
+
+@dataclass(frozen=True)
+class FilterResult:
+    text: str
+    problems: Tuple[str, ...] = ()
+    spans: Tuple[Tuple[int, int], ...] = () # 有問題的片段位置 (text 內)
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def without_problems(self) -> str:
+        """刪除含有問題片段的句子 (重新生成後仍不合格時的退路)"""
+        kept: List[str] = []
+        for sentence in SENTENCE_PATTERN.finditer(self.text):
+            if not any(start < sentence.end() and sentence.start() < end for start, end in self.spans):
+                kept.append(sentence.group())
+        return "".join(kept).strip()
+
+
+def fit_length(text: str, limit: int) -> str:
+    """超過上限時在最後一個句尾截斷；句尾太前面就直接截斷並加上刪節號"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = max(cut.rfind(mark) for mark in SENTENCE_ENDS)
+    if end >= limit // 2:
+        return cut[:end + 1]
+    return cut[:limit - 3] + "..."
+
+
+class ResponseFilter:
+    """
+    AIManager 共用的回應後處理。clean 只做格式整理與長度限制 (串流顯示時逐段呼叫)；
+    check 另外掃描問題用語，回傳 FilterResult 由呼叫端決定是否重新生成。
+    """
+    def __init__(self, max_length: int, limits: Optional[Dict[str, int]] = None):
+        self.max_length = max_length
+        self.limits = RESPONSE_LIMITS if limits is None else limits
+
+    def clean(self, text: str, call_type: str = "other") -> str:
+        text = PREFIX_PATTERN.sub("", MARKDOWN_PATTERN.sub("", text.strip()), count=1).strip()
+        return fit_length(text, min(self.limits.get(call_type, self.max_length), self.max_length))
+
+    def check(self, text: str, call_type: str = "other", first_speaker: bool = False, role: Optional[str] = None,
+              context: str = "") -> FilterResult:
+        """
+        first_speaker: 發言者前面沒有任何人發言 (檢查幻覺用語)。
+        role: 發言者的真實身分 (狼人陣營檢查自曝)。
+        context: 旁白的事件資訊，其中提到的身分不算洩漏。
+        """
+        text = self.clean(text, call_type)
+        wolf = role in WOLF_FACTION and call_type in ("speech", "last_words")
+        allowed = NARRATIVE_GENERIC_ROLES | {m.group("role") for m in FILTER_PATTERN.finditer(context) if m.group("role")}
+        problems: Dict[str, None] = {}
+        spans: List[Tuple[int, int]] = []
+        for match in FILTER_PATTERN.finditer(text):
+            if match.group("hallucination"):
+                problem = "hallucination" if first_speaker else None
+            elif match.group("wolf_claim"):
+                problem = "role_leak" if wolf else None
+            else:
+                problem = "role_leak" if call_type == "narrative" and match.group("role") not in allowed else None
+            if problem:
+                problems[problem] = None
+                spans.append(match.span())
+        return FilterResult(text, tuple(problems), tuple(spans))
@@ -0,0 +1,174 @@
+# role_beliefs.py
+# AI 玩家的身分信念追蹤：每位 AI 維護一個「座位 × 角色」機率矩陣，
+# 依公開事件 (死亡、票型、起跳宣稱) 與私有事件 (查驗結果、狼隊友) 以向量化運算增量更新，
+# 並輸出精簡的「嫌疑排行」摘要取代冗長的發言紀錄。
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from game_data import WOLF_FACTION
+
+# 似然值設定
+NIGHT_KILL_WOLF_LIKELIHOOD = 0.3   # 夜晚被刀的人較不可能是狼 (狼人很少自刀)
+CLAIM_TRUE_LIKELIHOOD = 3.0        # 宣稱某身分：可能是真的
+CLAIM_BLUFF_LIKELIHOOD = 1.5       # ...或是狼人悍跳
+CLAIM_OTHER_LIKELIHOOD = 0.2       # 其他身分宣稱的可能性很低
+VOTE_WOLF_PENALTY = 0.6            # 投給高狼機率者：投票者較不像狼
+SINKHORN_ITERATIONS = 10
+# 隱狼被查驗時顯示為好人
+HIDDEN_WOLF = "隱狼"
+
+
+class RoleBeliefTracker:
+    """
+    單一觀察者的信念矩陣。列為座位、欄為角色；
+    列和為 1，欄和等於該角色在本局的張數 (以 Sinkhorn 迭代維持)。
+    """
+    def __init__(self, seat_ids: List[int], role_pool: List[str], observer: Optional[int] = None, observer_role: Optional[str] = None):
+        self.seats = list(seat_ids)
+        self.roles = sorted(set(role_pool))
+        self.seat_index = {s: i for i, s in enumerate(self.seats)}
+        self.role_index = {r: j for j, r in enumerate(self.roles)}
+        self.role_counts = np.array([role_pool.count(r) for r in self.roles], dtype=float)
+        self.wolf_mask = np.array([r in WOLF_FACTION for r in self.roles])
+        self.observer = observer
+        self.teammates: List[int] = []
+
+        n = len(self.seats)
+        self.probs = np.tile(self.role_counts / max(n, 1), (n, 1))
+        self.fixed = np.zeros(n, dtype=bool) # 已確定身分的座位
+        self.alive = np.ones(n, dtype=bool)
+
+        if observer is not None and observer_role is not None:
+            self.fix_role(observer, observer_role)
+
+    # ─── 內部工具 ───
+
+    def _rows(self, seats: Iterable[int]) -> np.ndarray:
+        return np.array([self.seat_index[s] for s in seats if s in self.seat_index], dtype=int)
+
+    def _normalize(self):
+        """Sinkhorn 迭代：列和為 1、欄和逼近角色張數，已確定的座位不變"""
+        p = self.probs
+        free = ~self.fixed
+        target = np.maximum(self.role_counts - p[self.fixed].sum(axis=0), 0.0)
+        for _ in range(SINKHORN_ITERATIONS):
+            col_sums = p[free].sum(axis=0)
+            scale = np.divide(target, col_sums, out=np.ones_like(col_sums), where=col_sums > 0)
+            p[free] *= scale
+            row_sums = p.sum(axis=1, keepdims=True)
+            np.divide(p, row_sums, out=p, where=row_sums > 0)
+
+    # ─── 事件更新 ───
+
+    def fix_role(self, seat: int, role: str):
+        """確定某座位的身分 (自己、狼隊友或已公開的身分)"""
+        i = self.seat_index.get(seat)
+        j = self.role_index.get(role)
+        if i is None or j is None:
+            return
+        self.probs[i] = 0.0
+        self.probs[i, j] = 1.0
+        self.fixed[i] = True
+        self._normalize()
+
+    def observe_teammates(self, wolf_seats: Iterable[int]):
+        """狼人私有資訊：知道所有狼隊友，其餘座位必為好人"""
+        self.teammates = [s for s in wolf_seats if s != self.observer]
+        rows = self._rows(wolf_seats)
+        others = np.setdiff1d(np.arange(len(self.seats)), rows)
+        self.probs[np.ix_(rows, ~self.wolf_mask)] = 0.0
+        self.probs[np.ix_(others, self.wolf_mask)] = 0.0
+        self._normalize()
+
+    def observe_seer_result(self, seat: int, is_wolf: bool):
+        """預言家私有資訊：查驗結果 (隱狼顯示為好人)"""
+        i = self.seat_index.get(seat)
+        if i is None:
+            return
+        shown_wolf = self.wolf_mask.copy()
+        if HIDDEN_WOLF in self.role_index:
+            shown_wolf[self.role_index[HIDDEN_WOLF]] = False
+        self.probs[i, ~shown_wolf if is_wolf else shown_wolf] = 0.0
+        self._normalize()
+
+    def observe_deaths(self, seats: Iterable[int], night_kill: bool = True):
+        """公開事件：玩家死亡。夜晚死亡者較可能是好人。"""
+        rows = self._rows(seats)
+        if rows.size == 0:
+            return
+        self.alive[rows] = False
+        if night_kill:
+            free = rows[~self.fixed[rows]]
+            self.probs[np.ix_(free, self.wolf_mask)] *= NIGHT_KILL_WOLF_LIKELIHOOD
+            self._normalize()
+
+    def observe_claim(self, seat: int, role: str):
+        """公開事件：某玩家起跳宣稱身分 (可能是真，也可能是狼人悍跳)"""
+        i = self.seat_index.get(seat)
+        j = self.role_index.get(role)
+        if i is None or j is None or self.fixed[i]:
+            return
+        likelihood = np.full(len(self.roles), CLAIM_OTHER_LIKELIHOOD)
+        likelihood[self.wolf_mask] = CLAIM_BLUFF_LIKELIHOOD
+        likelihood[j] = CLAIM_TRUE_LIKELIHOOD
+        self.probs[i] *= likelihood
+        self._normalize()
+
+    def observe_votes(self, ballots: Dict[int, int]):
+        """
+        公開事件：一輪票型 (投票者 -> 目標)。
+        投給高狼機率者的人較不像狼 (狼人很少投隊友)。
+        """
+        pairs = [(self.seat_index[v], self.seat_index[t]) for v, t in ballots.items()
+                 if v in self.seat_index and t in self.seat_index]
+        if not pairs:
+            return
+        voters, targets = np.array(pairs, dtype=int).T
+        target_wolf = self.probs[targets][:, self.wolf_mask].sum(axis=1)
+        factor = 1.0 - VOTE_WOLF_PENALTY * target_wolf
+        free = ~self.fixed[voters]
+        rows = voters[free]
+        self.probs[np.ix_(rows, self.wolf_mask)] *= factor[free, None]
+        self._normalize()
+
+    # ─── 查詢 ───
+
+    def wolf_probabilities(self) -> Dict[int, float]:
+        wolf = self.probs[:, self.wolf_mask].sum(axis=1)
+        return {s: float(wolf[i]) for i, s in enumerate(self.seats)}
+
+    def top_suspects(self, k: int = 3) -> List[Tuple[int, float]]:
+        """存活且非自己的座位中，狼人機率最高的前 k 名"""
+        wolf = self.probs[:, self.wolf_mask].sum(axis=1)
+        candidates = self.alive.copy()
+        if self.observer in self.seat_index:
+            candidates[self.seat_index[self.observer]] = False
+        order = np.argsort(-wolf)
+        return [(self.seats[i], float(wolf[i])) for i in order if candidates[i]][:k]
+
+    def likely_role(self, role: str) -> Optional[Tuple[int, float]]:
+        """存活座位中最可能是指定身分的玩家"""
+        j = self.role_index.get(role)
+        if j is None:
+            return None
+        column = np.where(self.alive, self.probs[:, j], -1.0)
+        if self.observer in self.seat_index:
+            column[self.seat_index[self.observer]] = -1.0
+        i = int(np.argmax(column))
+        return (self.seats[i], float(column[i])) if column[i] > 0 else None
+
+    def summary(self, k: int = 3) -> str:
+        """精簡的嫌疑摘要 (用於提示詞)"""
+        if self.teammates:
+            # 狼人視角：隊友已知，重點是找出神職
+            text = "狼隊友：" + "、".join(f"{s}號" for s in self.teammates)
+        else:
+            suspects = "、".join(f"{s}號({p:.0%})" for s, p in self.top_suspects(k))
+            text = f"狼人嫌疑排行：{suspects or '無'}"
+        for role in ("預言家", "女巫"):
+            guess = self.likely_role(role)
+            if guess and guess[1] >= 0.4:
+                text += f"；疑似{role}：{guess[0]}號({guess[1]:.0%})"
+        return text
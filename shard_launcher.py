@@ -0,0 +1,109 @@
+# shard_launcher.py
+# 多程序分片部署：把 Discord 分片分配給數個 bot 程序 (每個程序一個 CPU 核心)，
+# 各程序透過 RATE_LIMIT_DB 的 SQLite Token Bucket 共用同一個 LLM 配額。
+#
+#   python shard_launcher.py --processes 4            # 4 個程序、4 個分片
+#   python shard_launcher.py --processes 2 --shards 4 # 每個程序負責 2 個分片
+#   python shard_launcher.py --processes 4 --gateway  # 另外啟動共用的 LLM 閘道 (llm_gateway.py)
+
+import os
+import sys
+import signal
+import asyncio
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+)
+logger = logging.getLogger("shard_launcher")
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+GATEWAY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_gateway.py")
+DEFAULT_GATEWAY_SOCKET = "unix:///tmp/werewolf-llm.sock"
+DEFAULT_RATE_LIMIT_DB = "rate_limit.db"
+RESTART_BACKOFF = (1.0, 60.0) # 程序崩潰後重啟的最短/最長等待秒數
+
+
+def plan_shards(processes: int, shard_count: int) -> List[List[int]]:
+    """以輪詢方式把分片分配給程序 (程序數多於分片時，多餘的程序不啟動)"""
+    processes = max(1, min(processes, shard_count))
+    return [list(range(i, shard_count, processes)) for i in range(processes)]
+
+
+def build_env(index: int, shard_ids: List[int], shard_count: int, base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = dict(os.environ if base is None else base)
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = ",".join(str(s) for s in shard_ids)
+    env.setdefault("RATE_LIMIT_DB", os.path.abspath(DEFAULT_RATE_LIMIT_DB))
+    # 每個程序各自的 /metrics 埠號
+    metrics_port = int(env.get("METRICS_PORT", "0") or 0)
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + index)
+    return env
+
+
+async def supervise(name: str, script: str, env: Dict[str, str], stopping: asyncio.Event):
+    """執行一個子程序，非正常結束時以指數退避重啟"""
+    backoff = RESTART_BACKOFF[0]
+    while not stopping.is_set():
+        proc = await asyncio.create_subprocess_exec(sys.executable, script, env=env)
+        logger.info(f"{name} started, pid {proc.pid}")
+
+        wait_exit = asyncio.create_task(proc.wait())
+        wait_stop = asyncio.create_task(stopping.wait())
+        await asyncio.wait({wait_exit, wait_stop}, return_when=asyncio.FIRST_COMPLETED)
+        if not wait_exit.done():
+            proc.terminate()
+            await wait_exit
+        wait_stop.cancel()
+
+        if stopping.is_set() or proc.returncode == 0:
+            return
+        logger.warning(f"{name} exited with code {proc.returncode}, restarting in {backoff:.0f}s")
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=backoff)
+        except asyncio.TimeoutError:
+            pass
+        backoff = min(backoff * 2, RESTART_BACKOFF[1])
+
+
+async def launch(processes: int, shard_count: int, gateway_url: Optional[str] = None):
+    plan = plan_shards(processes, shard_count)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError: # Windows
+            pass
+
+    jobs = []
+    base = dict(os.environ)
+    if gateway_url:
+        # 閘道持有供應商連線與配額，bot 程序以用戶端模式連線
+        base["LLM_GATEWAY_URL"] = gateway_url
+        jobs.append(supervise("LLM gateway", GATEWAY_SCRIPT, base, stopping))
+
+    logger.info(f"Launching {len(plan)} processes for {shard_count} shards: {plan}")
+    for i, ids in enumerate(plan):
+        jobs.append(supervise(f"Process {i} (shards {ids})", BOT_SCRIPT, build_env(i, ids, shard_count, base), stopping))
+    await asyncio.gather(*jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the werewolf bot as several sharded processes")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="bot processes (default: CPU cores)")
+    parser.add_argument("--shards", type=int, default=0, help="total Discord shards (default: one per process)")
+    parser.add_argument("--gateway", nargs="?", const=DEFAULT_GATEWAY_SOCKET, default=None, metavar="URL",
+                        help=f"also run a shared LLM gateway (default: {DEFAULT_GATEWAY_SOCKET})")
+    args = parser.parse_args()
+
+    shard_count = args.shards or args.processes
+    asyncio.run(launch(args.processes, shard_count, args.gateway))
+
+
+if __name__ == "__main__":
+    main()
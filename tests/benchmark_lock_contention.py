@@ -0,0 +1,85 @@
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import bot
+from game_objects import GameState, InstrumentedLock
+
+class SlowResponse:
+    """模擬 Discord interaction 回應的網路往返延遲"""
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def send_message(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+
+def make_voter(guild_id: int, user_id: int, latency: float):
+    interaction = MagicMock()
+    interaction.guild_id = guild_id
+    interaction.user = MagicMock(name=f"voter{user_id}", bot=False)
+    interaction.user.mention = f"<@{user_id}>"
+    interaction.response = SlowResponse(latency)
+    interaction.channel = MagicMock()
+    interaction.channel.send = AsyncMock()
+    return interaction
+
+def setup_game(guild_id: int, voters):
+    game = bot.get_game(guild_id)
+    game.reset()
+    game.lock = InstrumentedLock()
+    game.players = [v.user for v in voters]
+    game.player_ids = {i: p for i, p in enumerate(game.players, 1)}
+    game.player_id_map = {p: i for i, p in game.player_ids.items()}
+    game.game_active = True
+    return game
+
+async def legacy_vote(interaction, target_id: str):
+    """舊版 /vote：在 Lock 內等待 Discord 回應 (僅供比較)"""
+    game = bot.get_game(interaction.guild_id)
+    target_member = game.player_ids.get(int(target_id))
+    async with game.lock:
+        game.open_vote_round().cast(interaction.user, target_member)
+        await interaction.response.send_message(f"{interaction.user.mention} 投票成功。")
+
+async def run_round(vote_fn, voters: int, latency: float, guild_id: int):
+    interactions = [make_voter(guild_id, i, latency) for i in range(voters)]
+    game = setup_game(guild_id, interactions)
+    start = time.perf_counter()
+    await asyncio.gather(*(vote_fn(it, str((i % voters) + 1)) for i, it in enumerate(interactions)))
+    elapsed = time.perf_counter() - start
+    assert sum(game.vote_round.counts.values()) == voters
+    return elapsed, game.lock.stats
+
+async def benchmark(voters: int, latency: float, rounds: int):
+    print(f"--- Benchmark: {voters} concurrent /vote calls, {latency * 1000:.0f}ms Discord latency ---")
+    print(f"{'variant':>10}{'votes/s':>10}{'wall ms':>10}{'max wait ms':>13}{'max hold ms':>13}")
+    with patch('bot.resolve_votes', new_callable=AsyncMock):
+        for name, fn in (("legacy", legacy_vote), ("current", bot.vote.callback)):
+            walls, max_wait, max_hold = [], 0.0, 0.0
+            for r in range(rounds):
+                elapsed, stats = await run_round(fn, voters, latency, guild_id=900000 + r)
+                walls.append(elapsed)
+                max_wait = max(max_wait, stats.max_wait)
+                max_hold = max(max_hold, stats.max_hold)
+            wall = sum(walls) / len(walls)
+            print(f"{name:>10}{voters / wall:>10.1f}{wall * 1000:>10.1f}{max_wait * 1000:>13.2f}{max_hold * 1000:>13.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vote throughput and game lock contention")
+    parser.add_argument("--voters", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Discord response latency (seconds)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    asyncio.run(benchmark(args.voters, args.latency, args.rounds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from ai_manager import AIManager
+from ollama_stub import FaultConfig, OllamaStub
+
+# 吞吐量成長低於此比例即視為飽和
+SATURATION_GAIN = 0.1
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q / 100 * len(ordered)), len(ordered) - 1)]
+
+async def drive(ai: AIManager, concurrency: int, requests: int):
+    """以固定併發數透過真正的 generate_response / aiohttp 路徑送出 requests 個請求"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            result = await ai.generate_response(f"benchmark prompt {i}")
+            latencies.append(time.perf_counter() - start)
+            if not result:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, latencies, failures
+
+async def benchmark(levels, requests, config: FaultConfig):
+    print(f"--- Benchmark: AIManager -> Ollama stub ({config}) ---")
+    async with OllamaStub(config) as stub:
+        with patch.dict(os.environ, {'AI_PROVIDER': 'ollama', 'OLLAMA_HOST': stub.url, 'OLLAMA_MODEL': 'stub'}):
+            ai = AIManager()
+
+        print(f"{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}")
+        previous = 0.0
+        saturated_at = None
+        for level in levels:
+            throughput, latencies, failures = await drive(ai, level, requests)
+            print(f"{level:>12}{throughput:>10.1f}{percentile(latencies, 50)*1000:>10.1f}"
+                  f"{percentile(latencies, 99)*1000:>10.1f}{failures:>8}")
+            if saturated_at is None and previous and throughput < previous * (1 + SATURATION_GAIN):
+                saturated_at = level
+            previous = max(previous, throughput)
+
+        await ai.close()
+        print(f"Stub stats: {dict(stub.stats)}")
+
+    if saturated_at:
+        print(f"RESULT: throughput saturates around concurrency {saturated_at}")
+    else:
+        print("RESULT: no saturation within tested levels")
+
+def main():
+    parser = argparse.ArgumentParser(description="AIManager throughput against a local Ollama stub")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64", help="concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--max-parallel", type=int, default=8, help="simulated GPU slots on the stub")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    config = FaultConfig(latency=args.latency, max_parallel=args.max_parallel, error_rate=args.error_rate,
+                         rate_limit_rate=args.rate_limit_rate, disconnect_rate=args.disconnect_rate)
+    levels = [int(x) for x in args.levels.split(",")]
+    asyncio.run(benchmark(levels, args.requests, config))
+
+if __name__ == "__main__":
+    main()
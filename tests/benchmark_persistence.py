@@ -1,3 +1,4 @@
+
 import asyncio
 import time
 import os
@@ -5,14 +6,83 @@ import json
 from unittest.mock import AsyncMock
 # We need to import AIManager class, but to simulate restart we just instantiate it again.
 # The module-level 'ai_manager' instance is created on import, but we can ignore it and make our own.
-from ai_manager import AIManager
+from ai_manager import AIManager, CACHE_JOURNAL_SUFFIX
 
 CACHE_FILE = "ai_cache.json"
+JOURNAL_FILE = CACHE_FILE + CACHE_JOURNAL_SUFFIX
+
+def cleanup():
+    for path in (CACHE_FILE, JOURNAL_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
+async def measure_loop_stalls(work, interval: float = 0.001):
+    """
+    Runs `work` while a ticker coroutine measures event loop lag.
+    Returns (work duration, max stall, total stall).
+    """
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = time.perf_counter() - before - interval
+            stalls.append(max(lag, 0.0))
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    duration = time.perf_counter() - start
+    done.set()
+    await ticker_task
+    return duration, max(stalls, default=0.0), sum(stalls)
+
+async def benchmark_write_latency(entries: int = 100):
+    print(f"--- Benchmark: Write Latency & Loop Stalls ({entries} templates) ---")
+    roles = ["狼人", "預言家", "女巫", "獵人", "守衛", "白痴", "平民"] * 3
+
+    # Legacy: full synchronous rewrite on the event loop for every new template
+    cleanup()
+    ai = AIManager()
+    latencies = []
+
+    async def legacy_work():
+        for i in range(entries):
+            ai.role_template_cache[(i, tuple(roles))] = roles
+            start = time.perf_counter()
+            ai._save_cache()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    duration, max_stall, total_stall = await measure_loop_stalls(legacy_work)
+    print(f"Legacy rewrite:   total {duration:.4f}s, avg write {sum(latencies)/entries*1000:.2f}ms, "
+          f"max loop stall {max_stall*1000:.2f}ms, total stall {total_stall*1000:.2f}ms")
+
+    # Journal: append one line off the event loop
+    cleanup()
+    ai = AIManager()
+    latencies = []
+
+    async def journal_work():
+        for i in range(entries):
+            key = (i, tuple(roles))
+            ai.role_template_cache[key] = roles
+            start = time.perf_counter()
+            await ai._persist_template(key, roles)
+            latencies.append(time.perf_counter() - start)
+
+    duration, max_stall, total_stall = await measure_loop_stalls(journal_work)
+    print(f"Append journal:   total {duration:.4f}s, avg write {sum(latencies)/entries*1000:.2f}ms, "
+          f"max loop stall {max_stall*1000:.2f}ms, total stall {total_stall*1000:.2f}ms")
+    await ai.close()
+    cleanup()
 
 async def benchmark():
     # Cleanup previous run
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
+    cleanup()
 
     print("--- Benchmark: Persistent Caching ---")
 
@@ -53,8 +123,9 @@ async def benchmark():
         print("RESULT: SLOW (Persistence NOT Working)")
 
     # Cleanup
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
+    cleanup()
+
+    await benchmark_write_latency()
 
 if __name__ == "__main__":
     asyncio.run(benchmark())
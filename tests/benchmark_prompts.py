@@ -0,0 +1,58 @@
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ai_strategies import ROLE_STRATEGIES
+from prompt_templates import (FIRST_SPEAKER_LOGIC, FIRST_SPEAKER_SCENE, LATER_SPEAKER_LOGIC, LATER_SPEAKER_SCENE,
+                              PHASE_LABELS, SPEECH_SKELETON, phase_for_context, prompt_library)
+
+HISTORY = [f"{i}號: 我覺得 {i + 1} 號昨天的發言有點奇怪，今天先聽聽他怎麼說。" for i in range(1, 10)]
+CONTEXT = "現在是第 3 天白天。存活玩家: 9 人。昨晚死亡名單：Alice。"
+
+def build_speech_per_call(role, game_context, speech_history):
+    """舊做法：每次呼叫都重新讀取策略並組裝整段 f-string"""
+    info = ROLE_STRATEGIES.get(role, {})
+    phase = phase_for_context(game_context)
+    if speech_history:
+        scene = LATER_SPEAKER_SCENE.format(speaker_count=len(speech_history), history_text="\n".join(speech_history))
+        logic = LATER_SPEAKER_LOGIC
+    else:
+        scene, logic = FIRST_SPEAKER_SCENE, FIRST_SPEAKER_LOGIC
+    return SPEECH_SKELETON.format(
+        player_id=3, speech_length="80-120", role=role, game_context=game_context,
+        speech_style=info.get("speech_style", "自然"), objective=info.get("objective", "獲得勝利"),
+        speech_guide=info.get("speech_guide", ""), phase_label=PHASE_LABELS.get(phase, "前期"),
+        current_phase_guide=info.get("phase_guide", {}).get(phase, ""), scene_restriction=scene,
+        reasoning_guide=info.get("reasoning_guide", ""), logic_restriction=logic,
+    )
+
+def build_speech_precompiled(role, game_context, speech_history):
+    template = prompt_library.speech_template(role, phase_for_context(game_context), first_speaker=not speech_history)
+    if speech_history:
+        return template.render(player_id=3, game_context=game_context, speech_length="80-120",
+                               speaker_count=len(speech_history), history_text="\n".join(speech_history))
+    return template.render(player_id=3, game_context=game_context, speech_length="80-120")
+
+def main():
+    number = 20000
+    roles = list(ROLE_STRATEGIES)
+    assert all(build_speech_per_call(r, CONTEXT, HISTORY) == build_speech_precompiled(r, CONTEXT, HISTORY) for r in roles)
+
+    start = time.perf_counter()
+    from prompt_templates import PromptLibrary
+    PromptLibrary(ROLE_STRATEGIES)
+    print(f"Compile all templates: {(time.perf_counter() - start) * 1000:.2f}ms ({len(prompt_library)} templates)")
+
+    for name, fn in (("per-call f-string", build_speech_per_call), ("precompiled", build_speech_precompiled)):
+        elapsed = timeit.timeit(lambda: [fn(r, CONTEXT, HISTORY) for r in roles], number=number // len(roles))
+        print(f"{name:>18}: {elapsed / number * 1e6:.2f}us per speech prompt")
+
+    sizes = sorted((t.static_tokens, key) for key, t in prompt_library.speech.items())
+    print(f"Static speech prompt size: {sizes[0][0]}-{sizes[-1][0]} estimated tokens")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_manager
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_files(tmp_path, monkeypatch):
+    """板子快取與旁白語料庫寫到暫存目錄，測試的假回應不會留在工作目錄 (個別測試仍可再 patch)"""
+    monkeypatch.setattr(ai_manager, "CACHE_FILE", str(tmp_path / "ai_cache.json"))
+    monkeypatch.setattr(ai_manager, "NARRATIVE_CACHE_FILE", str(tmp_path / "narrative_cache.json"))
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ollama 相容的本地假伺服器 (壓測與故障注入用)
+============================================
+實作 `/api/generate` (串流與非串流)，可注入延遲、5xx、429、緩慢逐字輸出與中途斷線，
+讓 AIManager 真正的 `_generate_with_ollama` / aiohttp 路徑在高負載下被測試。
+
+用法: python tests/ollama_stub.py [--port 11434] [--latency 0.2] [--error-rate 0.05]
+      然後設定 AI_PROVIDER=ollama OLLAMA_HOST=http://127.0.0.1:11434 啟動 bot。
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from aiohttp import web
+
+STREAM_CHUNK_SIZE = 4 # 串流時每個 chunk 的字元數
+
+
+@dataclass
+class FaultConfig:
+    """故障注入設定 (機率皆為 0~1)"""
+    latency: float = 0.0          # 每個請求的基本延遲 (秒)
+    jitter: float = 0.0           # 延遲的均勻抖動 (秒)
+    error_rate: float = 0.0       # 回傳 500
+    rate_limit_rate: float = 0.0  # 回傳 429
+    disconnect_rate: float = 0.0  # 回應途中斷線
+    slow_drip: float = 0.0        # 串流時每個 chunk 之間的延遲 (秒)
+    max_parallel: int = 0         # 同時處理的請求上限 (模擬 GPU 槽位，0 = 不限)
+    fail_first: int = 0           # 前 N 個請求固定回傳 500
+    response: str = "1"           # 預設回答
+    load_time: float = 0.0        # 模型未載入時的冷啟動延遲 (秒)
+    keep_alive: float = 300.0     # 請求未指定 keep_alive 時，模型閒置多久後卸載 (秒)
+
+
+def parse_keep_alive(value, default: float) -> float:
+    """解析 Ollama 的 keep_alive ("30m"、"45s"、秒數；負值代表永久)"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    text = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        seconds = float(text[:-1]) * units[text[-1]] if text and text[-1] in units else float(text)
+    except ValueError:
+        return default
+    return float("inf") if seconds < 0 else seconds
+
+
+class OllamaStub:
+    """
+    以 aiohttp.web 實作的假 Ollama 伺服器。
+    responder(payload) 可自訂回答內容；stats 紀錄各種結果的次數。
+    """
+    def __init__(self, config: Optional[FaultConfig] = None, host: str = "127.0.0.1", port: int = 0,
+                 responder: Optional[Callable[[dict], str]] = None, seed: int = 0):
+        self.config = config or FaultConfig()
+        self.host = host
+        self.port = port
+        self.responder = responder
+        self.rng = random.Random(seed)
+        self.stats: Counter = Counter()
+        self._slots = asyncio.Semaphore(self.config.max_parallel) if self.config.max_parallel > 0 else None
+        self._load_lock = asyncio.Lock()
+        self._loaded_until = 0.0 # 模型保持載入到此時間 (monotonic)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/api/generate", self.handle_generate)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 時取得實際綁定的埠號
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def _roll(self, rate: float) -> bool:
+        return rate > 0 and self.rng.random() < rate
+
+    async def handle_generate(self, request: web.Request) -> web.StreamResponse:
+        self.stats["requests"] += 1
+        payload = await request.json()
+
+        if self._slots:
+            async with self._slots:
+                return await self._respond(request, payload)
+        return await self._respond(request, payload)
+
+    async def _ensure_loaded(self, payload: dict):
+        """模擬模型載入：閒置超過 keep_alive 後的第一個請求需要付出 load_time"""
+        async with self._load_lock:
+            if time.monotonic() > self._loaded_until:
+                self.stats["cold_loads"] += 1
+                if self.config.load_time > 0:
+                    await asyncio.sleep(self.config.load_time)
+            self._loaded_until = time.monotonic() + parse_keep_alive(payload.get("keep_alive"), self.config.keep_alive)
+
+    async def _respond(self, request: web.Request, payload: dict) -> web.StreamResponse:
+        config = self.config
+        await self._ensure_loaded(payload)
+        delay = config.latency + (self.rng.uniform(0, config.jitter) if config.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.stats["requests"] <= config.fail_first or self._roll(config.error_rate):
+            self.stats["error"] += 1
+            return web.json_response({"error": "injected server error"}, status=500)
+        if self._roll(config.rate_limit_rate):
+            self.stats["rate_limited"] += 1
+            return web.json_response({"error": "injected rate limit"}, status=429)
+
+        text = self.responder(payload) if self.responder else config.response
+        disconnect = self._roll(config.disconnect_rate)
+        model = payload.get("model", "stub")
+
+        if not payload.get("stream", True):
+            if disconnect:
+                self.stats["disconnected"] += 1
+                request.transport.close()
+                return web.Response()
+            self.stats["ok"] += 1
+            return web.json_response({"model": model, "response": text, "done": True})
+
+        # 串流：NDJSON，每行一個 chunk，最後一行 done=true
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        chunks = [text[i:i + STREAM_CHUNK_SIZE] for i in range(0, len(text), STREAM_CHUNK_SIZE)] or [""]
+        for idx, chunk in enumerate(chunks):
+            if disconnect and idx == len(chunks) // 2:
+                self.stats["disconnected"] += 1
+                request.transport.close()
+                return response
+            line = json.dumps({"model": model, "response": chunk, "done": False}, ensure_ascii=False)
+            await response.write(line.encode() + b"\n")
+            if config.slow_drip > 0:
+                await asyncio.sleep(config.slow_drip)
+        await response.write(json.dumps({"model": model, "response": "", "done": True}).encode() + b"\n")
+        await response.write_eof()
+        self.stats["ok"] += 1
+        return response
+
+
+async def serve(stub: OllamaStub):
+    url = await stub.start()
+    print(f"Ollama stub listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama 相容的本地假伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="基本延遲秒數")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延遲抖動秒數")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 錯誤機率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="429 機率")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="中途斷線機率")
+    parser.add_argument("--slow-drip", type=float, default=0.0, help="串流 chunk 間隔秒數")
+    parser.add_argument("--max-parallel", type=int, default=0, help="同時處理上限 (0 = 不限)")
+    parser.add_argument("--response", default="1", help="固定回答內容")
+    parser.add_argument("--load-time", type=float, default=0.0, help="模型冷啟動秒數")
+    args = parser.parse_args()
+
+    config = FaultConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, disconnect_rate=args.disconnect_rate,
+        slow_drip=args.slow_drip, max_parallel=args.max_parallel, response=args.response, load_time=args.load_time,
+    )
+    try:
+        asyncio.run(serve(OllamaStub(config, host=args.host, port=args.port)))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+離線大量對局模擬 (Offline Mass Simulation)
+==========================================
+以可插拔的假 LLM (可設定延遲分佈與腳本回答) 取代 Ollama / Gemini，
+在 asyncio 中同時執行多場完整對局，並分散到多個行程。
+不需要 GPU，可用於壓測 bot 的併發模型與比較各板子的勝率。
+
+用法: python tests/simulate_games.py [--games N] [--workers N] [--concurrency N]
+                                     [--templates 9,12] [--latency lognormal --latency-mean 0.05]
+                                     [--routing fixed|adaptive|all] [--effort-scale low=0.35,medium=0.6,high=1]
+                                     [--cascade]
+"""
+
+import sys
+import os
+import re
+import time
+import math
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# 確保能 import 專案根目錄與 tests 目錄的模組
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from ai_manager import AIManager
+from ai_policies import POLICY_MODES, PolicyEngine
+from effort_routing import ROUTING_MODES, CascadeStats, EffortRouter
+from game_data import GAME_TEMPLATES
+from test_ai_iq import AIScorer, GameSimulator, score_results
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+PERCENTILES = (50, 90, 99)
+
+# 解析提示詞中的可選目標：「你可以選擇的目標（玩家編號）有：[1, 2, 3]。」
+TARGETS_PATTERN = re.compile(r'可以選擇的目標（玩家編號）有：\[([^\]]*)\]')
+DEFAULT_SPEECH = "我是好人，昨晚沒有資訊，先聽後面的發言再決定投票方向。"
+DEFAULT_LAST_WORDS = "我是好人，請大家相信我的判斷。"
+
+# 腳本回答：回傳字串，或接收 (prompt, rng) 回傳字串的函式
+ScriptAnswer = Union[str, Callable[[str, random.Random], str]]
+
+
+def classify_prompt(prompt: str) -> str:
+    """依提示詞內容判斷呼叫類型 (用於延遲統計)"""
+    if "投票決策" in prompt:
+        return "vote"
+    if "夜晚行動決策" in prompt:
+        return "night_action"
+    if "遺言" in prompt:
+        return "last_words"
+    if "發言" in prompt:
+        return "speech"
+    return "other"
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """最近排名法百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class FakeLLM:
+    """
+    決定性的假 LLM 後端。
+    同一個 seed 與提示詞永遠得到相同回答；延遲依設定的分佈取樣。
+    script: [(正規表示式, 回答)]，第一個符合的規則優先於預設回答。
+    effort_scale: 各 reasoning_effort 的延遲倍率 (模擬思考 token 數的差異)，未列出的為 1.0。
+    """
+    def __init__(self, seed: int = 0, latency: str = "fixed", latency_mean: float = 0.0,
+                 latency_jitter: float = 0.5, abstain_rate: float = 0.1,
+                 script: Optional[List[Tuple[str, ScriptAnswer]]] = None,
+                 effort_scale: Optional[Dict[str, float]] = None):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.seed = seed
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_jitter = latency_jitter
+        self.abstain_rate = abstain_rate
+        self.script = [(re.compile(pattern), answer) for pattern, answer in (script or [])]
+        self.effort_scale = dict(effort_scale or {})
+        self.latency_rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = {}
+
+    def sample_latency(self) -> float:
+        mean = self.latency_mean
+        if mean <= 0 or self.latency == "fixed":
+            return max(mean, 0.0)
+        if self.latency == "uniform":
+            return self.latency_rng.uniform(mean * (1 - self.latency_jitter), mean * (1 + self.latency_jitter))
+        if self.latency == "exponential":
+            return self.latency_rng.expovariate(1 / mean)
+        # lognormal: 以 jitter 為 sigma，平均值維持在 mean
+        sigma = self.latency_jitter
+        return self.latency_rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+    def answer(self, prompt: str) -> str:
+        rng = random.Random(f"{self.seed}:{prompt}")
+        for pattern, answer in self.script:
+            if pattern.search(prompt):
+                return answer(prompt, rng) if callable(answer) else answer
+
+        kind = classify_prompt(prompt)
+        if kind in ("vote", "night_action"):
+            match = TARGETS_PATTERN.search(prompt)
+            targets = [t.strip().strip("'\"") for t in match.group(1).split(",")] if match else []
+            targets = [t for t in targets if t]
+            if not targets or rng.random() < self.abstain_rate:
+                return "no"
+            return rng.choice(targets)
+        if kind == "last_words":
+            return DEFAULT_LAST_WORDS
+        return DEFAULT_SPEECH
+
+    async def __call__(self, prompt: str, reasoning_effort: str = "medium") -> str:
+        kind = classify_prompt(prompt)
+        delay = self.sample_latency() * self.effort_scale.get(reasoning_effort, 1.0)
+        started = time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+        self.calls[kind] += 1
+        self.latencies.setdefault(kind, []).append(time.perf_counter() - started)
+        return self.answer(prompt)
+
+
+class TimedGameSimulator(GameSimulator):
+    """記錄每個階段耗時的模擬器"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.phase_times: Dict[str, List[float]] = {"night": [], "day": [], "vote": []}
+
+    async def _timed(self, phase: str, coro):
+        started = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.phase_times[phase].append(time.perf_counter() - started)
+
+    async def run_night(self):
+        return await self._timed("night", super().run_night())
+
+    async def run_day(self, dead_players):
+        return await self._timed("day", super().run_day(dead_players))
+
+    async def run_vote(self):
+        return await self._timed("vote", super().run_vote())
+
+
+def build_template_list(sizes: Optional[Sequence[int]] = None) -> List[Tuple[str, List[str]]]:
+    """展開 GAME_TEMPLATES 為 (板子名稱, 角色列表)"""
+    templates = []
+    for count, options in sorted(GAME_TEMPLATES.items()):
+        if sizes and count not in sizes:
+            continue
+        for option in options:
+            templates.append((f"{count}人 {option['name']}", list(option["roles"])))
+    return templates
+
+
+async def run_games(jobs: List[Tuple[int, str, List[str]]], concurrency: int, llm_options: dict,
+                    policy: Optional[str] = None, routing: Optional[str] = None, cascade: bool = False) -> dict:
+    """在單一事件迴圈中以 concurrency 為上限同時執行多場對局"""
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    fake = FakeLLM(**llm_options)
+    ai = AIManager()
+    ai.set_backend(fake, name="fake")
+    ai.effort_router = EffortRouter(mode=routing or "fixed", small_model="")
+    # 假 LLM 不區分模型：小模型草稿以 low 思考程度的延遲模擬
+    ai.cascade_model = "draft" if cascade else ""
+    ai.cascade_stats = CascadeStats()
+    engine = PolicyEngine(mode=policy) if policy else None
+
+    outcomes: List[dict] = []
+    results = []
+    phase_times: Dict[str, List[float]] = {}
+
+    async def play(seed: int, template: str, roles: List[str]):
+        async with semaphore:
+            sim = TimedGameSimulator(ai, roles=roles, verbose=False, policy=engine)
+            started = time.perf_counter()
+            result = await sim.run_full_game()
+            results.append(result)
+            outcomes.append({
+                "seed": seed,
+                "template": template,
+                "winner": result.winner,
+                "days": result.day_count,
+                "duration": time.perf_counter() - started,
+                "illegal_actions": sum(1 for a in result.actions if not a.is_legal),
+            })
+            for phase, values in sim.phase_times.items():
+                phase_times.setdefault(phase, []).extend(values)
+
+    await asyncio.gather(*(play(seed, template, roles) for seed, template, roles in jobs))
+    await ai.close()
+    return {"outcomes": outcomes, "phase_times": phase_times, "llm_latencies": fake.latencies,
+            "results": results, "routes": dict(ai.effort_router.counts), "cascade": ai.cascade_stats}
+
+
+def run_shard(jobs: List[Tuple[int, str, List[str]]], concurrency: int, llm_options: dict,
+              policy: Optional[str] = None, seed: int = 0, routing: Optional[str] = None, cascade: bool = False) -> dict:
+    """行程池的工作單元：在獨立的事件迴圈中執行一批對局"""
+    logging.disable(logging.WARNING)
+    random.seed(seed)
+    return asyncio.run(run_games(jobs, concurrency, llm_options, policy, routing, cascade))
+
+
+def merge_shards(shards: List[dict]) -> dict:
+    merged = {"outcomes": [], "phase_times": {}, "llm_latencies": {}, "results": [], "routes": Counter(),
+              "cascade": CascadeStats()}
+    for shard in shards:
+        merged["outcomes"].extend(shard["outcomes"])
+        merged["results"].extend(shard["results"])
+        merged["routes"].update(shard["routes"])
+        merged["cascade"].merge(shard["cascade"])
+        for key in ("phase_times", "llm_latencies"):
+            for name, values in shard[key].items():
+                merged[key].setdefault(name, []).extend(values)
+    return merged
+
+
+def summarize(merged: dict, elapsed: float) -> dict:
+    """彙整吞吐量、各階段延遲百分位數與各板子勝率"""
+    outcomes = merged["outcomes"]
+    games = len(outcomes)
+
+    latency = {}
+    for group, prefix in (("phase_times", "phase"), ("llm_latencies", "llm")):
+        for name, values in merged[group].items():
+            key = f"{prefix}:{name}"
+            latency[key] = {f"p{q}": percentile(values, q) for q in PERCENTILES}
+            latency[key]["count"] = len(values)
+
+    win_rates: Dict[str, Dict[str, float]] = {}
+    by_template: Dict[str, Counter] = {}
+    for outcome in outcomes:
+        by_template.setdefault(outcome["template"], Counter())[outcome["winner"]] += 1
+    for template, counter in sorted(by_template.items()):
+        total = sum(counter.values())
+        win_rates[template] = {winner: count / total for winner, count in counter.items()}
+        win_rates[template]["games"] = total
+
+    scores = score_results(merged["results"]) if merged["results"] else {}
+    efforts: Counter = Counter()
+    for (_, effort, _), count in merged["routes"].items():
+        efforts[effort] += count
+
+    return {
+        "games": games,
+        "elapsed": elapsed,
+        "games_per_min": games / elapsed * 60 if elapsed > 0 else 0.0,
+        "avg_days": sum(o["days"] for o in outcomes) / games if games else 0.0,
+        "illegal_actions": sum(o["illegal_actions"] for o in outcomes),
+        "latency": latency,
+        "win_rates": win_rates,
+        "scores": scores,
+        "iq": AIScorer.calculate_iq(scores) if scores else 0,
+        "efforts": dict(efforts),
+        "cascade": merged["cascade"].summary(),
+    }
+
+
+def simulate(games: int, workers: int = 1, concurrency: int = 8, template_sizes: Optional[Sequence[int]] = None,
+             llm_options: Optional[dict] = None, policy: Optional[str] = None, seed: int = 0,
+             routing: Optional[str] = None, cascade: bool = False) -> dict:
+    """
+    執行 games 場對局 (依序輪流使用各板子)，分成 workers 個行程。
+    workers <= 1 時在目前的行程執行 (方便測試)。
+    """
+    templates = build_template_list(template_sizes)
+    if not templates:
+        raise ValueError(f"No templates for sizes: {template_sizes}")
+    llm_options = dict(llm_options or {})
+    llm_options.setdefault("seed", seed)
+
+    jobs = [(seed + i, *templates[i % len(templates)]) for i in range(games)]
+    shards = [jobs[i::max(workers, 1)] for i in range(max(workers, 1))]
+    shards = [shard for shard in shards if shard]
+
+    started = time.perf_counter()
+    if workers <= 1:
+        results = [run_shard(shards[0], concurrency, llm_options, policy, seed, routing, cascade)] if shards else []
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_shard, shard, concurrency, llm_options, policy, seed + idx, routing, cascade)
+                       for idx, shard in enumerate(shards)]
+            results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - started
+
+    return summarize(merge_shards(results), elapsed)
+
+
+def print_summary(summary: dict):
+    print(f"\n=== 模擬結果：{summary['games']} 場，耗時 {summary['elapsed']:.2f}s ===")
+    print(f"吞吐量: {summary['games_per_min']:.1f} 場/分鐘，平均 {summary['avg_days']:.1f} 天，非法行動 {summary['illegal_actions']} 次")
+
+    print("\n--- 延遲百分位數 (ms) ---")
+    print(f"{'階段':<20}{'次數':>8}" + "".join(f"{'p' + str(q):>10}" for q in PERCENTILES))
+    for name, stats in summary["latency"].items():
+        row = "".join(f"{stats[f'p{q}'] * 1000:>10.1f}" for q in PERCENTILES)
+        print(f"{name:<20}{stats['count']:>8}{row}")
+
+    if summary["efforts"]:
+        print("\n--- reasoning_effort 分佈 ---")
+        total = sum(summary["efforts"].values())
+        print(", ".join(f"{effort} {summary['efforts'].get(effort, 0) / total:.0%}" for effort in ("low", "medium", "high")))
+
+    if summary["cascade"]:
+        print("\n--- 模型串接 (小模型起草，主要模型把關) ---")
+        print(f"{'呼叫類型':<12}{'次數':>8}{'升級率':>10}{'p50':>10}{'p90':>10}")
+        for call_type, stats in summary["cascade"].items():
+            print(f"{call_type:<12}{stats['calls']:>8}{stats['escalation_rate']:>10.0%}"
+                  f"{stats['p50'] * 1000:>8.1f}ms{stats['p90'] * 1000:>8.1f}ms")
+
+    print("\n--- 各板子勝率 ---")
+    for template, rates in summary["win_rates"].items():
+        parts = ", ".join(f"{winner} {rate:.0%}" for winner, rate in rates.items() if winner != "games")
+        print(f"{template} ({rates['games']} 場): {parts}")
+
+
+def print_routing_comparison(summaries: Dict[str, dict]):
+    """比較各路由模式的 LLM 延遲、思考程度分佈與 AIScorer 分數"""
+    print(f"\n=== reasoning_effort 路由比較 ===")
+    print(f"{'模式':<10}{'IQ':>5}{'合法性':>8}{'發言品質':>9}{'投票邏輯':>9}{'LLM p50':>10}{'LLM p90':>10}{'high 比例':>10}")
+    for mode, summary in summaries.items():
+        llm = [v for k, v in summary["latency"].items() if k.startswith("llm:")]
+        weights = sum(s["count"] for s in llm) or 1
+        p50 = sum(s["p50"] * s["count"] for s in llm) / weights
+        p90 = sum(s["p90"] * s["count"] for s in llm) / weights
+        high = summary["efforts"].get("high", 0) / (sum(summary["efforts"].values()) or 1)
+        scores = summary["scores"]
+        print(f"{mode:<10}{summary['iq']:>5}{scores.get('action_legality', 0):>7.1f}%{scores.get('speech_quality', 0):>8.1f}%"
+              f"{scores.get('vote_logic', 0):>8.1f}%{p50 * 1000:>8.1f}ms{p90 * 1000:>8.1f}ms{high:>10.0%}")
+
+
+def parse_effort_scale(text: str) -> Dict[str, float]:
+    scale = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if value:
+            scale[name.strip()] = float(value)
+    return scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線大量對局模擬 (假 LLM 後端)")
+    parser.add_argument("--games", type=int, default=100, help="模擬局數 (預設: 100)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="行程數 (預設: CPU 核心數)")
+    parser.add_argument("--concurrency", type=int, default=16, help="每個行程同時進行的對局數 (預設: 16)")
+    parser.add_argument("--templates", type=str, default="", help="限定板子人數，例如 9,12 (預設: 全部)")
+    parser.add_argument("--latency", choices=LATENCY_DISTRIBUTIONS, default="lognormal", help="假 LLM 延遲分佈")
+    parser.add_argument("--latency-mean", type=float, default=0.02, help="平均延遲秒數 (預設: 0.02)")
+    parser.add_argument("--latency-jitter", type=float, default=0.5, help="延遲離散程度 (uniform 為比例，lognormal 為 sigma)")
+    parser.add_argument("--abstain-rate", type=float, default=0.1, help="行動/投票回傳 'no' 的機率")
+    parser.add_argument("--policy", choices=POLICY_MODES, help="夜晚行動策略層模式 (預設: 不使用)")
+    parser.add_argument("--seed", type=int, default=0, help="隨機種子")
+    parser.add_argument("--routing", choices=list(ROUTING_MODES) + ["all"], default="fixed",
+                        help="reasoning_effort 路由模式 (all: 依序比較所有模式)")
+    parser.add_argument("--effort-scale", type=str, default="low=0.35,medium=0.6,high=1",
+                        help="假 LLM 各思考程度的延遲倍率")
+    parser.add_argument("--cascade", action="store_true", help="模型串接：小模型起草，草稿不合格才升級主要模型")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.templates.split(",") if s.strip()] if args.templates else None
+    llm_options = {
+        "latency": args.latency,
+        "latency_mean": args.latency_mean,
+        "latency_jitter": args.latency_jitter,
+        "abstain_rate": args.abstain_rate,
+        "effort_scale": parse_effort_scale(args.effort_scale),
+    }
+    modes = list(ROUTING_MODES) if args.routing == "all" else [args.routing]
+    summaries = {}
+    for mode in modes:
+        summaries[mode] = simulate(args.games, args.workers, args.concurrency, sizes, llm_options, args.policy, args.seed, mode, args.cascade)
+        print_summary(summaries[mode])
+    if len(summaries) > 1:
+        print_routing_comparison(summaries)
+
+
+if __name__ == "__main__":
+    main()
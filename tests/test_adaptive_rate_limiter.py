@@ -0,0 +1,209 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_manager import AIManager, AdaptiveRateLimiter, parse_retry_after
+
+
+def test_parse_retry_after_sources():
+    assert parse_retry_after({"Retry-After": "12"}) == 12.0
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < parse_retry_after({"Retry-After": later}) <= 30
+    body = '{"error": {"code": 429, "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "17s"}]}}'
+    assert parse_retry_after({}, body) == 17.0
+    assert parse_retry_after(body="Quota exceeded. Please retry in 4.5s.") == 4.5
+    assert parse_retry_after({}, "Resource exhausted") is None
+
+
+@pytest.mark.asyncio
+async def test_aimd_cuts_on_429_and_recovers_on_success():
+    limiter = AdaptiveRateLimiter(rate=1.0, capacity=1.0, increase=0.25)
+    limiter.on_rate_limited()
+    assert limiter.rate == pytest.approx(0.5)
+    limiter.on_rate_limited()
+    assert limiter.rate == pytest.approx(0.25)
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.rate == pytest.approx(1.0) # 不超過設定的上限
+    assert limiter.stats == {"ok": 10, "rate_limited": 2}
+
+    for _ in range(20):
+        limiter.on_rate_limited()
+    assert limiter.rate == pytest.approx(limiter.min_rate)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_acquire():
+    limiter = AdaptiveRateLimiter(rate=100.0, capacity=5.0)
+    limiter.on_rate_limited(retry_after=0.2)
+    start = time.monotonic()
+    await limiter.acquire()
+    assert time.monotonic() - start >= 0.18
+
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute_budget():
+    limiter = AdaptiveRateLimiter(rate=100.0, capacity=5.0, tokens_per_minute=600) # 每秒補 10 token
+    start = time.monotonic()
+    await limiter.acquire(500)
+    assert time.monotonic() - start < 0.05
+    limiter.on_success(97) # 回應補扣，剩 3 個
+    await limiter.acquire(5)
+    assert 0.15 < time.monotonic() - start < 0.4
+
+
+def test_quota_headers_lower_the_ceiling():
+    limiter = AdaptiveRateLimiter(rate=1.0, tokens_per_minute=0)
+    with patch.object(limiter, "_schedule_save"):
+        limiter.update_quota({"x-ratelimit-limit-requests": "30", "x-ratelimit-limit-tokens": "1000"})
+        assert limiter.max_rate == pytest.approx(0.5) and limiter.rate == pytest.approx(0.5)
+        assert limiter.tokens_per_minute == 1000
+
+        limiter.update_quota({"x-ratelimit-limit-requests": "600"}) # 只調低，不調高
+        assert limiter.max_rate == pytest.approx(0.5)
+
+        limiter.update_quota({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m30s"})
+        assert 85 < limiter.blocked_until - time.monotonic() <= 90
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "state.json")
+    first = AdaptiveRateLimiter(rate=2.0, capacity=1.0, state_path=path, key="gemini-api")
+    await first.acquire()
+    first.on_rate_limited(retry_after=60)
+    await first._save_task
+
+    # 模擬崩潰後重啟：桶是空的、速率已減半、仍在 Retry-After 暫停中
+    restarted = AdaptiveRateLimiter(rate=2.0, capacity=1.0, state_path=path, key="gemini-api")
+    assert restarted.rate == pytest.approx(1.0)
+    assert restarted.tokens <= 0.0
+    assert 55 < restarted.blocked_until - time.monotonic() <= 60
+
+    other = AdaptiveRateLimiter(rate=2.0, capacity=1.0, state_path=path, key="ollama")
+    assert other.rate == pytest.approx(2.0) and other.blocked_until == 0.0
+
+
+@pytest.mark.asyncio
+async def test_manager_honors_retry_after_header():
+    with patch.dict(os.environ, {'AI_PROVIDER': 'gemini-api', 'GEMINI_API_KEY': 'fake-key'}):
+        ai = AIManager(gateway_url="")
+    ai.rate_limiter.state_path = ""
+    ai.rate_limiter.acquire = AsyncMock()
+
+    limited = AsyncMock(status=429, headers={"Retry-After": "30"})
+    limited.text.return_value = "Resource exhausted"
+    ok = AsyncMock(status=200, headers={})
+    ok.json.return_value = {"candidates": [{"content": {"parts": [{"text": "好"}]}}]}
+    ctx = MagicMock()
+    ctx.__aenter__ = AsyncMock(side_effect=[limited, ok])
+    ctx.__aexit__ = AsyncMock(return_value=None)
+    session = AsyncMock(closed=False)
+    session.post = MagicMock(return_value=ctx)
+    ai.session = session
+
+    rate = ai.rate_limiter.rate
+    with patch('asyncio.sleep', new_callable=AsyncMock) as sleep:
+        assert await ai.generate_response("prompt") == "好"
+    sleep.assert_called_once_with(30.0) # Retry-After 比 4 秒退避長
+    assert ai.rate_limiter.stats == {"ok": 1, "rate_limited": 1}
+    assert ai.rate_limiter.rate < rate
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_small_table_is_not_starved_by_large_table():
+    limiter = AdaptiveRateLimiter(rate=1000.0, capacity=1.0, quantum=100, max_share=1.0)
+    order = []
+
+    async def call(guild):
+        await limiter.acquire(100, guild=guild)
+        order.append(guild)
+
+    # 大桌的投票回合先排了 15 個請求，小桌的 2 個稍後才到
+    tasks = [asyncio.create_task(call("big")) for _ in range(15)]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call("small")) for _ in range(2)]
+    await asyncio.gather(*tasks)
+
+    assert order.count("small") == 2
+    # 輪流放行：小桌的兩個請求都排在前 5 名內，而不是在大桌 15 個之後
+    assert max(i for i, g in enumerate(order) if g == "small") < 5
+
+
+@pytest.mark.asyncio
+async def test_max_share_and_requests_without_guild():
+    limiter = AdaptiveRateLimiter(rate=1000.0, capacity=1.0, tokens_per_minute=600000, max_share=0.5)
+    await asyncio.wait_for(asyncio.gather(*[limiter.acquire(10, guild=g) for g in ("a", "b") * 6]), 2)
+    await asyncio.wait_for(limiter.acquire(5000), 2) # 沒有 guild (板子生成、旁白預熱) 也會放行
+
+    # a 最近已取得過半的請求，b 排隊時先放行 b
+    for _ in range(6):
+        limiter._record_grant("a")
+    order = []
+
+    async def call(guild):
+        await limiter.acquire(10, guild=guild)
+        order.append(guild)
+
+    await asyncio.gather(call("a"), call("b"))
+    assert order == ["b", "a"]
+
+
+@pytest.mark.asyncio
+async def test_estimate_wait_counts_other_guilds_in_turn():
+    limiter = AdaptiveRateLimiter(rate=1.0, capacity=1.0)
+    await limiter.acquire(guild="big") # 用掉唯一的令牌
+    waiters = [asyncio.create_task(limiter.acquire(guild="big")) for _ in range(6)]
+    waiters.append(asyncio.create_task(limiter.acquire(guild="small")))
+    await asyncio.sleep(0.05)
+
+    # 派發中的請求已預約令牌；小桌的新請求排在自己已排隊的一個與大桌的兩個之後，而不是大桌全部之後
+    position, eta = limiter.estimate_wait("small")
+    big_position, big_eta = limiter.estimate_wait("big")
+    assert position == 4 and 3.5 < eta < 5.5
+    assert big_position > position and big_eta > eta
+    for task in waiters:
+        task.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_manager_reports_queue_eta_to_callback():
+    with patch.dict(os.environ, {'AI_PROVIDER': 'gemini-api'}):
+        ai = AIManager(gateway_url="")
+    ai.set_backend(AsyncMock(return_value="好"), name="gemini-api")
+    ai.rate_limiter.acquire = AsyncMock()
+    ai.rate_limiter.estimate_wait = MagicMock(return_value=(4, 16.0))
+    callback = AsyncMock()
+
+    assert await ai.generate_response("prompt", retry_callback=callback, guild=1) == "好"
+    callback.assert_awaited_once_with(position=4, wait=16.0)
+    ai.rate_limiter.estimate_wait.assert_called_once_with(1)
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_retry_callback_messages():
+    import bot
+    channel = MagicMock(id=42)
+    channel.send = AsyncMock()
+    bot.queue_notice_times.clear()
+    callback = bot.create_retry_callback(channel)
+
+    await callback(position=3, wait=12.2)
+    await callback(position=4, wait=20) # 同一頻道的排隊通知有間隔限制
+    await callback(wait=8.0)
+    await callback()
+    sent = [c.args[0] for c in channel.send.await_args_list]
+    assert len(sent) == 3
+    assert "第 3 位" in sent[0] and "13 秒" in sent[0]
+    assert "約 8 秒後" in sent[1]
+    assert sent[2] == "⚠️ AI 正在思考中 (連線重試)... 請稍候。"
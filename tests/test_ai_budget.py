@@ -0,0 +1,129 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from ai_budget import AIBudget
+from ai_manager import AIManager
+from ai_policies import PolicyContext, heuristic_vote
+
+CONTEXT = "現在是第 1 天白天。存活玩家: 9 人。"
+
+
+def test_pressure_is_the_tightest_limit():
+    budget = AIBudget(calls=10, tokens=0, seconds=100)
+    assert budget.pressure == 0.0
+    for _ in range(6):
+        budget.record("prompt", "response", 1.0)
+    assert budget.pressure == pytest.approx(0.6) # 6/10 呼叫比 6/100 秒更緊
+    assert budget.tokens > 0
+
+    assert not budget.allow("narrative")
+    assert budget.allow("full_speech") and budget.allow("vote") and budget.allow("action")
+    assert budget.degraded == {"narrative": 1}
+
+    unlimited = AIBudget(calls=0, tokens=0, seconds=0)
+    unlimited.record("prompt", "response", 999)
+    assert unlimited.pressure == 0.0 and unlimited.allow("action")
+
+
+def test_time_budget_counts_concurrent_calls_once():
+    budget = AIBudget(calls=0, tokens=0, seconds=100)
+    # 12 位 AI 同時投票：每個呼叫 (含排隊) 都花了 40 秒，但實際只等了 40 秒
+    for i in range(12):
+        budget.record("prompt", "1", 40.0, ended=1000.0 + i * 0.5)
+    assert budget.llm_seconds == pytest.approx(480.0)
+    assert budget.wait_seconds == pytest.approx(45.5)
+    assert budget.pressure == pytest.approx(0.455)
+
+    budget.record("prompt", "1", 5.0, ended=1100.0)   # 不重疊的呼叫另外累加
+    assert budget.wait_seconds == pytest.approx(50.5)
+    budget.record("prompt", "1", 150.0, ended=1101.0) # 涵蓋前面所有期間
+    assert budget.wait_seconds == pytest.approx(150.0)
+
+
+def test_summary_reports_usage_and_degradation():
+    budget = AIBudget(calls=4, tokens=1000, seconds=0)
+    for _ in range(4):
+        budget.record("prompt", "", 0.5)
+    for feature in ("narrative", "vote", "vote", "speech"):
+        budget.allow(feature)
+    summary = budget.summary()
+    assert "LLM 呼叫 4/4 次" in summary
+    assert "旁白改用快取 x1" in summary and "規則投票 x2" in summary and "固定台詞 x1" in summary
+
+
+@pytest.mark.asyncio
+async def test_generate_response_records_every_call():
+    ai = AIManager(gateway_url="")
+    budget = AIBudget(calls=10)
+    with patch.object(ai, '_generate_with_retries', new_callable=AsyncMock, side_effect=["好", RuntimeError("down")]):
+        await ai.generate_response("第一個", budget=budget)
+        with pytest.raises(RuntimeError):
+            await ai.generate_response("第二個", budget=budget)
+    assert budget.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_only_narrative_never_calls_the_llm():
+    ai = AIManager(gateway_url="")
+    ai.narrative_cache.clear()
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="月光灑落。") as mock_gen, \
+         patch.object(ai, '_persist_narratives', new_callable=AsyncMock):
+        assert await ai.generate_narrative("天亮", "平安夜", cached_only=True) == ""
+        assert mock_gen.await_count == 0
+        await ai.generate_narrative("天亮", "平安夜")
+        assert await ai.generate_narrative("天亮", "平安夜", cached_only=True) == "月光灑落。"
+    assert mock_gen.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_brief_speech_asks_for_fewer_characters():
+    ai = AIManager(gateway_url="")
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="我是好人。") as mock_gen:
+        await ai.get_ai_speech(1, "平民", CONTEXT)
+        assert "80-120字" in mock_gen.call_args.args[0]
+        await ai.get_ai_speech(1, "平民", CONTEXT, brief=True)
+        assert "30-50字" in mock_gen.call_args.args[0]
+
+
+def test_heuristic_vote():
+    villager = PolicyContext(role="平民", action="vote", valid_targets=[1, 2, 3, 4], actor_id=1, wolf_probs={2: 0.2, 3: 0.7, 4: 0.3})
+    assert heuristic_vote(villager).target == "3"
+    assert heuristic_vote(PolicyContext(role="平民", action="vote", valid_targets=[1, 2], actor_id=1)).target == "no"
+    seer = PolicyContext(role="預言家", action="vote", valid_targets=[1, 2, 3], actor_id=1, claims={2: "預言家"})
+    assert heuristic_vote(seer).target == "2"
+    wolf = PolicyContext(role="狼人", action="vote", valid_targets=[1, 2, 3, 4], actor_id=1, teammates={1, 2}, claims={2: "女巫", 4: "女巫"})
+    assert heuristic_vote(wolf).target == "4"
+
+
+@pytest.mark.asyncio
+async def test_exhausted_budget_skips_narrative_and_last_words():
+    bot.games = {}
+    game = bot.get_game(4242)
+    game.game_active = True
+    game.ai_budget = AIBudget(calls=1)
+    game.ai_budget.record("prompt", "response", 0.1)
+
+    channel = MagicMock()
+    channel.send = AsyncMock()
+    channel.guild.id = 4242
+    ai_player = MagicMock(bot=True, mention="<@7>")
+    ai_player.name = "AI_7"
+    game.roles = {ai_player: "平民"}
+
+    with patch.object(bot.ai_manager, 'narrative_variant', new_callable=AsyncMock, return_value="") as mock_narrative, \
+         patch.object(bot.ai_manager, 'get_ai_last_words', new_callable=AsyncMock) as mock_last_words, \
+         patch('asyncio.sleep', new_callable=AsyncMock):
+        await bot.announce_event(channel, game, "天亮", "昨晚是平安夜。")
+        await bot.request_last_words(channel, game, ai_player)
+
+    assert mock_narrative.call_args.kwargs["cached_only"] is True
+    assert mock_last_words.await_count == 0
+    sent = [c.args[0] for c in channel.send.call_args_list]
+    assert "📢 昨晚是平安夜。" in sent
+    assert any("沒有留下遺言" in m for m in sent)
+    assert game.ai_budget.degraded == {"narrative": 1, "last_words": 1}
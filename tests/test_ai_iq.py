@@ -45,6 +45,8 @@ from typing import Optional
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from ai_manager import AIManager
+from ai_policies import POLICY_MODES, PolicyContext, PolicyEngine, draft_disagreement, parse_speech_history
+from effort_routing import ROUTING_MODES, EffortRouter
 
 # ═══════════════════════════════════════════════════════════════
 # 常數 & 配置
@@ -113,6 +115,8 @@ class ActionRecord:
     is_legal: bool = True          # 目標在 valid_targets 中
     is_role_aware: bool = True     # 沒有明顯角色錯誤
     violation_note: str = ""
+    source: str = "llm"            # 決策來源: heuristic / llm
+    latency: float = 0.0           # 決策耗時 (秒)
 
 
 @dataclass
@@ -155,8 +159,10 @@ class GameResult:
 class GameSimulator:
     """完整模擬一場狼人殺"""
 
-    def __init__(self, ai: AIManager, roles: list = None, verbose: bool = True):
+    def __init__(self, ai: AIManager, roles: list = None, verbose: bool = True, policy: Optional[PolicyEngine] = None):
         self.ai = ai
+        self.policy = policy
+        self.policy_budget = policy.new_budget() if policy else None
         self.roles_template = roles or DEFAULT_ROLES
         self.verbose = verbose
         self.players: list[SimulatedPlayer] = []
@@ -221,13 +227,39 @@ class GameSimulator:
             return "狼人陣營"
         return None
 
+    def _policy_context(self, player: SimulatedPlayer, action_type: str, valid_targets: list[int]) -> PolicyContext:
+        """規則策略與模型串接草稿檢查所需的局勢資訊"""
+        name_to_id = {p.name: p.id for p in self.players}
+        claims, speech_counts = parse_speech_history(self.speech_history, name_to_id)
+        teammates = {p.id for p in self.players if not p.is_good} if not player.is_good else set()
+        return PolicyContext(
+            role=player.role, action=action_type, valid_targets=valid_targets,
+            actor_id=player.id, teammates=teammates, claims=claims,
+            speech_counts=speech_counts,
+            last_target=self.last_guard_target if action_type == "guard" else None,
+        )
+
     async def _ai_action(self, player: SimulatedPlayer, context: str,
                          valid_targets: list[int], action_type: str) -> Optional[int]:
-        """呼叫 AI 取得行動"""
-        resp = await self.ai.get_ai_action(
-            player.role, context, valid_targets,
-            speech_history=self.speech_history
-        )
+        """呼叫 AI 取得行動 (有策略層時先走規則，必要時升級 LLM)"""
+        started = time.perf_counter()
+        source = "llm"
+        ctx = self._policy_context(player, action_type, valid_targets)
+        if self.policy:
+            async def llm_call():
+                return await self.ai.get_ai_action(player.role, context, valid_targets, speech_history=self.speech_history,
+                                                   verify=lambda draft: draft_disagreement(ctx, draft))
+
+            decision = await self.policy.decide(ctx, llm_call, self.policy_budget)
+            resp = decision.target
+            source = decision.source
+        else:
+            resp = await self.ai.get_ai_action(
+                player.role, context, valid_targets,
+                speech_history=self.speech_history,
+                verify=lambda draft: draft_disagreement(ctx, draft)
+            )
+        latency = time.perf_counter() - started
         raw = resp
 
         # 解析
@@ -264,7 +296,7 @@ class GameSimulator:
             action_type=action_type, target_id=target_id,
             valid_targets=valid_targets, raw_response=str(raw),
             is_legal=is_legal, is_role_aware=is_role_aware,
-            violation_note=violation
+            violation_note=violation, source=source, latency=latency
         )
         self.result.actions.append(record)
 
@@ -467,9 +499,11 @@ class GameSimulator:
             context = f"第 {self.day_count} 天白天投票階段。場上存活 {len(alive)} 人。存活玩家編號: {alive_ids}。"
             targets = [pid for pid in alive_ids if pid != voter.id]
 
+            ctx = self._policy_context(voter, "vote", targets)
             resp = await self.ai.get_ai_action(
                 voter.role, context, targets,
-                speech_history=self.speech_history
+                speech_history=self.speech_history,
+                verify=lambda draft: draft_disagreement(ctx, draft)
             )
 
             target_id = None
@@ -801,6 +835,10 @@ async def main():
     parser.add_argument("--players", type=int, default=9, help="玩家人數 (目前僅支援 9)")
     parser.add_argument("--model", type=str, help="指定 Ollama 模型 (預設: env OLLAMA_MODEL 或 gpt-oss:20b)")
     parser.add_argument("--quiet", action="store_true", help="安靜模式 (只顯示最終報告)")
+    parser.add_argument("--policy", choices=list(POLICY_MODES) + ["none", "all"], default="none",
+                        help="夜晚行動策略層模式 (none: 直接呼叫 LLM, all: 依序比較所有模式)")
+    parser.add_argument("--routing", choices=list(ROUTING_MODES) + ["all"], default=None,
+                        help="reasoning_effort 路由模式 (預設: env EFFORT_ROUTING, all: 依序比較所有模式)")
     args = parser.parse_args()
 
     model_name = args.model or os.getenv('OLLAMA_MODEL', 'gpt-oss:20b')
@@ -821,43 +859,75 @@ async def main():
             print(f"\n{C.RED}測試中止。{C.RESET}")
             return
 
-    results: list[GameResult] = []
-    start_time = time.time()
+    policy_modes = list(POLICY_MODES) if args.policy == "all" else [args.policy]
+    routing_modes = list(ROUTING_MODES) if args.routing == "all" else [args.routing]
+    runs = [(mode, routing) for mode in policy_modes for routing in routing_modes]
+    comparison = []
 
     try:
-        for i in range(args.games):
-            print(f"\n{C.BOLD}{'━'*60}{C.RESET}")
-            print(f"{C.BOLD}  📋 開始第 {i+1}/{args.games} 局模擬{C.RESET}")
-            print(f"{'━'*60}")
+        for mode, routing in runs:
+            policy = PolicyEngine(mode=mode) if mode != "none" else None
+            if routing:
+                ai.effort_router = EffortRouter(mode=routing, small_model=ai.effort_router.small_model)
+            label = f"{mode}/{routing}" if routing else mode
+            results: list[GameResult] = []
+            start_time = time.time()
 
-            sim = GameSimulator(ai, verbose=not args.quiet)
-            result = await sim.run_full_game()
-            results.append(result)
+            try:
+                for i in range(args.games):
+                    print(f"\n{C.BOLD}{'━'*60}{C.RESET}")
+                    print(f"{C.BOLD}  📋 開始第 {i+1}/{args.games} 局模擬 (策略: {label}){C.RESET}")
+                    print(f"{'━'*60}")
 
-    except KeyboardInterrupt:
-        print(f"\n\n{C.YELLOW}⚠ 使用者中斷。將根據已完成的 {len(results)} 局產出報告。{C.RESET}")
+                    sim = GameSimulator(ai, verbose=not args.quiet, policy=policy)
+                    result = await sim.run_full_game()
+                    results.append(result)
+
+            except KeyboardInterrupt:
+                print(f"\n\n{C.YELLOW}⚠ 使用者中斷。將根據已完成的 {len(results)} 局產出報告。{C.RESET}")
+
+            elapsed = time.time() - start_time
+
+            if not results:
+                print(f"{C.RED}沒有完成任何一局遊戲。{C.RESET}")
+                continue
+
+            # 評分
+            scores = score_results(results)
+            iq = AIScorer.calculate_iq(scores)
+
+            # 報告
+            print_report(results, scores, iq, elapsed)
+            comparison.append((label, scores, iq, results))
     finally:
         await ai.close()
 
-    elapsed = time.time() - start_time
+    if len(comparison) > 1:
+        print_policy_comparison(comparison)
 
-    if not results:
-        print(f"{C.RED}沒有完成任何一局遊戲。{C.RESET}")
-        return
 
-    # 評分
+def score_results(results: list[GameResult]) -> dict[str, float]:
     scorer = AIScorer()
-    scores = {
+    return {
         "action_legality": scorer.score_action_legality(results),
         "role_awareness": scorer.score_role_awareness(results),
         "speech_quality": scorer.score_speech_quality(results),
         "anti_hallucination": scorer.score_anti_hallucination(results),
         "vote_logic": scorer.score_vote_logic(results),
     }
-    iq = scorer.calculate_iq(scores)
 
-    # 報告
-    print_report(results, scores, iq, elapsed)
+
+def print_policy_comparison(comparison: list):
+    """比較各策略模式的評分與夜晚行動延遲"""
+    print(f"{C.BOLD}{C.CYAN}  ⚖️ 策略模式比較{C.RESET}")
+    print(f"  {'模式':<16} {'IQ':>4} {'合法性':>7} {'角色意識':>8} {'LLM 呼叫':>8} {'平均延遲':>9}")
+    for mode, scores, iq, results in comparison:
+        actions = [a for r in results for a in r.actions]
+        llm_calls = sum(1 for a in actions if a.source == "llm")
+        avg_latency = sum(a.latency for a in actions) / len(actions) if actions else 0.0
+        print(f"  {mode:<16} {iq:>4} {scores['action_legality']:>6.1f}% {scores['role_awareness']:>7.1f}% "
+              f"{llm_calls:>8} {avg_latency:>8.2f}s")
+    print()
 
 
 if __name__ == "__main__":
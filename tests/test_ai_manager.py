@@ -3,6 +3,8 @@ import os
 import asyncio
 import json
 from unittest.mock import MagicMock, patch, AsyncMock
+import aiohttp
+import ai_manager as ai_module
 from ai_manager import AIManager, ai_manager
 
 @pytest.mark.asyncio
@@ -86,6 +88,7 @@ async def test_generate_with_gemini_subprocess_error():
 @pytest.mark.asyncio
 async def test_generate_narrative_caching():
     test_ai = AIManager()
+    test_ai.narrative_cache.clear()
 
     # Mock generate_response using AsyncMock since it's an async method
     with patch.object(test_ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
@@ -110,6 +113,7 @@ async def test_generate_narrative_caching():
 @pytest.mark.asyncio
 async def test_generate_narrative_cache_eviction_and_hashable():
     test_ai = AIManager()
+    test_ai.narrative_cache.clear()
 
     with patch.object(test_ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
         mock_gen.return_value = "Narrative"
@@ -148,8 +152,9 @@ async def test_generate_narrative_cache_eviction_and_hashable():
 async def test_generate_role_template_caching():
     # Use a separate cache file for testing to avoid interference
     with patch('ai_manager.CACHE_FILE', 'test_ai_cache.json'):
-        if os.path.exists('test_ai_cache.json'):
-            os.remove('test_ai_cache.json')
+        for path in ('test_ai_cache.json', 'test_ai_cache.json.journal'):
+            if os.path.exists(path):
+                os.remove(path)
 
         test_ai = AIManager()
 
@@ -179,5 +184,138 @@ async def test_generate_role_template_caching():
             assert res4 == ["狼人", "平民"]
             assert mock_gen.call_count == 2
 
-        if os.path.exists('test_ai_cache.json'):
-            os.remove('test_ai_cache.json')
+        for path in ('test_ai_cache.json', 'test_ai_cache.json.journal'):
+            if os.path.exists(path):
+                os.remove(path)
+
+@pytest.mark.asyncio
+async def test_role_template_journal_is_crash_safe():
+    with patch('ai_manager.CACHE_FILE', 'test_journal_cache.json'):
+        journal = 'test_journal_cache.json.journal'
+        for path in ('test_journal_cache.json', journal):
+            if os.path.exists(path):
+                os.remove(path)
+
+        test_ai = AIManager()
+        with patch.object(test_ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
+            mock_gen.return_value = '["狼人", "平民"]'
+            await test_ai.generate_role_template(2, ["狼人", "平民"])
+
+        # 新板子只追加到日誌，不重寫快照
+        assert not os.path.exists('test_journal_cache.json')
+        with open(journal, 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == 1
+
+        # 模擬寫到一半時崩潰：最後一行不完整
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write('{"player_count": 3, "existing_ro')
+
+        restarted = AIManager()
+        assert restarted.role_template_cache[(2, ("平民", "狼人"))] == ["狼人", "平民"]
+        assert len(restarted.role_template_cache) == 1
+
+        # 殘缺的行已被截掉，重啟後追加的新板子不會黏在它後面
+        with open(journal, 'r', encoding='utf-8') as f:
+            assert f.read().endswith("\n")
+        await restarted._persist_template((7, ("狼人",)), ["狼人"] * 7)
+        assert AIManager().role_template_cache[(7, ("狼人",))] == ["狼人"] * 7
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write('{"player_count": 4')
+        await restarted._persist_template((8, ("狼人",)), ["狼人"] * 8)
+        assert AIManager().role_template_cache[(8, ("狼人",))] == ["狼人"] * 8
+
+        # 壓縮後日誌清空，快照保留內容
+        await restarted.compact_cache()
+        assert not os.path.exists(journal)
+        reloaded = AIManager()
+        assert reloaded.role_template_cache[(2, ("平民", "狼人"))] == ["狼人", "平民"]
+
+        os.remove('test_journal_cache.json')
+
+@pytest.mark.asyncio
+async def test_narrative_semantic_keying_and_persistence():
+    with patch('ai_manager.NARRATIVE_CACHE_FILE', 'test_narrative_cache.json'):
+        if os.path.exists('test_narrative_cache.json'):
+            os.remove('test_narrative_cache.json')
+
+        test_ai = AIManager()
+        test_ai.narrative_cache.clear()
+
+        with patch.object(test_ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
+            mock_gen.return_value = "{P1} 倒在了血泊之中。"
+
+            res1 = await test_ai.generate_narrative("天亮", "昨晚死亡的是：**Alice**", names=["Alice", "Bob"])
+            assert res1 == "Alice 倒在了血泊之中。"
+            # LLM 只看到佔位符，看不到實際名稱
+            assert "Alice" not in mock_gen.call_args[0][0]
+            assert "{P1}" in mock_gen.call_args[0][0]
+
+            # 不同死者、同樣人數：命中同一個模板
+            res2 = await test_ai.generate_narrative("天亮", "昨晚死亡的是：**Bob**", names=["Alice", "Bob"])
+            assert res2 == "Bob 倒在了血泊之中。"
+            assert mock_gen.call_count == 1
+
+        # 重啟後語料庫仍在
+        restarted = AIManager()
+        assert ("天亮", "昨晚死亡的是：**{P1}**", "zh-TW") in restarted.narrative_cache
+
+        os.remove('test_narrative_cache.json')
+
+@pytest.mark.asyncio
+async def test_narrative_warmup_fills_variants():
+    with patch('ai_manager.NARRATIVE_CACHE_FILE', 'test_narrative_warmup.json'):
+        test_ai = AIManager()
+        test_ai.narrative_cache.clear()
+
+        with patch.object(test_ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
+            mock_gen.side_effect = [f"夜幕降臨 {i}" for i in range(10)]
+            for _ in range(4):
+                assert await test_ai.warm_narrative()
+
+        key = ("天黑", "夜晚行動開始，請留意私訊。", "zh-TW")
+        assert len(test_ai.narrative_cache[key]) == 4
+        # 變體已滿，改為補下一個模板
+        assert test_ai._next_warmup_template() != key
+
+        if os.path.exists('test_narrative_warmup.json'):
+            os.remove('test_narrative_warmup.json')
+
+@pytest.mark.asyncio
+async def test_queued_and_backing_off_requests_block_narrative_warmup():
+    with patch.dict(os.environ, {'AI_PROVIDER': 'gemini-api', 'GEMINI_API_KEY': 'fake-key'}):
+        test_ai = AIManager(gateway_url="")
+    released = asyncio.Event()
+
+    async def blocked(cost=0, guild=None):
+        await released.wait()
+
+    test_ai.rate_limiter._acquire = blocked
+    with patch.object(test_ai, '_generate_with_gemini_api', new_callable=AsyncMock, return_value="好"), \
+         patch.object(test_ai, 'warm_narrative', new_callable=AsyncMock) as mock_warm:
+        # 遊戲的請求還在速率限制佇列裡排隊：預熱不能插隊
+        request = asyncio.create_task(test_ai.generate_response("prompt"))
+        warmup = asyncio.create_task(test_ai.run_narrative_warmup(interval=0))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert not test_ai.is_idle()
+        mock_warm.assert_not_awaited()
+
+        released.set()
+        assert await request == "好"
+        await asyncio.sleep(0.01)
+        assert test_ai.is_idle()
+        mock_warm.assert_awaited()
+        warmup.cancel()
+
+    # 重試退避期間也算忙碌
+    backoff = asyncio.Event()
+    test_ai.set_backend(AsyncMock(side_effect=[aiohttp.ClientError(), "好"]))
+
+    async def waiting_sleep(seconds, name="sleep"):
+        assert not test_ai.is_idle()
+        backoff.set()
+
+    with patch.object(ai_module.tracer, 'sleep', side_effect=waiting_sleep):
+        assert await test_ai.generate_response("prompt") == "好"
+    assert backoff.is_set() and test_ai.is_idle()
+    await test_ai.close()
@@ -0,0 +1,124 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_policies import (
+    RULES,
+    PolicyContext,
+    PolicyEngine,
+    LLMBudget,
+    draft_disagreement,
+    heuristic_decision,
+    parse_speech_history,
+)
+import bot
+from game_objects import AIPlayer
+
+
+def test_rules_derived_from_action_guide():
+    assert RULES["狼人"].priority_roles == ["預言家", "女巫"]
+    assert RULES["守衛"].priority_roles[0] == "預言家"
+    assert RULES["女巫"].hold
+    assert RULES["獵人"].hold
+    assert RULES["預言家"].prefer_quiet
+
+
+def test_parse_speech_history_claims_and_counts():
+    history = [
+        "Alice: 我是預言家，昨晚查驗了 2 號",
+        "Bob (遺言): 我是好人",
+        "AI-3(3號): 我才是 女巫",
+        "Alice: 我再補充一點",
+    ]
+    claims, counts = parse_speech_history(history, {"Alice": 1, "Bob": 2, "AI-3": 3})
+    assert claims == {1: "預言家", 3: "女巫"}
+    assert counts == {1: 2, 2: 1, 3: 1}
+
+
+def test_wolf_kills_claimed_seer_not_teammate():
+    ctx = PolicyContext(role="狼人", action="kill", valid_targets=[1, 2, 3, 4], actor_id=1,
+                        teammates={1, 2}, claims={2: "預言家", 4: "預言家"})
+    decision = heuristic_decision(ctx)
+    assert decision.target == "4"
+    assert decision.confidence >= 0.8
+
+
+def test_witch_holds_poison_unless_counter_claimed():
+    ctx = PolicyContext(role="女巫", action="poison", valid_targets=[1, 2, 3], actor_id=1)
+    assert heuristic_decision(ctx).target == "no"
+
+    ctx.claims = {3: "女巫"}
+    assert heuristic_decision(ctx).target == "3"
+
+
+def test_guard_does_not_repeat_last_nights_target():
+    guard = PolicyContext(role="守衛", action="guard", valid_targets=[1, 2, 3], actor_id=1,
+                          claims={2: "預言家"}, last_target=2)
+    assert heuristic_decision(guard).target != "2"
+    assert draft_disagreement(guard, "2") == "repeat_guard"
+
+    # 只有守衛受限：其他行動的 last_target 不影響候選
+    wolf = PolicyContext(role="狼人", action="kill", valid_targets=[2, 3], actor_id=1,
+                         claims={2: "預言家"}, last_target=2)
+    assert heuristic_decision(wolf).target == "2"
+
+
+def test_policy_context_carries_the_guards_previous_target():
+    game = bot.GameState()
+    guard, seer = AIPlayer("AI-1"), AIPlayer("AI-2")
+    game.players = [guard, seer]
+    game.player_id_map = {guard: 1, seer: 2}
+    game.last_guard_target = 2
+    assert bot.build_policy_context(game, guard, "守衛", "guard", []).last_target == 2
+    assert bot.build_policy_context(game, guard, "守衛", "vote", []).last_target is None
+    game.reset()
+    assert game.last_guard_target is None
+
+
+def test_seer_checks_quietest_player():
+    ctx = PolicyContext(role="預言家", action="check", valid_targets=[1, 2, 3], actor_id=1,
+                        speech_counts={1: 1, 2: 3, 3: 0})
+    decision = heuristic_decision(ctx)
+    assert decision.target == "3"
+    assert decision.confidence > 0.6
+
+
+@pytest.mark.asyncio
+async def test_hybrid_escalates_only_when_unsure_and_budget_allows():
+    engine = PolicyEngine(mode="hybrid", confidence_threshold=0.6)
+    llm_call = AsyncMock(return_value="2")
+    budget = LLMBudget(1)
+
+    # 有把握：不呼叫 LLM
+    sure = PolicyContext(role="狼人", action="kill", valid_targets=[2, 3], actor_id=1, claims={3: "預言家"})
+    decision = await engine.decide(sure, llm_call, budget)
+    assert decision.source == "heuristic"
+    llm_call.assert_not_called()
+
+    # 沒把握：升級一次
+    unsure = PolicyContext(role="狼人", action="kill", valid_targets=[2, 3], actor_id=1)
+    decision = await engine.decide(unsure, llm_call, budget)
+    assert decision.source == "llm"
+    assert decision.target == "2"
+
+    # 預算用完：退回規則
+    decision = await engine.decide(unsure, llm_call, budget)
+    assert decision.source == "heuristic"
+    assert llm_call.call_count == 1
+    assert engine.summary()["llm_calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_llm_and_heuristic_modes():
+    llm_call = AsyncMock(return_value="3")
+    ctx = PolicyContext(role="守衛", action="guard", valid_targets=[1, 2, 3], actor_id=1)
+
+    decision = await PolicyEngine(mode="llm").decide(ctx, llm_call)
+    assert decision.target == "3"
+
+    decision = await PolicyEngine(mode="heuristic").decide(ctx, llm_call)
+    assert decision.source == "heuristic"
+    assert llm_call.call_count == 1
@@ -0,0 +1,94 @@
+import sys
+import os
+import unittest
+from unittest.mock import MagicMock, AsyncMock, patch
+
+import discord
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_permissions import ChannelPermissionCache
+
+
+def make_channel(send_messages=True):
+    channel = MagicMock()
+    channel.id = 42
+    channel.set_permissions = AsyncMock()
+    channel.permissions_for = MagicMock(return_value=MagicMock(send_messages=send_messages))
+    return channel
+
+
+def make_http_error(status):
+    response = MagicMock()
+    response.status = status
+    response.reason = "error"
+    return discord.HTTPException(response, "error")
+
+
+class TestChannelPermissionCache(unittest.IsolatedAsyncioTestCase):
+    async def test_skips_redundant_calls(self):
+        cache = ChannelPermissionCache()
+        channel = make_channel(send_messages=True)
+
+        # 已經可以發言，不需要呼叫 API
+        made = await cache.set_send_messages(channel, True)
+        self.assertFalse(made)
+        channel.set_permissions.assert_not_called()
+
+        # 天黑：狀態改變，需要呼叫
+        made = await cache.set_send_messages(channel, False)
+        self.assertTrue(made)
+        channel.set_permissions.assert_called_once_with(channel.guild.default_role, send_messages=False)
+
+        # 再次天黑：命中快取
+        made = await cache.set_send_messages(channel, False)
+        self.assertFalse(made)
+        self.assertEqual(channel.set_permissions.call_count, 1)
+        self.assertEqual(cache.calls_saved, 2)
+        self.assertEqual(cache.calls_made, 1)
+
+    async def test_unknown_state_always_calls(self):
+        cache = ChannelPermissionCache()
+        channel = make_channel(send_messages=None)
+
+        self.assertTrue(await cache.set_send_messages(channel, True))
+        channel.set_permissions.assert_called_once()
+
+    async def test_channel_update_refreshes_cache(self):
+        cache = ChannelPermissionCache()
+        channel = make_channel(send_messages=True)
+        await cache.set_send_messages(channel, False)
+
+        # 管理員手動把權限改回可發言
+        channel.permissions_for.return_value = MagicMock(send_messages=True)
+        cache.update_from_channel(channel)
+
+        self.assertTrue(await cache.set_send_messages(channel, False))
+        self.assertEqual(channel.set_permissions.call_count, 2)
+
+    @patch('channel_permissions.asyncio.sleep', new_callable=AsyncMock)
+    async def test_retries_transient_errors(self, mock_sleep):
+        cache = ChannelPermissionCache()
+        channel = make_channel(send_messages=True)
+        channel.set_permissions.side_effect = [make_http_error(503), None]
+
+        self.assertTrue(await cache.set_send_messages(channel, False))
+        self.assertEqual(channel.set_permissions.call_count, 2)
+        mock_sleep.assert_called_once_with(1.0)
+
+    async def test_forbidden_is_not_retried(self):
+        cache = ChannelPermissionCache()
+        channel = make_channel(send_messages=True)
+        response = MagicMock(status=403, reason="Forbidden")
+        channel.set_permissions.side_effect = discord.Forbidden(response, "no")
+
+        with self.assertRaises(discord.Forbidden):
+            await cache.set_send_messages(channel, False)
+        self.assertEqual(channel.set_permissions.call_count, 1)
+
+        # 失敗後快取失效，下一次會重新讀取頻道狀態
+        channel.set_permissions.side_effect = None
+        self.assertTrue(await cache.set_send_messages(channel, False))
+
+if __name__ == "__main__":
+    unittest.main()
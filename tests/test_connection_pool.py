@@ -0,0 +1,55 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import ai_manager as ai_module
+from ai_manager import AIManager
+from ollama_stub import FaultConfig, OllamaStub
+
+
+def make_manager(stub):
+    with patch.dict(os.environ, {'AI_PROVIDER': 'ollama', 'OLLAMA_HOST': stub.url, 'OLLAMA_MODEL': 'stub'}):
+        return AIManager(gateway_url="")
+
+
+@pytest.mark.asyncio
+async def test_keepalive_reuses_connections():
+    async with OllamaStub(FaultConfig(response="2")) as stub:
+        ai = make_manager(stub)
+        for _ in range(5):
+            assert await ai._generate_with_ollama("prompt") == "2"
+        await ai.close()
+
+    assert ai.connection_stats["created"] == 1
+    assert ai.connection_stats["reused"] == 4
+
+
+@pytest.mark.asyncio
+async def test_per_host_limit_caps_parallel_connections():
+    async with OllamaStub(FaultConfig(latency=0.05)) as stub:
+        with patch.object(ai_module, 'HTTP_POOL_LIMIT_PER_HOST', 2):
+            ai = make_manager(stub)
+            await asyncio.gather(*(ai._generate_with_ollama(f"p{i}") for i in range(6)))
+        await ai.close()
+
+    assert ai.connection_stats["created"] == 2
+    assert ai.connection_stats["reused"] == 4
+
+
+@pytest.mark.asyncio
+async def test_call_type_timeouts():
+    async with OllamaStub(FaultConfig(latency=1.0)) as stub:
+        ai = make_manager(stub)
+        with patch.dict(ai_module.CALL_TIMEOUTS, {"action": 0.2}):
+            start = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await ai._generate_with_ollama("vote", call_type="action")
+            assert time.monotonic() - start < 0.6
+            assert await ai._generate_with_ollama("speech", call_type="speech") == "1"
+        await ai.close()
@@ -0,0 +1,69 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_manager import AIManager
+from effort_routing import EffortRouter, Route, alive_from_context
+
+EARLY_VOTE = "第 1 天白天投票階段。場上存活 9 人。"
+MID_VOTE = "第 3 天白天投票階段。場上存活 7 人。"
+ENDGAME_VOTE = "第 2 天白天投票階段。場上存活 4 人。"
+EARLY_SPEECH = "現在是第 1 天白天。存活玩家: 9 人。昨晚死亡名單：無。"
+LATE_SPEECH = "現在是第 5 天白天。存活玩家: 6 人。昨晚死亡名單：無。"
+NIGHT = "夜晚行動。場上存活 9 人。"
+
+
+def test_fixed_mode_keeps_high_effort_everywhere():
+    router = EffortRouter(mode="fixed", small_model="llama3.2:3b")
+    for call_type in ("action", "vote", "speech", "last_words"):
+        assert router.route(call_type, EARLY_SPEECH, "平民") == Route("high")
+
+
+def test_adaptive_mode_spends_effort_on_high_stakes_calls():
+    router = EffortRouter(mode="adaptive", small_model="")
+    assert router.route("vote", EARLY_VOTE, "平民").effort == "low"
+    assert router.route("vote", MID_VOTE, "平民").effort == "medium"
+    assert router.route("vote", ENDGAME_VOTE, "平民").effort == "high"
+    assert router.route("speech", EARLY_SPEECH, "平民").effort == "low"
+    assert router.route("speech", EARLY_SPEECH, "預言家").effort == "medium"
+    assert router.route("speech", LATE_SPEECH, "平民").effort == "high"
+    assert router.route("action", NIGHT, "狼人").effort == "high"
+    assert router.route("action", NIGHT, "守衛").effort == "medium"
+    assert router.route("last_words", "你被投票處決了。", "預言家").effort == "low"
+
+
+def test_small_model_only_for_low_effort_and_counted():
+    router = EffortRouter(mode="adaptive", small_model="llama3.2:3b")
+    assert router.route("last_words", "", "平民") == Route("low", "llama3.2:3b")
+    assert router.route("action", NIGHT, "狼人") == Route("high", None)
+    assert router.summary() == {"action/high/primary": 1, "last_words/low/llama3.2:3b": 1}
+
+
+def test_alive_count_parsing_and_unknown_mode():
+    assert alive_from_context(NIGHT) == 9
+    assert alive_from_context(EARLY_SPEECH) == 9
+    assert alive_from_context("你已死亡。請選擇射擊目標。場上存活: 5") == 5
+    assert alive_from_context("夜晚行動。") is None
+    assert EffortRouter(mode="bogus").mode == "fixed"
+
+
+@pytest.mark.asyncio
+async def test_manager_passes_route_to_provider():
+    with patch.dict(os.environ, {"EFFORT_ROUTING": "adaptive", "OLLAMA_SMALL_MODEL": "llama3.2:3b", "AI_PROVIDER": "ollama"}):
+        ai = AIManager(gateway_url="")
+    with patch.object(ai, '_generate_with_ollama', new_callable=AsyncMock, return_value="我是好人，大家加油。") as mock_ollama:
+        await ai.get_ai_last_words("AI-1", "平民", "你被投票處決了。")
+        await ai.get_ai_action("狼人", NIGHT, [1, 2, 3])
+
+    last_words, action = mock_ollama.call_args_list
+    assert last_words.kwargs["reasoning_effort"] == "low" and last_words.kwargs["model"] == "llama3.2:3b"
+    assert action.kwargs["reasoning_effort"] == "high" and action.kwargs["model"] is None
+
+
+def test_small_model_is_ignored_for_gemini():
+    with patch.dict(os.environ, {"OLLAMA_SMALL_MODEL": "llama3.2:3b", "AI_PROVIDER": "gemini-api"}):
+        ai = AIManager(gateway_url="")
+    assert ai.effort_router.small_model == ""
@@ -0,0 +1,141 @@
+import sys
+import os
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from game_objects import GameState, InstrumentedLock, lock_hold_seconds
+from tracing import Tracer
+
+
+@pytest.mark.asyncio
+async def test_records_wait_and_hold_by_span():
+    lock = InstrumentedLock()
+    tracer = Tracer()
+
+    async def holder():
+        with tracer.span("holder_site", game="g"):
+            async with lock:
+                await asyncio.sleep(0.05)
+
+    async def waiter():
+        await asyncio.sleep(0.01)
+        async with lock:
+            pass
+
+    before = lock_hold_seconds.count(site="holder_site")
+    await asyncio.gather(holder(), waiter())
+
+    assert lock.stats.acquisitions == 2
+    assert lock.stats.contended == 1
+    assert lock.stats.max_wait >= 0.03
+    assert lock.stats.max_hold >= 0.04
+    assert lock.stats.max_hold_site == "holder_site"
+    assert lock_hold_seconds.count(site="holder_site") == before + 1
+
+
+def test_game_state_uses_instrumented_lock():
+    assert isinstance(GameState().lock, InstrumentedLock)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_votes_do_not_hold_lock_during_discord_io():
+    guild_id = 777001
+    game = bot.get_game(guild_id)
+    game.reset()
+    game.lock = InstrumentedLock()
+
+    async def slow_reply(*args, **kwargs):
+        await asyncio.sleep(0.05)
+
+    interactions = []
+    for i in range(20):
+        it = MagicMock()
+        it.guild_id = guild_id
+        it.user = MagicMock(bot=False)
+        it.response.send_message = AsyncMock(side_effect=slow_reply)
+        interactions.append(it)
+    game.players = [it.user for it in interactions]
+    game.player_ids = {i: p for i, p in enumerate(game.players, 1)}
+    game.player_id_map = {p: i for i, p in game.player_ids.items()}
+    game.game_active = True
+
+    with patch('bot.resolve_votes', new_callable=AsyncMock) as mock_resolve:
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(bot.vote.callback(it, "1") for it in interactions))
+        elapsed = asyncio.get_running_loop().time() - start
+
+    assert game.vote_round.counts == {game.player_ids[1]: 20}
+    mock_resolve.assert_awaited_once()
+    # 回應在 Lock 外並行送出，而非 20 x 50ms 依序排隊
+    assert elapsed < 0.5
+    assert game.lock.stats.max_hold < 0.04
+    game.reset()
+
+
+def make_start_interaction(guild_id: int) -> MagicMock:
+    it = MagicMock()
+    it.guild_id = guild_id
+    it.user = MagicMock(bot=False)
+    it.response.send_message = AsyncMock()
+    it.followup.send = AsyncMock()
+    it.channel.send = AsyncMock()
+    return it
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("interrupt", ["reset", "god"])
+async def test_start_aborts_when_game_changes_during_role_generation(interrupt):
+    guild_id = 777003
+    game = bot.get_game(guild_id)
+    game.reset()
+    players = [MagicMock(bot=False, send=AsyncMock()) for _ in range(11)] # 非標準人數，需要 AI 生成板子
+    game.players = list(players)
+    it = make_start_interaction(guild_id)
+
+    async def interrupted_generation(*args, **kwargs):
+        async with game.lock:
+            if interrupt == "reset":
+                game.reset()
+            else:
+                game.players.remove(players[0])
+                game.gods.append(players[0])
+        return ["狼人"] * 3 + ["預言家", "女巫", "獵人"] + ["平民"] * 5
+
+    with patch.object(bot.ai_manager, 'needs_warmup', return_value=False), \
+         patch.object(bot.ai_manager, 'generate_role_template', side_effect=interrupted_generation), \
+         patch('bot.perform_night', new_callable=AsyncMock) as night:
+        await bot.start.callback(it)
+
+    night.assert_not_awaited()
+    assert not game.roles and not game.player_ids
+    assert not game.game_active # 名單變動時釋放佔位，可以重新 /start
+    assert "已取消開局" in it.channel.send.await_args_list[-1].args[0]
+    game.reset()
+
+
+@pytest.mark.asyncio
+async def test_check_game_over_announces_outside_lock():
+    game = GameState()
+    wolf, villager = MagicMock(name="wolf"), MagicMock(name="villager")
+    game.players = [villager]
+    game.roles = {wolf: "狼人", villager: "平民"}
+    game.game_active = True
+    channel = MagicMock()
+    channel.guild.id = 777002
+
+    held_during_send = []
+
+    async def record(*args, **kwargs):
+        held_during_send.append(game.lock.locked())
+
+    with patch('bot.announce_event', new_callable=AsyncMock, side_effect=record), \
+         patch('bot.send_message', new_callable=AsyncMock, side_effect=record), \
+         patch('bot.set_channel_send_permission', new_callable=AsyncMock):
+        await bot.check_game_over(channel, game)
+
+    assert not game.game_active
+    assert held_during_send and not any(held_during_send)
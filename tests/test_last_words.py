@@ -48,16 +48,17 @@ class TestLastWords(unittest.IsolatedAsyncioTestCase):
     async def test_ai_last_words(self):
         """Test AI generating and sending last words when voted out."""
         # Mock dependencies
-        with patch.object(ai_manager, 'get_ai_last_words', new_callable=AsyncMock) as mock_get_last_words, \
+        async def stream(*args, **kwargs):
+            yield "I am a good wolf..."
+            yield "I am a good wolf... I mean villager!"
+
+        with patch.object(ai_manager, 'stream_ai_last_words', side_effect=stream) as mock_get_last_words, \
              patch('bot.check_game_over', new_callable=AsyncMock) as mock_check_game_over, \
              patch('asyncio.sleep', new_callable=AsyncMock):  # Skip sleep
             
-            # Setup AI response
-            mock_get_last_words.return_value = "I am a good wolf... I mean villager!"
-
             # Setup Vote Result (AI is voted out)
-            self.game.votes = {self.ai_player: 2}
-            self.game.voted_players = {self.ai_player, self.human_player}
+            for voter in (self.ai_player, self.human_player):
+                self.game.open_vote_round().cast(voter, self.ai_player)
 
             # Run resolve_votes
             await bot.resolve_votes(self.channel, self.game)
@@ -87,8 +88,8 @@ class TestLastWords(unittest.IsolatedAsyncioTestCase):
             mock_wait_for.return_value = mock_msg
 
             # Setup Vote Result (Human is voted out)
-            self.game.votes = {self.human_player: 2}
-            self.game.voted_players = {self.ai_player, self.human_player}
+            for voter in (self.ai_player, self.human_player):
+                self.game.open_vote_round().cast(voter, self.human_player)
 
             # Run resolve_votes
             await bot.resolve_votes(self.channel, self.game)
@@ -112,7 +113,8 @@ class TestLastWords(unittest.IsolatedAsyncioTestCase):
             mock_check_game_over.side_effect = side_effect_game_over
 
             # Setup Vote Result
-            self.game.votes = {self.ai_player: 2}
+            for voter in (self.ai_player, self.human_player):
+                self.game.open_vote_round().cast(voter, self.ai_player)
             
             # Run resolve_votes
             await bot.resolve_votes(self.channel, self.game)
@@ -0,0 +1,96 @@
+import sys
+import os
+import asyncio
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_manager import AIManager
+from llm_gateway import LLMGateway
+
+
+class CountingBackend:
+    def __init__(self, response="3", delay=0.05):
+        self.response = response
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, prompt, reasoning_effort="medium"):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.response
+
+
+async def start_gateway(backend, url="http://127.0.0.1:0"):
+    manager = AIManager(gateway_url="")
+    manager.set_backend(backend, name="fake")
+    manager.narrative_cache.clear()
+    manager.role_template_cache.clear()
+    manager._persist_template = lambda *a: asyncio.sleep(0)
+    manager._persist_narratives = lambda: asyncio.sleep(0)
+    gateway = LLMGateway(manager)
+    await gateway.start(url)
+    return gateway
+
+
+@pytest.mark.asyncio
+async def test_client_mode_generates_through_gateway():
+    backend = CountingBackend("5")
+    gateway = await start_gateway(backend)
+    client = AIManager(gateway_url=gateway.url)
+    try:
+        assert client.provider == "gateway"
+        assert await client.generate_response("prompt") == "5"
+        assert backend.calls == 1
+    finally:
+        await client.close()
+        await gateway.stop()
+
+
+@pytest.mark.asyncio
+async def test_identical_inflight_requests_are_coalesced():
+    backend = CountingBackend("7", delay=0.2)
+    gateway = await start_gateway(backend)
+    clients = [AIManager(gateway_url=gateway.url) for _ in range(2)]
+    try:
+        results = await asyncio.gather(*(c.generate_response("same prompt") for c in clients for _ in range(3)))
+        assert results == ["7"] * 6
+        assert backend.calls == 1
+        assert gateway.coalescer.coalesced == 5
+    finally:
+        for c in clients:
+            await c.close()
+        await gateway.stop()
+
+
+@pytest.mark.asyncio
+async def test_gateway_owns_role_template_and_narrative_caches():
+    backend = CountingBackend('["狼人", "預言家", "平民"]')
+    gateway = await start_gateway(backend)
+    client = AIManager(gateway_url=gateway.url)
+    try:
+        roles = ["狼人", "預言家", "平民"]
+        assert await client.generate_role_template(3, roles) == roles
+        assert await client.generate_role_template(3, roles) == roles
+        assert backend.calls == 1
+        assert (3, tuple(sorted(roles))) in gateway.manager.role_template_cache
+
+        backend.response = "{P1} 倒在血泊中。"
+        text = await client.generate_narrative("天亮", "昨晚死亡的是：**Alice**", names=["Alice"])
+        assert text == "Alice 倒在血泊中。"
+        assert gateway.manager.narrative_cache
+    finally:
+        await client.close()
+        await gateway.stop()
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_transport(tmp_path):
+    backend = CountingBackend("1")
+    gateway = await start_gateway(backend, url=f"unix://{tmp_path / 'llm.sock'}")
+    client = AIManager(gateway_url=gateway.url)
+    try:
+        assert await client.generate_response("prompt") == "1"
+    finally:
+        await client.close()
+        await gateway.stop()
@@ -0,0 +1,48 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from loop_monitor import LoopMonitor
+from tracing import tracer
+
+
+def blocking_json_dump():
+    time.sleep(0.3) # 模擬在協程中同步執行的重工作
+
+
+@pytest.mark.asyncio
+async def test_stall_is_detected_with_stack_and_phase():
+    monitor = LoopMonitor(interval=0.05, threshold=0.1)
+    monitor.start()
+    try:
+        await asyncio.sleep(0.1)
+        with tracer.span("resolve_votes", game="loop-monitor-test"):
+            blocking_json_dump()
+        await asyncio.sleep(0.15)
+    finally:
+        await monitor.stop()
+        tracer.clear("loop-monitor-test")
+
+    assert monitor.stalls, "stall should be recorded"
+    stall = max(monitor.stalls, key=lambda r: r.lag)
+    assert stall.lag >= 0.2
+    assert stall.phases[0] == "resolve_votes"
+    assert "blocking_json_dump" in stall.stack
+    assert monitor.phase_counts["resolve_votes"] >= 1
+    assert "resolve_votes" in monitor.report()
+    assert metrics.event_loop_lag_hist.count() > 0
+
+
+@pytest.mark.asyncio
+async def test_idle_loop_records_no_stalls():
+    monitor = LoopMonitor(interval=0.02, threshold=0.2)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    assert not monitor.stalls
+    assert monitor.report() == "No event loop stalls recorded."
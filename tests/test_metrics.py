@@ -0,0 +1,66 @@
+import sys
+import os
+import aiohttp
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from metrics import Registry, MetricsServer
+from ai_manager import AIManager
+
+
+def test_text_exposition_format():
+    registry = Registry()
+    requests = registry.counter("test_requests_total", "Requests", ("provider",))
+    latency = registry.histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+    requests.inc(provider="ollama")
+    requests.inc(2, provider="ollama")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5.0)
+
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{provider="ollama"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_game_gauges_are_computed_at_scrape_time():
+    games = {1: SimpleNamespace(game_active=True, players=[1, 2, 3]), 2: SimpleNamespace(game_active=False, players=[])}
+    metrics.set_game_source(lambda: games)
+    text = metrics.registry.render()
+    assert "werewolf_active_games 1" in text
+    assert 'werewolf_players{game="1"} 3' in text
+
+
+@pytest.mark.asyncio
+async def test_llm_and_cache_metrics_and_endpoint():
+    ai = AIManager()
+    ai.set_backend(AsyncMock(return_value="旁白"), name="fake")
+    ai.narrative_cache.clear()
+    ai._persist_narratives = AsyncMock()
+
+    before_calls = metrics.llm_requests.get(provider="fake", call_type="narrative", outcome="ok")
+    before_hits = metrics.cache_requests.get(cache="narrative", result="hit")
+    await ai.generate_narrative("天黑", "metrics test event")
+    await ai.generate_narrative("天黑", "metrics test event")
+    assert metrics.llm_requests.get(provider="fake", call_type="narrative", outcome="ok") == before_calls + 1
+    assert metrics.cache_requests.get(cache="narrative", result="hit") == before_hits + 1
+
+    server = MetricsServer(port=0)
+    await server.start()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{server.port}/metrics") as resp:
+                assert resp.status == 200
+                body = await resp.text()
+        assert 'werewolf_llm_request_duration_seconds_count{provider="fake",call_type="narrative"}' in body
+    finally:
+        await server.stop()
+        await ai.close()
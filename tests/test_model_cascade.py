@@ -0,0 +1,117 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_manager import AIManager
+from ai_policies import PolicyContext, draft_disagreement
+from effort_routing import CascadeStats, check_draft, check_speech_draft
+
+NIGHT = "夜晚行動。場上存活 9 人。"
+VOTE = "第 2 天白天投票階段。場上存活 8 人。"
+LONG_SPEECH = "我是好人，昨晚平安夜，我覺得 3 號的發言比較可疑，今天先聽後面的人怎麼說。"
+
+
+def cascade_manager() -> AIManager:
+    ai = AIManager(gateway_url="")
+    ai.cascade_model = "llama3.2:3b"
+    return ai
+
+
+def test_draft_disagreement_checks_role_awareness_and_signals():
+    wolf = PolicyContext(role="狼人", action="kill", valid_targets=[1, 2, 3, 4], actor_id=1, teammates={2})
+    assert draft_disagreement(wolf, "2") == "teammate"
+    assert draft_disagreement(wolf, "3") is None
+
+    seer = PolicyContext(role="預言家", action="check", valid_targets=[1, 2, 3, 4], actor_id=1, claims={3: "預言家"})
+    assert draft_disagreement(seer, "1") == "self"
+    assert draft_disagreement(seer, "4") == "heuristic" # 規則很有把握要查對跳的 3 號
+    assert draft_disagreement(seer, "3") is None
+
+    guard = PolicyContext(role="守衛", action="guard", valid_targets=[1, 2, 3], actor_id=1, last_target=2)
+    assert draft_disagreement(guard, "2") == "repeat_guard"
+    assert draft_disagreement(guard, "1") is None
+
+
+def test_vote_drafts_follow_beliefs():
+    ctx = PolicyContext(role="平民", action="vote", valid_targets=[1, 2, 3, 4], actor_id=1,
+                        wolf_probs={2: 0.1, 3: 0.8, 4: 0.3})
+    assert draft_disagreement(ctx, "2") == "belief"
+    assert draft_disagreement(ctx, "3") is None
+    assert draft_disagreement(ctx, "no") == "abstain"
+    calm = PolicyContext(role="平民", action="vote", valid_targets=[1, 2, 3], actor_id=1, wolf_probs={2: 0.4, 3: 0.4})
+    assert draft_disagreement(calm, "no") is None
+
+
+def test_check_draft_and_speech_draft():
+    assert check_draft("9", [1, 2, 3]) == "illegal"
+    assert check_draft("no", [1, 2, 3]) == "abstain"
+    assert check_draft("2", [1, 2, 3]) is None
+    assert check_draft("2", [1, 2, 3], verify=lambda draft: "belief") == "belief"
+    assert check_speech_draft("好。") == "short"
+    assert check_speech_draft(LONG_SPEECH) is None
+
+
+@pytest.mark.asyncio
+async def test_legal_draft_is_accepted_without_the_primary_model():
+    ai = cascade_manager()
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="2") as mock_gen:
+        assert await ai.get_ai_action("狼人", NIGHT, [1, 2, 3]) == "2"
+    assert mock_gen.await_count == 1
+    assert mock_gen.call_args.kwargs["model"] == "llama3.2:3b"
+    assert ai.cascade_stats.summary()["action"]["escalation_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_rejected_draft_escalates_to_primary_model():
+    ai = cascade_manager()
+    ctx = PolicyContext(role="狼人", action="kill", valid_targets=[1, 2, 3], actor_id=1, teammates={2})
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, side_effect=["2", "3"]) as mock_gen:
+        result = await ai.get_ai_action("狼人", NIGHT, [1, 2, 3], verify=lambda draft: draft_disagreement(ctx, draft))
+    assert result == "3"
+    draft, final = mock_gen.call_args_list
+    assert draft.kwargs["model"] == "llama3.2:3b" and draft.kwargs["reasoning_effort"] == "low"
+    assert "model" not in final.kwargs and final.kwargs["reasoning_effort"] == "high"
+    assert ai.cascade_stats.reasons[("action", "teammate")] == 1
+
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, side_effect=["7", "1"]):
+        assert await ai.get_ai_action("平民", VOTE, [1, 2, 3]) == "1"
+    summary = ai.cascade_stats.summary()
+    assert summary["vote"]["escalation_rate"] == 1.0
+    assert "illegal" in ai.cascade_stats.format_summary()
+
+
+@pytest.mark.asyncio
+async def test_only_early_speeches_are_drafted():
+    ai = cascade_manager()
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, side_effect=["嗯。", LONG_SPEECH]) as mock_gen:
+        assert await ai.get_ai_speech(1, "平民", "現在是第 1 天白天。存活玩家: 9 人。") == LONG_SPEECH
+    assert mock_gen.await_count == 2
+
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value=LONG_SPEECH) as mock_gen:
+        await ai.get_ai_speech(1, "平民", "現在是第 3 天白天。存活玩家: 7 人。")
+    assert mock_gen.await_count == 1
+    assert mock_gen.call_args.kwargs["model"] is None
+    assert ai.cascade_stats.calls["speech"] == 1
+
+
+def test_cascade_requires_a_small_model():
+    with patch("ai_manager.MODEL_CASCADE", True), patch.dict(os.environ, {"AI_PROVIDER": "gemini-api"}):
+        assert AIManager(gateway_url="").cascade_model == ""
+    with patch("ai_manager.MODEL_CASCADE", True), patch.dict(os.environ, {"AI_PROVIDER": "ollama", "OLLAMA_SMALL_MODEL": "llama3.2:3b"}):
+        assert AIManager(gateway_url="").cascade_model == "llama3.2:3b"
+
+
+def test_stats_merge_and_simulator_report():
+    from simulate_games import simulate
+    a, b = CascadeStats(), CascadeStats()
+    a.record("vote", None, 0.1)
+    b.record("vote", "illegal", 0.3)
+    a.merge(b)
+    assert a.summary()["vote"] == {"calls": 2, "escalation_rate": 0.5, "p50": 0.1, "p90": 0.3}
+
+    summary = simulate(games=2, workers=1, concurrency=2, template_sizes=[6], seed=2, cascade=True)
+    assert {"action", "vote", "speech"} <= set(summary["cascade"])
@@ -0,0 +1,91 @@
+import sys
+import os
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import bot
+import ai_manager as ai_module
+from ai_manager import AIManager
+from ollama_stub import FaultConfig, OllamaStub
+
+
+def make_manager(stub):
+    with patch.dict(os.environ, {'AI_PROVIDER': 'ollama', 'OLLAMA_HOST': stub.url, 'OLLAMA_MODEL': 'stub'}):
+        return AIManager(gateway_url="")
+
+
+@pytest.mark.asyncio
+async def test_warm_up_measures_cold_and_warm_latency():
+    async with OllamaStub(FaultConfig(load_time=0.3)) as stub:
+        ai = make_manager(stub)
+        assert ai.needs_warmup()
+        # 同時呼叫只載入一次
+        assert all(await asyncio.gather(ai.warm_up_model(), ai.warm_up_model()))
+        await ai.close()
+
+    assert stub.stats["cold_loads"] == 1
+    assert stub.stats["requests"] == 2
+    assert ai.warmup_latency["cold"] >= 0.3
+    assert ai.warmup_latency["warm"] < 0.1
+    assert ai.model_ready and not ai.needs_warmup()
+
+
+@pytest.mark.asyncio
+async def test_rewarm_after_idle_and_failure_reporting():
+    async with OllamaStub(FaultConfig()) as stub:
+        ai = make_manager(stub)
+        assert await ai.warm_up_model()
+        with patch.object(ai_module, 'MODEL_REWARM_IDLE', 0.0):
+            await asyncio.sleep(0.01)
+            assert ai.needs_warmup()
+        await ai.close()
+
+    async with OllamaStub(FaultConfig(error_rate=1.0)) as stub:
+        ai = make_manager(stub)
+        assert not await ai.warm_up_model()
+        assert ai.needs_warmup()
+        await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_requests_keep_model_loaded():
+    async with OllamaStub(FaultConfig(load_time=0.2, keep_alive=0.0)) as stub:
+        ai = make_manager(stub)
+        await ai._generate_with_ollama("a")
+        await ai._generate_with_ollama("b")
+        await ai.close()
+    # 請求帶有 keep_alive，模型不會在兩次請求之間被卸載
+    assert stub.stats["cold_loads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_start_reports_readiness_before_the_first_night():
+    interaction = MagicMock()
+    interaction.guild_id = 55501
+    interaction.user = MagicMock()
+    interaction.response.send_message = AsyncMock()
+    interaction.followup.send = AsyncMock()
+    interaction.channel.send = AsyncMock()
+    game = bot.get_game(interaction.guild_id)
+    game.reset()
+    for i in range(3):
+        player = MagicMock()
+        player.name = f"P{i}"
+        player.send = AsyncMock()
+        game.players.append(player)
+
+    with patch.object(bot.ai_manager, 'needs_warmup', return_value=True), \
+         patch.object(bot.ai_manager, 'warm_up_model', new_callable=AsyncMock, return_value=True) as mock_warm, \
+         patch.object(bot.ai_manager, 'warmup_latency', {"cold": 12.34, "warm": 0.2}), \
+         patch('bot.announce_event', new_callable=AsyncMock), \
+         patch('bot.perform_night', new_callable=AsyncMock):
+        await bot.start.callback(interaction)
+
+    mock_warm.assert_awaited_once()
+    sent = [call.args[0] for call in interaction.channel.send.call_args_list]
+    assert any("AI 模型已就緒" in m and "12.3" in m for m in sent)
+    game.reset()
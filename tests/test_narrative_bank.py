@@ -0,0 +1,28 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from narrative_bank import normalize_context, render
+
+
+def test_normalize_replaces_names_with_placeholders():
+    template, slots = normalize_context("昨晚死亡的是：**AI-1, AI-10**", ["AI-1", "AI-10", "Bob"])
+    assert template == "昨晚死亡的是：**{P1}, {P2}**"
+    assert slots == ["AI-1", "AI-10"]
+
+
+def test_normalize_reuses_slot_for_same_name():
+    template, slots = normalize_context("<@1> 死亡時扣下了扳機！<@1>", ["<@1>", "Alice"])
+    assert template == "{P1} 死亡時扣下了扳機！{P1}"
+    assert slots == ["<@1>"]
+
+
+def test_normalize_ignores_short_names():
+    template, slots = normalize_context("天亮了", ["天"])
+    assert template == "天亮了"
+    assert slots == []
+
+
+def test_render_substitutes_and_drops_unknown_placeholders():
+    assert render("{P1} 與 {P2} 離開了{P3}。", ["甲", "乙"]) == "甲 與 乙 離開了。"
@@ -0,0 +1,59 @@
+import sys
+import os
+import json
+import aiohttp
+import pytest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ai_manager import AIManager, RateLimitError
+from ollama_stub import FaultConfig, OllamaStub
+
+
+async def make_manager(stub):
+    with patch.dict(os.environ, {'AI_PROVIDER': 'ollama', 'OLLAMA_HOST': stub.url, 'OLLAMA_MODEL': 'stub'}):
+        return AIManager()
+
+
+@pytest.mark.asyncio
+async def test_generate_through_real_http_path():
+    async with OllamaStub(FaultConfig(response="3")) as stub:
+        ai = await make_manager(stub)
+        assert await ai.generate_response("prompt") == "3"
+        await ai.close()
+        assert stub.stats["ok"] == 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_response_is_ndjson():
+    async with OllamaStub(FaultConfig(response="天亮了請睜眼")) as stub:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{stub.url}/api/generate", json={"prompt": "x", "stream": True}) as resp:
+                lines = [json.loads(line) for line in (await resp.text()).splitlines()]
+    assert "".join(line["response"] for line in lines) == "天亮了請睜眼"
+    assert lines[-1]["done"] is True
+
+
+@pytest.mark.asyncio
+async def test_injected_faults_surface_as_retryable_errors():
+    async with OllamaStub(FaultConfig(fail_first=1)) as stub:
+        ai = await make_manager(stub)
+        with pytest.raises(aiohttp.ClientError):
+            await ai._generate_with_ollama("prompt")
+        assert await ai._generate_with_ollama("prompt") == "1"
+        await ai.close()
+
+    async with OllamaStub(FaultConfig(rate_limit_rate=1.0)) as stub:
+        ai = await make_manager(stub)
+        with pytest.raises(RateLimitError):
+            await ai._generate_with_ollama("prompt")
+        await ai.close()
+
+    async with OllamaStub(FaultConfig(disconnect_rate=1.0)) as stub:
+        ai = await make_manager(stub)
+        with pytest.raises(aiohttp.ClientError):
+            await ai._generate_with_ollama("prompt")
+        await ai.close()
+        assert stub.stats["disconnected"] == 1
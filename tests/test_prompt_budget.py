@@ -0,0 +1,93 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_manager as ai_module
+from ai_manager import AIManager
+from prompt_templates import HISTORY_OMITTED, PromptTemplate, assemble, estimate_tokens, prompt_library
+
+HISTORY = [f"{i}號: 我覺得 {i + 1} 號昨天的發言有點奇怪，今天先聽聽他怎麼說，大家注意票型。" for i in range(1, 13)]
+CONTEXT = "現在是第 3 天白天。存活玩家: 9 人。昨晚死亡名單：Alice。"
+
+
+def speech_values(history=HISTORY):
+    return dict(history=history, player_id=4, game_context=CONTEXT, speaker_count=len(history), speech_length="80-120")
+
+
+def test_within_budget_renders_unchanged():
+    template = prompt_library.speech_template("預言家", "mid", first_speaker=False)
+    expected = template.render(player_id=4, game_context=CONTEXT, speaker_count=len(HISTORY), history_text="\n".join(HISTORY), speech_length="80-120")
+    for budget in (0, 100_000):
+        assembled = assemble(template, budget, **speech_values())
+        assert assembled.text == expected
+        assert assembled.dropped == {}
+
+
+def test_low_priority_sections_are_dropped_first():
+    template = prompt_library.speech_template("預言家", "mid", first_speaker=False)
+    full = assemble(template, 0, **speech_values())
+    budget = full.tokens - template.section_tokens["reasoning_guide"] // 2
+
+    assembled = assemble(template, budget, **speech_values())
+    assert list(assembled.dropped) == ["reasoning_guide"]
+    assert template.defaults["reasoning_guide"] not in assembled.text
+    assert template.defaults["speech_guide"] in assembled.text
+    assert "\n".join(HISTORY) in assembled.text
+    assert assembled.tokens <= budget
+
+
+def test_history_is_trimmed_from_the_oldest_line():
+    template = prompt_library.speech_template("預言家", "mid", first_speaker=False)
+    guides = template.section_tokens["reasoning_guide"] + template.section_tokens["speech_guide"]
+    budget = assemble(template, 0, **speech_values()).tokens - guides - 100
+
+    assembled = assemble(template, budget, **speech_values())
+    assert list(assembled.dropped) == ["reasoning_guide", "speech_guide", "history_text"]
+    assert 0 < assembled.history_dropped < len(HISTORY)
+    assert HISTORY_OMITTED.format(count=assembled.history_dropped) in assembled.text
+    assert HISTORY[0] not in assembled.text and HISTORY[-1] in assembled.text
+    assert template.defaults["current_phase_guide"] in assembled.text
+    assert assembled.tokens <= budget
+    # 發言人數仍是原本的人數
+    assert f"已經有 {len(HISTORY)} 位玩家發言" in assembled.text
+
+
+def test_required_sections_are_kept_even_over_budget():
+    template = PromptTemplate("規則：{rule}\n{reasoning_guide}\n局勢：{game_context}",
+                              {"rule": "不可說謊", "reasoning_guide": "先想一想"}, ("game_context",))
+    assembled = assemble(template, 3, game_context=CONTEXT)
+    assert assembled.text == f"規則：不可說謊\n\n局勢：{CONTEXT}"
+    assert assembled.dropped == {"reasoning_guide": estimate_tokens("先想一想")}
+    assert assembled.tokens > 3
+
+
+@pytest.mark.asyncio
+async def test_manager_applies_provider_budget_and_records_stats():
+    ai = AIManager(gateway_url="")
+    ai.provider = "ollama"
+    with patch.dict(ai_module.PROMPT_BUDGETS, {"ollama": 1000}), \
+         patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="我是好人") as mock_gen, \
+         patch.object(ai_module.logger, 'info') as mock_log:
+        await ai.get_ai_speech(4, "預言家", CONTEXT, speech_history=HISTORY)
+
+    prompt = mock_gen.call_args.args[0]
+    assert estimate_tokens(prompt) <= 1000
+    assert HISTORY[-1] in prompt
+    assert "reasoning_guide" in ai.prompt_stats
+    assert any("dropped" in str(call.args[0]) for call in mock_log.call_args_list)
+
+
+@pytest.mark.asyncio
+async def test_action_history_keeps_belief_summary_when_trimmed():
+    ai = AIManager(gateway_url="")
+    ai.provider = "ollama"
+    with patch.dict(ai_module.PROMPT_BUDGETS, {"ollama": 600}), \
+         patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="3") as mock_gen:
+        await ai.get_ai_action("平民", "第 2 天白天投票階段。", [1, 2, 3], speech_history=HISTORY, belief_summary="3號 狼人機率 72%")
+
+    prompt = mock_gen.call_args.args[0]
+    assert "局勢摘要（根據死亡、票型與起跳推算）：3號 狼人機率 72%" in prompt
+    assert "你可以選擇的目標（玩家編號）有：[1, 2, 3]" in prompt
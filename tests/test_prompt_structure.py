@@ -131,6 +131,7 @@ async def test_get_ai_action_voting_phase():
 @pytest.mark.asyncio
 async def test_generate_narrative_anti_hallucination():
     ai = AIManager()
+    ai.narrative_cache.clear()  # Clear cache to ensure generate_response is called
 
     with patch.object(ai, 'generate_response', new_callable=AsyncMock) as mock_gen:
         mock_gen.return_value = "Mock Narrative"
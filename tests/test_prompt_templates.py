@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_manager import AIManager
+from ai_strategies import ROLE_STRATEGIES
+from prompt_templates import PHASES, PromptLibrary, PromptTemplate, estimate_tokens, prompt_library
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "prompts.json")
+
+HISTORY = ["1號: 我是預言家，昨晚查驗 3 號是狼人。", "2號: 我覺得 1 號在悍跳，3 號先別急著出。", "4號: 我跟 1 號。"]
+BELIEF = "3號 狼人機率 72%；1號 跳預言家"
+
+
+def cases():
+    """(名稱, 方法, kwargs)：涵蓋每個角色的行動/投票/發言/遺言提示詞"""
+    for role in list(ROLE_STRATEGIES) + ["未知身分"]:
+        yield f"{role}/action/night", "get_ai_action", dict(role=role, game_context="夜晚行動。場上存活 7 人。", valid_targets=[1, 2, 3, 4, 5, 6, 7])
+        yield f"{role}/action/vote", "get_ai_action", dict(role=role, game_context="第 2 天白天投票階段。場上存活 6 人。", valid_targets=[1, 2, 3], speech_history=HISTORY)
+        yield f"{role}/action/belief", "get_ai_action", dict(role=role, game_context="夜晚行動。場上存活 5 人。", valid_targets=[1, 3], speech_history=HISTORY * 3, belief_summary=BELIEF)
+        yield f"{role}/speech/first", "get_ai_speech", dict(player_id=5, role=role, game_context="現在是第 1 天白天。存活玩家: 8 人。昨晚死亡名單：無。")
+        yield f"{role}/speech/mid", "get_ai_speech", dict(player_id=2, role=role, game_context="現在是第 3 天白天。存活玩家: 6 人。昨晚死亡名單：Alice。", speech_history=HISTORY)
+        yield f"{role}/speech/late_belief", "get_ai_speech", dict(player_id=7, role=role, game_context="現在是第 6 天白天。存活玩家: 3 人。昨晚死亡名單：無。", speech_history=HISTORY[:1], belief_summary=BELIEF)
+        yield f"{role}/last_words", "get_ai_last_words", dict(player_id="AI-3", role=role, game_context="現在是第 2 天，你被投票處決了。", speech_history=HISTORY)
+
+
+async def capture_prompts():
+    ai = AIManager(gateway_url="")
+    prompts = {}
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="1") as mock_gen:
+        for name, method, kwargs in cases():
+            await getattr(ai, method)(**kwargs)
+            prompts[name] = mock_gen.call_args.args[0]
+    return prompts
+
+
+@pytest.mark.asyncio
+async def test_prompts_match_golden_file():
+    with open(GOLDEN_FILE, encoding="utf-8") as f:
+        golden = json.load(f)
+    prompts = await capture_prompts()
+    assert prompts.keys() == golden.keys()
+    for name in golden:
+        assert prompts[name] == golden[name], f"prompt changed: {name}"
+
+
+def test_library_precompiles_every_role_phase_and_call_type():
+    # 行動 2 (夜晚/投票) + 發言 3 階段 x 2 發言位置 + 遺言 1
+    library = PromptLibrary(ROLE_STRATEGIES)
+    assert len(library) == len(ROLE_STRATEGIES) * (2 + len(PHASES) * 2 + 1)
+    template = prompt_library.speech_template("預言家", "mid", first_speaker=False)
+    assert template.slots == ("player_id", "game_context", "speaker_count", "history_text", "speech_length")
+    assert prompt_library.speech_template("預言家", "mid", first_speaker=False) is template
+
+
+def test_unknown_roles_compile_on_demand():
+    library = PromptLibrary()
+    assert len(library) == 0
+    template = library.last_words_template("路人")
+    assert "【路人】" in template.render(player_id=1, game_context="")
+    assert library.last_words_template("路人") is template
+
+
+def test_static_size_is_cached():
+    template = PromptTemplate("規則：{rule}\n局勢：{context}", {"rule": "不可說謊 ok"}, ("context",))
+    assert template.render(context="第 1 天") == "規則：不可說謊 ok\n局勢：第 1 天"
+    static = "規則：不可說謊 ok\n局勢："
+    assert template.static_bytes == len(static.encode("utf-8"))
+    assert template.static_tokens == estimate_tokens(static)
+    assert estimate_tokens("狼人殺") == 3
+    assert estimate_tokens("abcdefgh") == 2
+
+
+if __name__ == "__main__":
+    # 刻意修改提示詞後，以此重新產生 golden 檔
+    with open(GOLDEN_FILE, "w", encoding="utf-8") as f:
+        json.dump(asyncio.run(capture_prompts()), f, ensure_ascii=False, indent=1, sort_keys=True)
+    print(f"Wrote {GOLDEN_FILE}")
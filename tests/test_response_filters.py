@@ -0,0 +1,74 @@
+import sys
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_budget import AIBudget
+from ai_manager import AIManager
+from response_filters import ResponseFilter, fit_length
+
+CONTEXT = "現在是第 1 天白天。存活玩家: 9 人。"
+response_filter = ResponseFilter(2000)
+
+
+def test_clean_strips_markdown_prefix_and_length():
+    assert response_filter.clean("主持人：**夜幕低垂**，`月光`灑落。", "narrative") == "夜幕低垂，月光灑落。"
+    assert response_filter.clean("（3號）：我是好人。") == response_filter.clean("## 我是好人。") == "我是好人。"
+    assert fit_length("第一句。第二句很長很長很長。", 6) == "第一句。"
+    assert fit_length("一段沒有句號的很長的文字", 8) == "一段沒有句..."
+    assert len(response_filter.clean("好" * 500, "speech")) == 400
+
+
+def test_first_speaker_hallucination():
+    speech = "我是平民。前面幾位說得很好，我同意3號的說法。"
+    result = response_filter.check(speech, "speech", first_speaker=True, role="平民")
+    assert result.problems == ("hallucination",)
+    assert result.without_problems() == "我是平民。"
+    assert response_filter.check(speech, "speech", first_speaker=False, role="平民").ok
+
+
+def test_wolf_self_claim_is_a_role_leak():
+    assert response_filter.check("我是狼人，但我會帶大家贏。", "speech", role="狼王").problems == ("role_leak",)
+    assert response_filter.check("我的狼隊友已經出局了。", "last_words", role="狼人").problems == ("role_leak",)
+    # 假設語氣、否認或好人說的話都不算
+    assert response_filter.check("如果我是狼人，昨晚就不會這樣刀。我不是狼人。", "speech", role="狼人").ok
+    assert response_filter.check("我是預言家，3號是狼人。", "speech", role="白狼王").ok
+    assert response_filter.check("我是狼人？不可能。", "speech", role="平民").ok
+
+
+def test_narrative_must_not_name_roles_outside_the_event():
+    assert response_filter.check("預言家 {P1} 倒在血泊中。", "narrative", context="昨晚死亡的是：{P1}").problems == ("role_leak",)
+    assert response_filter.check("獵人 {P1} 扣下扳機。", "narrative", context="{P1} 是獵人，開槍帶走了 {P2}").ok
+    assert response_filter.check("狼人們悄悄睜開了眼。", "narrative", context="天黑請閉眼").ok
+
+
+@pytest.mark.asyncio
+async def test_rejected_speech_is_regenerated_once_with_low_effort():
+    ai = AIManager(gateway_url="")
+    responses = ["前面的玩家說得對，我跟票。", "我是第一個發言，目前沒有資訊，先聽後面的人怎麼說。"]
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, side_effect=responses) as mock_gen:
+        speech = await ai.get_ai_speech(1, "平民", CONTEXT)
+    assert speech == responses[1]
+    assert mock_gen.await_count == 2
+    retry = mock_gen.await_args_list[1]
+    assert retry.kwargs["reasoning_effort"] == "low"
+    assert "第一位發言者" in retry.args[0]
+
+    # 不用重新生成的回應只呼叫一次
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="**我是平民**，先聽後面的人。") as mock_gen:
+        assert await ai.get_ai_speech(1, "平民", CONTEXT) == "我是平民，先聽後面的人。"
+    assert mock_gen.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_tight_budget_drops_the_bad_sentence_instead_of_reasking():
+    ai = AIManager(gateway_url="")
+    budget = AIBudget(calls=10, tokens=0, seconds=0)
+    for _ in range(8):
+        budget.record("prompt", "response", 0.1)
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="我是狼人。但我不後悔。") as mock_gen:
+        assert await ai.get_ai_last_words("AI-1", "狼人", "你被投票處決了。", budget=budget) == "但我不後悔。"
+    assert mock_gen.await_count == 1
+    assert budget.degraded["reask"] == 1
@@ -0,0 +1,60 @@
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from role_beliefs import RoleBeliefTracker
+
+ROLE_POOL = ["狼人", "狼人", "預言家", "女巫", "平民", "平民"]
+SEATS = [1, 2, 3, 4, 5, 6]
+
+
+def assert_consistent(tracker):
+    assert np.allclose(tracker.probs.sum(axis=1), 1.0)
+    assert np.allclose(tracker.probs.sum(axis=0), tracker.role_counts, atol=0.05)
+
+
+def test_initial_uniform_with_observer_fixed():
+    tracker = RoleBeliefTracker(SEATS, ROLE_POOL, observer=1, observer_role="平民")
+    probs = tracker.wolf_probabilities()
+    assert probs[1] == 0.0
+    # 剩下 5 人分 2 隻狼
+    assert all(abs(probs[s] - 0.4) < 1e-6 for s in SEATS[1:])
+    assert_consistent(tracker)
+
+
+def test_wolf_knows_teammates():
+    tracker = RoleBeliefTracker(SEATS, ROLE_POOL, observer=1, observer_role="狼人")
+    tracker.observe_teammates([1, 4])
+    probs = tracker.wolf_probabilities()
+    assert probs[4] > 0.99
+    assert all(probs[s] < 1e-6 for s in (2, 3, 5, 6))
+    assert tracker.summary().startswith("狼隊友：4號")
+
+
+def test_seer_result_and_night_kill():
+    tracker = RoleBeliefTracker(SEATS, ROLE_POOL, observer=3, observer_role="預言家")
+    tracker.observe_seer_result(5, is_wolf=True)
+    assert tracker.wolf_probabilities()[5] > 0.99
+    assert tracker.top_suspects(1)[0][0] == 5
+
+    tracker.observe_deaths([2], night_kill=True)
+    assert tracker.wolf_probabilities()[2] < tracker.wolf_probabilities()[4]
+    assert 2 not in [s for s, _ in tracker.top_suspects(5)]
+    assert_consistent(tracker)
+
+
+def test_claim_and_votes():
+    tracker = RoleBeliefTracker(SEATS, ROLE_POOL, observer=1, observer_role="平民")
+    tracker.observe_claim(3, "預言家")
+    assert tracker.likely_role("預言家")[0] == 3
+
+    tracker.observe_seer_result(5, is_wolf=True) # 模擬已高度懷疑 5 號
+    before = tracker.wolf_probabilities()[2]
+    tracker.observe_votes({2: 5, 6: 3})
+    after = tracker.wolf_probabilities()
+    # 投給狼的人較不像狼，投給好人的人相對可疑
+    assert after[2] < before
+    assert after[2] < after[6]
+    assert_consistent(tracker)
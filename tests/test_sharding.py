@@ -0,0 +1,52 @@
+import sys
+import os
+import time
+import asyncio
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_manager import SQLiteRateLimiter
+from shard_launcher import build_env, plan_shards
+
+
+@pytest.mark.asyncio
+async def test_bucket_is_shared_between_limiters(tmp_path):
+    path = str(tmp_path / "rate.db")
+    # 兩個實例模擬兩個 bot 程序 (各自的連線，只透過 SQLite 檔共享狀態)
+    a = SQLiteRateLimiter(path, rate=10.0, capacity=1.0, key="gemini-api")
+    b = SQLiteRateLimiter(path, rate=10.0, capacity=1.0, key="gemini-api")
+
+    start = time.monotonic()
+    await asyncio.gather(a.acquire(), b.acquire(), a.acquire(), b.acquire())
+    elapsed = time.monotonic() - start
+
+    # 第一個令牌立即取得，其餘三個各需 0.1 秒補充
+    assert 0.25 < elapsed < 0.6
+
+
+@pytest.mark.asyncio
+async def test_buckets_are_keyed_by_provider(tmp_path):
+    path = str(tmp_path / "rate.db")
+    gemini = SQLiteRateLimiter(path, rate=0.1, capacity=1.0, key="gemini-api")
+    ollama = SQLiteRateLimiter(path, rate=0.1, capacity=1.0, key="ollama")
+
+    start = time.monotonic()
+    await gemini.acquire()
+    await ollama.acquire()
+    assert time.monotonic() - start < 0.5
+
+
+def test_plan_shards_round_robin():
+    assert plan_shards(2, 4) == [[0, 2], [1, 3]]
+    assert plan_shards(4, 2) == [[0], [1]]
+    assert plan_shards(1, 1) == [[0]]
+
+
+def test_build_env_offsets_metrics_port():
+    env = build_env(2, [2, 5], 6, base={"METRICS_PORT": "9108", "RATE_LIMIT_DB": "/tmp/x.db"})
+    assert env["SHARD_COUNT"] == "6"
+    assert env["SHARD_IDS"] == "2,5"
+    assert env["METRICS_PORT"] == "9110"
+    assert env["RATE_LIMIT_DB"] == "/tmp/x.db"
+    assert build_env(0, [0], 1, base={})["RATE_LIMIT_DB"].endswith("rate_limit.db")
@@ -0,0 +1,50 @@
+import sys
+import os
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from simulate_games import FakeLLM, build_template_list, percentile, simulate
+
+
+@pytest.mark.asyncio
+async def test_fake_llm_is_deterministic_and_scriptable():
+    prompt = "# 夜晚行動決策\n你可以選擇的目標（玩家編號）有：[1, 2, 3]。"
+    a = FakeLLM(seed=7, abstain_rate=0.0)
+    b = FakeLLM(seed=7, abstain_rate=0.0)
+    assert await a(prompt) == await b(prompt)
+    assert await a(prompt) in ("1", "2", "3")
+    assert a.calls["night_action"] == 2
+
+    scripted = FakeLLM(script=[("夜晚行動", "2")])
+    assert await scripted(prompt) == "2"
+
+
+def test_latency_distributions_and_percentile():
+    for dist in ("uniform", "exponential", "lognormal"):
+        llm = FakeLLM(seed=1, latency=dist, latency_mean=0.01)
+        samples = [llm.sample_latency() for _ in range(200)]
+        assert all(s >= 0 for s in samples)
+    with pytest.raises(ValueError):
+        FakeLLM(latency="bogus")
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([], 90) == 0.0
+
+
+def test_simulate_reports_throughput_latency_and_win_rates():
+    summary = simulate(games=4, workers=1, concurrency=4, template_sizes=[6], seed=3)
+    assert summary["games"] == 4
+    assert summary["games_per_min"] > 0
+    assert "phase:night" in summary["latency"]
+    assert "llm:vote" in summary["latency"]
+    assert set(summary["win_rates"]) == {name for name, _ in build_template_list([6])}
+
+
+def test_simulate_compares_effort_routing():
+    fixed = simulate(games=2, workers=1, concurrency=2, template_sizes=[6], seed=5, routing="fixed")
+    adaptive = simulate(games=2, workers=1, concurrency=2, template_sizes=[6], seed=5, routing="adaptive")
+    assert set(fixed["efforts"]) == {"high"}
+    assert adaptive["efforts"].get("low", 0) + adaptive["efforts"].get("medium", 0) > 0
+    assert 55 <= adaptive["iq"] <= 130
+    assert "vote_logic" in adaptive["scores"]
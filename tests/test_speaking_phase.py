@@ -97,7 +97,7 @@ class TestSpeakingPhase(unittest.IsolatedAsyncioTestCase):
         self.assertIn("等待發言結束", args)
 
         # Verify no vote recorded
-        self.assertNotIn(self.p2, self.game.votes)
+        self.assertTrue(self.game.vote_round is None or self.p2 not in self.game.vote_round.counts)
 
     async def test_vote_allowed_after_speaking(self):
         self.game.speaking_active = False
@@ -109,7 +109,7 @@ class TestSpeakingPhase(unittest.IsolatedAsyncioTestCase):
              await bot.vote.callback(self.ctx, target_id="2")
 
         # Verify vote recorded
-        self.assertIn(self.p2, self.game.votes)
+        self.assertIn(self.p2, self.game.vote_round.counts)
 
 if __name__ == "__main__":
     unittest.main()
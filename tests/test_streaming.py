@@ -0,0 +1,178 @@
+import sys
+import os
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+import bot
+from ai_budget import AIBudget
+from ai_manager import AIManager
+
+
+async def texts(*items):
+    for item in items:
+        yield item
+
+
+def streaming_session(status, lines):
+    response = AsyncMock(status=status, headers={})
+    response.content = texts(*lines)
+    response.text.return_value = "error"
+    ctx = MagicMock()
+    ctx.__aenter__ = AsyncMock(return_value=response)
+    ctx.__aexit__ = AsyncMock(return_value=None)
+    session = AsyncMock(closed=False)
+    session.post = MagicMock(return_value=ctx)
+    return session
+
+
+def ollama_manager(lines, status=200):
+    with patch.dict(os.environ, {'AI_PROVIDER': 'ollama'}):
+        ai = AIManager(gateway_url="")
+    ai.session = streaming_session(status, lines)
+    return ai
+
+
+@pytest.mark.asyncio
+async def test_stream_to_message_throttles_edits():
+    message = MagicMock(edit=AsyncMock())
+    target = MagicMock(send=AsyncMock(return_value=message))
+
+    with patch.object(bot, 'STREAM_EDIT_INTERVAL', 60):
+        text, sent = await bot.stream_to_message(target, texts("月", "月光", "月光灑落", "月光灑落。"), lambda t: f"> {t}")
+    assert (text, sent) == ("月光灑落。", message)
+    target.send.assert_awaited_once_with("> 月")
+    message.edit.assert_awaited_once_with(content="> 月光灑落。") # 中間的片段被節流，只補上最後全文
+
+    message.edit.reset_mock()
+    with patch.object(bot, 'STREAM_EDIT_INTERVAL', 0):
+        await bot.stream_to_message(target, texts("月", "月光", "月光灑落"), lambda t: t)
+    assert [c.kwargs["content"] for c in message.edit.await_args_list] == ["月光", "月光灑落"]
+
+
+@pytest.mark.asyncio
+async def test_stream_to_message_reads_everything_when_send_fails():
+    target = MagicMock(send=AsyncMock(side_effect=RuntimeError("Cannot send messages to this user")))
+    assert await bot.stream_to_message(target, texts("a", "ab", "abc"), str) == ("abc", None)
+    target.send.assert_awaited_once()
+    assert await bot.stream_to_message(target, texts(), str) == ("", None)
+
+
+@pytest.mark.asyncio
+async def test_announce_event_streams_online_and_offline():
+    bot.games = {}
+    game = bot.get_game(5151)
+    channel = MagicMock()
+    message = MagicMock(edit=AsyncMock())
+    channel.send = AsyncMock(return_value=message)
+
+    with patch.object(bot.ai_manager, 'stream_narrative', side_effect=lambda *a, **k: texts("夜幕", "夜幕低垂。")), \
+         patch.object(bot, 'STREAM_EDIT_INTERVAL', 0):
+        await bot.announce_event(channel, game, "天黑", "天黑請閉眼。")
+        channel.send.assert_awaited_once_with("🎙️ **夜幕**\n\n(天黑請閉眼。)")
+        message.edit.assert_awaited_once_with(content="🎙️ **夜幕低垂。**\n\n(天黑請閉眼。)")
+
+        # 線下模式: 旁白串流私訊給主持人，頻道只留提示
+        channel.send.reset_mock()
+        game.game_mode = "offline"
+        dm = MagicMock(edit=AsyncMock())
+        game.creator = MagicMock(send=AsyncMock(return_value=dm), spec=["send", "name"])
+        game.creator.name = "Host"
+        await bot.announce_event(channel, game, "天黑", "天黑請閉眼。")
+    assert "> 夜幕\n" in game.creator.send.await_args.args[0]
+    assert "> 夜幕低垂。\n" in dm.edit.await_args.kwargs["content"]
+    channel.send.assert_awaited_once_with("*(已發送台詞給主持人 Host)*")
+
+    # 沒有旁白 (只用快取且未命中) 時仍私訊系統訊息給主持人
+    game.creator.send.reset_mock()
+    with patch.object(bot.ai_manager, 'stream_narrative', side_effect=lambda *a, **k: texts()):
+        await bot.announce_event(channel, game, "天黑", "天黑請閉眼。")
+    assert "> 天黑請閉眼。" in game.creator.send.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_ollama_stream_yields_chunks_and_records_budget():
+    lines = [json.dumps({"response": "月光", "done": False}).encode() + b"\n",
+             b"\n",
+             json.dumps({"response": "灑落。", "done": False}).encode() + b"\n",
+             json.dumps({"response": "", "done": True}).encode() + b"\n"]
+    ai = ollama_manager(lines)
+    budget = AIBudget(calls=10, tokens=0, seconds=0)
+
+    chunks = [chunk async for chunk in ai.stream_response("prompt", call_type="narrative", budget=budget)]
+    assert chunks == ["月光", "灑落。"]
+    assert ai.session.post.call_args.kwargs["json"]["stream"] is True
+    assert budget.calls == 1 and ai.is_idle()
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_gemini_stream_parses_sse_events():
+    def event(text):
+        return b"data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode() + b"\r\n"
+
+    with patch.dict(os.environ, {'AI_PROVIDER': 'gemini-api', 'GEMINI_API_KEY': 'fake-key'}):
+        ai = AIManager(gateway_url="")
+    ai.rate_limiter.acquire = AsyncMock()
+    ai.session = streaming_session(200, [event("我是"), b"\r\n", event("好人。")])
+
+    assert [chunk async for chunk in ai._stream_text("prompt", call_type="last_words")] == ["我是", "我是好人。"]
+    assert ai.session.post.call_args.args[0].endswith(":streamGenerateContent?alt=sse")
+    ai.rate_limiter.acquire.assert_awaited_once()
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_to_generate_response_before_first_chunk():
+    ai = ollama_manager([], status=503)
+    with patch.object(ai, 'generate_response', new_callable=AsyncMock, return_value="重試成功") as fallback:
+        assert [chunk async for chunk in ai.stream_response("prompt")] == ["重試成功"]
+    fallback.assert_awaited_once()
+
+    # 沒有原生串流的後端整段產出一次
+    ai.set_backend(AsyncMock(return_value="整段"))
+    assert [chunk async for chunk in ai.stream_response("prompt")] == ["整段"]
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_stream_narrative_caches_the_finished_text():
+    ai = ollama_manager([json.dumps({"response": r}).encode() for r in ("{P1} ", "倒下了。")])
+    ai.narrative_cache.clear()
+
+    streamed = [t async for t in ai.stream_narrative("天亮", "昨晚死亡的是：**Alice**", names=["Alice"])]
+    assert streamed == ["Alice", "Alice 倒下了。"]
+    assert ai.session.post.call_count == 1
+
+    # 快取命中時整段產出一次，並代回本次的玩家名稱
+    assert [t async for t in ai.stream_narrative("天亮", "昨晚死亡的是：**Bob**", names=["Bob"])] == ["Bob 倒下了。"]
+    assert ai.session.post.call_count == 1
+    with patch.object(ai, 'generate_response', side_effect=aiohttp.ClientError):
+        assert [t async for t in ai.stream_narrative("天黑", "天黑請閉眼。", cached_only=True)] == []
+    await ai.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_stream_is_replaced_and_not_cached():
+    ai = ollama_manager([json.dumps({"response": r}).encode() for r in ("預言家 ", "{P1} 倒在血泊中。")])
+    ai.narrative_cache.clear()
+    budget = AIBudget(calls=10, tokens=0, seconds=0)
+    for _ in range(8):
+        budget.record("prompt", "response", 0.1) # 預算吃緊：不重新生成，直接刪掉有問題的句子
+
+    streamed = [t async for t in ai.stream_narrative("天亮", "昨晚死亡的是：**Alice**", names=["Alice"], budget=budget)]
+    assert streamed[-1] == "" # 整段作廢
+    assert not ai.narrative_cache
+    await ai.close()
+
+    # 已顯示的旁白改回系統訊息
+    message = MagicMock(edit=AsyncMock())
+    channel = MagicMock(send=AsyncMock(return_value=message))
+    with patch.object(bot.ai_manager, 'stream_narrative', side_effect=lambda *a, **k: texts(*streamed)), \
+         patch.object(bot, 'STREAM_EDIT_INTERVAL', 60):
+        await bot.announce_event(channel, bot.GameState(), "天亮", "昨晚死亡的是：**Alice**")
+    channel.send.assert_awaited_once_with("🎙️ **預言家**\n\n(昨晚死亡的是：**Alice**)")
+    message.edit.assert_awaited_once_with(content="📢 昨晚死亡的是：**Alice**")
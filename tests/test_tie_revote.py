@@ -27,8 +27,8 @@ class TestTieVoting(unittest.IsolatedAsyncioTestCase):
         game.players = [p1, p2]
 
         # Simulate a tie
-        game.votes = {p1: 1, p2: 1}
-        game.voted_players = {p1, p2}
+        game.open_vote_round().cast(p1, p2)
+        game.vote_round.cast(p2, p1)
 
         # Patch perform_ai_voting to verify it gets called
         # Use AsyncMock, which when called returns an awaitable (coroutine-like)
@@ -45,8 +45,8 @@ class TestTieVoting(unittest.IsolatedAsyncioTestCase):
             self.assertIn("請重新投票", msg)
 
             # Assert votes are cleared
-            self.assertEqual(game.votes, {})
-            self.assertEqual(game.voted_players, set())
+            self.assertIsNone(game.vote_round)
+            self.assertEqual(game.vote_history[-1].leaders, [p2, p1])
 
             # Assert perform_ai_voting was called
             mock_perform_ai_voting.assert_called_once_with(channel, game)
@@ -0,0 +1,68 @@
+import sys
+import os
+import json
+import asyncio
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracing import Tracer, _union_length
+
+TRACE_TEST_FILE = "test_traces.jsonl"
+
+
+def test_union_length_counts_overlap_once():
+    assert _union_length([(0, 2), (1, 3), (5, 6)]) == 4
+    assert _union_length([]) == 0
+
+
+@pytest.mark.asyncio
+async def test_child_spans_inherit_game_across_tasks():
+    tracer = Tracer()
+
+    async def role_task():
+        with tracer.span("llm.generate", "llm"):
+            await asyncio.sleep(0.02)
+
+    with tracer.span("perform_night", game=1):
+        # 並發的兩個 LLM 呼叫只算一次實際佔用時間
+        await asyncio.gather(asyncio.create_task(role_task()), asyncio.create_task(role_task()))
+        await tracer.sleep(0.01, "sleep.delay")
+
+    spans = tracer.spans(1)
+    assert {s.name for s in spans} == {"perform_night", "llm.generate", "sleep.delay"}
+    assert all(s.parent == "perform_night" for s in spans if s.name != "perform_night")
+
+    summary = tracer.summary(1)
+    assert summary["categories"]["llm"] < 0.035
+    assert summary["categories"]["sleep"] >= 0.01
+    assert summary["phases"]["perform_night"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_open_span_and_finish_game_exports_jsonl():
+    tracer = Tracer()
+    tracer.open_span(7, "human.speech_turn", "human", player="Alice")
+    await asyncio.sleep(0.01)
+    tracer.close_span(7, "human.speech_turn")
+    with pytest.raises(ValueError):
+        with tracer.span("resolve_votes", game=7):
+            raise ValueError("boom")
+
+    try:
+        await tracer.finish_game(7, path=TRACE_TEST_FILE)
+        with open(TRACE_TEST_FILE, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        assert [r["name"] for r in rows] == ["human.speech_turn", "resolve_votes"]
+        assert rows[1]["attrs"]["error"] == "ValueError"
+        assert tracer.spans(7) == []
+    finally:
+        if os.path.exists(TRACE_TEST_FILE):
+            os.remove(TRACE_TEST_FILE)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer(enabled=False)
+    with tracer.span("perform_night", game=1) as span:
+        assert span is None
+    assert tracer.spans(1) == []
@@ -0,0 +1,128 @@
+import sys
+import os
+import random
+import pytest
+from collections import Counter
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from game_objects import VoteRound
+
+
+def test_leader_and_tie_follow_each_ballot():
+    vote_round = VoteRound(range(1, 6))
+    vote_round.cast(1, "A")
+    assert vote_round.leaders == ["A"] and vote_round.top == 1 and not vote_round.tied
+    vote_round.cast(2, "B")
+    assert vote_round.leaders == ["A", "B"] and vote_round.tied
+    vote_round.cast(3, "B")
+    vote_round.cast(4, None)
+    assert vote_round.leaders == ["B"] and vote_round.top == 2
+    assert vote_round.counts == {"A": 1, "B": 2}
+    assert not vote_round.complete
+    vote_round.cast(5, "A")
+    assert vote_round.complete and vote_round.leaders == ["B", "A"]
+
+
+def test_changing_a_vote_moves_the_leader():
+    vote_round = VoteRound("abc")
+    vote_round.cast("a", "X")
+    vote_round.cast("b", "X")
+    assert vote_round.cast("b", "Y") is True # 改票
+    assert vote_round.leaders == ["X", "Y"] and vote_round.top == 1
+    vote_round.cast("a", None)
+    vote_round.cast("b", None)
+    assert vote_round.leaders == [] and vote_round.top == 0 and vote_round.counts == {}
+    assert vote_round.ballots == {"a": None, "b": None}
+    assert len(vote_round.ballots) == 2 and len(vote_round.log) == 5
+
+    vote_round.close()
+    with pytest.raises(ValueError):
+        vote_round.cast("c", "X")
+    with pytest.raises(ValueError):
+        VoteRound("ab").cast("z", "X")
+
+
+def test_replay_matches_a_recount():
+    rng = random.Random(7)
+    voters = list(range(12))
+    vote_round = VoteRound(voters)
+    for _ in range(200):
+        vote_round.cast(rng.choice(voters), rng.choice([None, *"ABCD"]))
+
+    counts = Counter(t for t in vote_round.ballots.values() if t is not None)
+    assert vote_round.counts == dict(counts)
+    assert vote_round.top == max(counts.values(), default=0)
+    assert set(vote_round.leaders) == {t for t, c in counts.items() if c == vote_round.top}
+
+    replayed = VoteRound.replay(vote_round.log, voters)
+    assert (replayed.ballots, replayed.counts, replayed.leaders) == (vote_round.ballots, vote_round.counts, vote_round.leaders)
+
+
+@pytest.mark.asyncio
+async def test_vote_command_allows_changes_before_everyone_voted():
+    guild_id = 778001
+    game = bot.get_game(guild_id)
+    game.reset()
+    players = [MagicMock(bot=False, mention=f"<@{i}>") for i in range(1, 4)]
+    game.players = players
+    game.player_ids = {i: p for i, p in enumerate(players, 1)}
+    game.player_id_map = {p: i for i, p in game.player_ids.items()}
+    game.game_active = True
+
+    def interaction(user):
+        it = MagicMock(guild_id=guild_id, user=user)
+        it.response.send_message = AsyncMock()
+        return it
+
+    with patch('bot.resolve_votes', new_callable=AsyncMock) as mock_resolve:
+        await bot.vote.callback(interaction(players[0]), "2")
+        changed = interaction(players[0])
+        await bot.vote.callback(changed, "3")
+        changed.response.send_message.assert_awaited_once_with("<@1> 改投 <@3>。")
+        await bot.vote.callback(interaction(players[1]), "3")
+        mock_resolve.assert_not_awaited()
+        await bot.vote.callback(interaction(players[2]), "no")
+        mock_resolve.assert_awaited_once()
+
+    assert game.vote_round.counts == {players[2]: 2}
+    assert game.vote_round.ballots == {players[0]: players[2], players[1]: players[2], players[2]: None}
+
+
+def test_withdrawn_voter_leaves_the_electorate():
+    vote_round = VoteRound("abc")
+    vote_round.cast("a", "X")
+    vote_round.cast("b", "X")
+    vote_round.withdraw("b") # 投過票的人死亡：選票作廢
+    assert vote_round.counts == {"X": 1} and not vote_round.complete
+    vote_round.withdraw("c") # 還沒投票的人死亡：其餘的人都投完了
+    assert vote_round.complete
+    replayed = VoteRound.replay(vote_round.log, "abc")
+    assert (replayed.electorate, replayed.counts) == ({"a"}, {"X": 1})
+
+
+@pytest.mark.asyncio
+async def test_die_on_a_non_voter_resolves_the_round():
+    guild_id = 778002
+    game = bot.get_game(guild_id)
+    game.reset()
+    players = [MagicMock(bot=False, mention=f"<@{i}>") for i in range(1, 4)]
+    for i, p in enumerate(players, 1):
+        p.name = f"P{i}"
+    game.players = list(players)
+    game.player_ids = {i: p for i, p in enumerate(players, 1)}
+    game.game_active = True
+    async with game.lock:
+        game.open_vote_round().cast(players[0], players[1])
+        game.vote_round.cast(players[1], players[0])
+
+    die = MagicMock(guild_id=guild_id)
+    die.user.guild_permissions.administrator = True
+    die.response.send_message = AsyncMock()
+    with patch('bot.resolve_votes', new_callable=AsyncMock) as mock_resolve, \
+         patch('bot.check_game_over', new_callable=AsyncMock):
+        await bot.die.callback(die, "3")
+    assert players[2] not in game.players
+    mock_resolve.assert_awaited_once_with(die.channel, game)
@@ -98,8 +98,8 @@ async def test_win_condition_good_wins(mock_ctx, reset_bot_state):
         p2: "平民"
     }
     game.game_active = True
-    game.votes = {p1: 2} # Both vote for wolf
-    game.voted_players = {p1, p2}
+    for voter in (p1, p2): # Both vote for wolf
+        game.open_vote_round().cast(voter, p1)
 
     # Call resolve_votes with GAME object
     await bot.resolve_votes(mock_ctx, game)
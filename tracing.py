@@ -0,0 +1,217 @@
+# tracing.py
+# 輕量的追蹤 span：記錄遊戲流程中每個階段的耗時與分類 (LLM / Discord API / 人為延遲 / 等待真人)，
+# 可匯出為 JSON lines，並在每局結束時彙整成關鍵路徑分析。
+
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# span 分類 (internal 為純流程容器，不列入關鍵路徑)
+CATEGORIES = ("llm", "rate_limit", "discord", "sleep", "human")
+INTERNAL = "internal"
+MAX_SPANS_PER_GAME = 5000
+TRACE_FILE = os.getenv('TRACE_FILE', '') # 設定後於每局結束時以 JSON lines 附加匯出
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    game: Optional[str]
+    start: float
+    end: Optional[float] = None
+    parent: Optional[str] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["duration"] = self.duration
+        return data
+
+
+def _union_length(intervals: List[Tuple[float, float]]) -> float:
+    """區間聯集的總長度 (同時進行的 span 不重複計算)"""
+    total = 0.0
+    current_start, current_end = None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+def current_span_name() -> Optional[str]:
+    """目前協程所在的 span 名稱 (用於 Lock 持有者歸因)"""
+    span = _current_span.get()
+    return span.name if span else None
+
+
+class Tracer:
+    """
+    以 contextvars 追蹤目前的 span，子 span (包含 create_task 建立的任務) 會繼承父 span 的遊戲 ID。
+    每局的 span 存於有上限的 deque 中，結束時輸出摘要後清除。
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._spans: Dict[str, Deque[Span]] = {}
+        self._open: Dict[Tuple[str, str], Span] = {}
+        self._active: Dict[int, Span] = {} # 尚未結束的 with-span
+
+    def _record(self, span: Span):
+        if span.game is None:
+            return
+        spans = self._spans.get(span.game)
+        if spans is None:
+            spans = self._spans[span.game] = deque(maxlen=MAX_SPANS_PER_GAME)
+        spans.append(span)
+
+    def _new_span(self, name: str, category: str, game: Any, attrs: Dict[str, Any]) -> Span:
+        parent = _current_span.get()
+        if game is None and parent is not None:
+            game = parent.game
+        return Span(
+            name=name, category=category,
+            game=str(game) if game is not None else None,
+            start=time.time(), parent=parent.name if parent else None, attrs=attrs,
+        )
+
+    @contextmanager
+    def span(self, name: str, category: str = INTERNAL, game: Any = None, **attrs) -> Iterator[Optional[Span]]:
+        """在 with 區塊內記錄一個 span (可用於 async 函式中)"""
+        if not self.enabled:
+            yield None
+            return
+        span = self._new_span(name, category, game, attrs)
+        token = _current_span.set(span)
+        self._active[id(span)] = span
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            self._active.pop(id(span), None)
+            _current_span.reset(token)
+            self._record(span)
+
+    async def sleep(self, seconds: float, name: str = "sleep"):
+        """記錄為人為延遲的 asyncio.sleep"""
+        with self.span(name, "sleep", seconds=round(seconds, 3)):
+            await asyncio.sleep(seconds)
+
+    def open_span(self, game: Any, name: str, category: str = INTERNAL, **attrs):
+        """開始一個跨越多個指令的 span (例如等待真人發言，直到 /done)"""
+        if not self.enabled:
+            return
+        self.close_span(game, name)
+        self._open[(str(game), name)] = self._new_span(name, category, game, attrs)
+
+    def close_span(self, game: Any, name: str):
+        span = self._open.pop((str(game), name), None)
+        if span:
+            span.end = time.time()
+            self._record(span)
+
+    def spans_between(self, start: float, end: float) -> List[Span]:
+        """與時間區間 [start, end] 重疊的 span (包含尚未結束的)，用於事件迴圈卡頓歸因"""
+        result = [s for s in list(self._active.values()) + list(self._open.values()) if s.start <= end]
+        for spans in list(self._spans.values()):
+            for span in reversed(spans):
+                if span.end is not None and span.end < start:
+                    break
+                if span.start <= end:
+                    result.append(span)
+        return result
+
+    def spans(self, game: Any) -> List[Span]:
+        return list(self._spans.get(str(game), ()))
+
+    def summary(self, game: Any) -> Dict[str, Any]:
+        """
+        關鍵路徑分析：各分類 span 的實際佔用時間 (同時進行的部分只算一次)，
+        以及各流程 span 的累計耗時。
+        """
+        spans = [s for s in self.spans(game) if s.end is not None]
+        if not spans:
+            return {"wall": 0.0, "categories": {}, "phases": {}}
+
+        wall = max(s.end for s in spans) - min(s.start for s in spans)
+        categories = {}
+        for category in CATEGORIES:
+            intervals = [(s.start, s.end) for s in spans if s.category == category]
+            if intervals:
+                categories[category] = _union_length(intervals)
+        covered = _union_length([(s.start, s.end) for s in spans if s.category in CATEGORIES])
+        categories["other"] = max(wall - covered, 0.0)
+
+        phases: Dict[str, Dict[str, float]] = {}
+        for s in spans:
+            if s.category == INTERNAL:
+                stats = phases.setdefault(s.name, {"count": 0, "total": 0.0, "max": 0.0})
+                stats["count"] += 1
+                stats["total"] += s.duration
+                stats["max"] = max(stats["max"], s.duration)
+        return {"wall": wall, "categories": categories, "phases": phases}
+
+    def format_summary(self, game: Any) -> str:
+        summary = self.summary(game)
+        wall = summary["wall"]
+        if not wall:
+            return "No trace data."
+        lines = [f"Trace summary for game {game}: wall {wall:.1f}s"]
+        for category, seconds in sorted(summary["categories"].items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {category:<10} {seconds:8.1f}s ({seconds / wall:.0%})")
+        for name, stats in sorted(summary["phases"].items(), key=lambda kv: -kv[1]["total"]):
+            lines.append(f"  [{name}] x{stats['count']} total {stats['total']:.1f}s max {stats['max']:.1f}s")
+        return "\n".join(lines)
+
+    def export_jsonl(self, game: Any, path: str):
+        """以 JSON lines 附加匯出某局的所有 span (同步 I/O，請在 executor 中執行)"""
+        with open(path, "a", encoding="utf-8") as f:
+            for span in self.spans(game):
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+    async def finish_game(self, game: Any, path: Optional[str] = None):
+        """記錄摘要、匯出 (若有設定 TRACE_FILE) 並清除該局的 span"""
+        if not self.enabled:
+            return
+        for key in [k for k in self._open if k[0] == str(game)]:
+            self.close_span(game, key[1])
+        logger.info(self.format_summary(game))
+        path = path if path is not None else TRACE_FILE
+        if path:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.export_jsonl, game, path)
+            except OSError as e:
+                logger.error(f"Failed to export trace: {e}")
+        self.clear(game)
+
+    def clear(self, game: Any):
+        self._spans.pop(str(game), None)
+        for key in [k for k in self._open if k[0] == str(game)]:
+            del self._open[key]
+
+# Global instance
+tracer = Tracer(enabled=os.getenv('TRACING', 'true').lower() in ('1', 'true', 'yes'))